@@ -1,18 +1,38 @@
 import collections
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import vtk
 
+from Atlas_Paths import dataset_root, grey_file, label_file
+from Label_Index import load_label_index
+from Memory_Usage import current_rss, format_memory, peak_rss, reset_peak_rss
+from Performance_HUD import FrameTimeHUD
+from Render_Report import RenderReportToggle
+from Thread_Settings import apply_thread_settings, process_pool
+from Tissue_Picker import TissuePicker
+from Tissue_Scene import polydata_from_bytes, polydata_to_bytes
+from Translucency import TranslucencyManager
+
 # Define the main function which sets up and renders the visualization
-def main(tissues, flying_edges, decimate):
+def main(tissues, flying_edges, decimate, hud=False, perf_log=None, workers=os.cpu_count(), root=None, lean=False,
+         translucency='peeling', min_fragment_size=None):
+    # Threads of the VTK filters, see Thread_Settings.py.
+    apply_thread_settings()
+
     colors = vtk.vtkNamedColors()
 
     # File paths for the grayscale CT and the labeled tissue segmentation
-    head_fn= r'./head-neck-2016-09/grayscale/Osirix-Manix-255-res.nrrd'
-    head_tissue_fn= r'./head-neck-2016-09/labels/HN-Atlas-labels.nrrd'
+    root = dataset_root(root)
+    head_fn= grey_file(root)
+    head_tissue_fn= label_file(root)
 
     # Retrieve tissue parameters and select the specified tissues for visualization
     available_tissues = tissue_parameters()
     selected_tissues = {key: available_tissues[key] for key in tissues}
+    if min_fragment_size is not None:
+        selected_tissues = {key: dict(v, MIN_FRAGMENT_SIZE=min_fragment_size) for key, v in selected_tissues.items()}
     if not selected_tissues:
         print('No tissues!')
         return
@@ -28,6 +48,18 @@ def main(tissues, flying_edges, decimate):
         print('Some required parameters are missing!')
         return
 
+    # The tissue meshes are built by background processes, started before the
+    # window so that they do not inherit its OpenGL context. The label index is
+    # loaded first, so the workers do not all build it. With no workers the
+    # meshes are built here, before the window opens.
+    executor = None
+    pending = dict()
+    if workers:
+        load_label_index(str(head_tissue_fn))
+        executor = process_pool(workers)
+        for name, tissue in selected_tissues.items():
+            pending[name] = executor.submit(build_tissue_mesh, head_fn, head_tissue_fn, tissue, flying_edges, decimate, lean)
+
     # Setup render window, renderer, and interactor.
     renderer = vtk.vtkRenderer()
     render_window = vtk.vtkRenderWindow()
@@ -37,10 +69,25 @@ def main(tissues, flying_edges, decimate):
 
     lut = create_head_lut(colors)
 
-    for name, tissue in selected_tissues.items():
-        print('Tissue: {:>9s}, label: {:2d}'.format(name, tissue['TISSUE']))
-        actor = create_head_actor(head_fn, head_tissue_fn, tissue, flying_edges, decimate, lut)
-        renderer.AddActor(actor)
+    # The outline of the label volume frames the view until the tissues arrive.
+    # It only needs the header, the voxels are read once the window is open.
+    label_reader = vtk.vtkNrrdReader()
+    label_reader.SetFileName(str(head_tissue_fn))
+    label_reader.UpdateInformation()
+    renderer.AddActor(create_outline_actor(label_reader, colors))
+
+    actors = dict()
+    if not workers:
+        run_peak = 0
+        for name, tissue in selected_tissues.items():
+            reset_peak_rss()
+            actor = create_head_actor(head_fn, head_tissue_fn, tissue, flying_edges, decimate, lut, lean)
+            renderer.AddActor(actor)
+            actors[name] = actor
+            run_peak = max(run_peak, peak_rss())
+            print('Tissue: {:>9s}, label: {:2d}, peak memory: {:s}'.format(
+                name, tissue['TISSUE'], format_memory(peak_rss())))
+        print('Peak memory: {:s}, {:s} after building'.format(format_memory(run_peak), format_memory(current_rss())))
 
     # Initial view (looking down on the dorsal surface).
     renderer.GetActiveCamera().Roll(-90)
@@ -66,12 +113,239 @@ def main(tissues, flying_edges, decimate):
     widget.SetEnabled(1)
     widget.InteractiveOn()
 
+    # Press 'm' to show the render cost of every tissue.
+    RenderReportToggle(render_window, renderer, actors).attach(render_window_interactor)
+
+    # Hover over a tissue to see its name, shift + click prints it. Points that
+    # are not on a tissue mesh are looked up in the label volume.
+    picker = TissuePicker(render_window, renderer)
+    for name, actor in actors.items():
+        picker.add_tissue(actor, name, selected_tissues[name]['TISSUE'])
+    picker.attach(render_window_interactor)
+
+    # The label volume is read by a background thread while the meshes are built.
+    labels = ThreadPoolExecutor(max_workers=1).submit(label_reader.Update)
+    def set_label_volume():
+        picker.set_label_volume(label_reader.GetOutput(), slice_order_transform())
+    if not pending:
+        labels.result()
+        set_label_volume()
+
+    # Tissues at opacity 0 are not drawn, the translucent ones get a translucent
+    # pass of capped cost; 'g' times it. Tissues that arrive later are
+    # added to the groups too.
+    TranslucencyManager(render_window, renderer, actors, translucency).attach(render_window_interactor)
+
+    if hud or perf_log:
+        FrameTimeHUD(render_window, renderer, perf_log, hud).attach(render_window_interactor)
+
+    # Every finished tissue is added to the scene while the user interacts.
+    render_window_interactor.Initialize()
+    if pending:
+        pending['labels'] = labels
+        progress = TissueProgress(render_window, renderer, len(pending) - 1)
+        progress.attach(render_window_interactor, pending, selected_tissues, lut, actors, picker, set_label_volume)
+
     # Final rendering and start the interaction loop
     render_window.Render()
     render_window_interactor.Start()
 
+    if executor:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# Polls the background mesh builds from an interactor timer and adds every
+# finished tissue to the renderer, showing the progress in the bottom right.
+# The 'labels' job reads the label volume, on_labels() is called when it is done.
+class TissueProgress:
+    def __init__(self, render_window, renderer, total):
+        self.render_window = render_window
+        self.renderer = renderer
+        self.total = total
+        self.done = 0
+        self.peak = 0
+
+        self.text = vtk.vtkTextActor()
+        self.text.GetTextProperty().SetFontSize(16)
+        self.text.GetTextProperty().SetColor(0, 0, 0)
+        self.text.GetTextProperty().SetJustificationToRight()
+        self.text.GetPositionCoordinate().SetCoordinateSystemToNormalizedViewport()
+        self.text.SetPosition(0.99, 0.01)
+        self.text.SetInput('Building tissues 0/{:d}'.format(total))
+        renderer.AddViewProp(self.text)
+
+    def attach(self, interactor, pending, tissues, lut, actors, picker, on_labels, interval=100):
+        self.pending = pending
+        self.on_labels = on_labels
+        self.tissues = tissues
+        self.lut = lut
+        self.actors = actors
+        self.picker = picker
+        interactor.AddObserver('TimerEvent', self.on_timer)
+        self.timer = interactor.CreateRepeatingTimer(interval)
+
+    def on_timer(self, caller, ev):
+        finished = [name for name, future in self.pending.items() if future.done()]
+        if not finished:
+            return
+
+        for name in finished:
+            future = self.pending.pop(name)
+            if name == 'labels':
+                self.on_labels()
+                continue
+            tissue = self.tissues[name]
+            self.done += 1
+            if future.exception():
+                print('Tissue: {:>9s} failed: {}'.format(name, future.exception()))
+                continue
+            mesh, peak = future.result()
+            self.peak = max(self.peak, peak)
+            print('Tissue: {:>9s}, label: {:2d}, peak memory: {:s}'.format(name, tissue['TISSUE'], format_memory(peak)))
+            actor = create_tissue_actor(polydata_from_bytes(mesh), tissue, self.lut)
+            self.renderer.AddActor(actor)
+            self.actors[name] = actor
+            self.picker.add_tissue(actor, name, tissue['TISSUE'])
+
+        if any(name != 'labels' for name in self.pending):
+            self.text.SetInput('Building tissues {:d}/{:d}'.format(self.done, self.total))
+        elif self.text.GetVisibility():
+            self.text.VisibilityOff()
+            print('Peak memory: {:s} per tissue build, {:s} in the viewer'.format(
+                format_memory(self.peak), format_memory(peak_rss())))
+        if not self.pending:
+            caller.DestroyTimer(self.timer)
+        self.render_window.Render()
+
+# Function to create the outline of a volume, placed like the tissue meshes.
+# The bounds come from the pipeline information, the volume is not read.
+def create_outline_actor(reader, colors):
+    info = reader.GetOutputInformation(0)
+    extent = info.Get(vtk.vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT())
+    spacing = info.Get(vtk.vtkDataObject.SPACING())
+    origin = info.Get(vtk.vtkDataObject.ORIGIN())
+
+    outline = vtk.vtkOutlineSource()
+    outline.SetBounds([origin[i // 2] + extent[i] * spacing[i // 2] for i in range(6)])
+
+    tf = vtk.vtkTransformPolyDataFilter()
+    tf.SetInputConnection(outline.GetOutputPort())
+    tf.SetTransform(slice_order_transform())
+
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputConnection(tf.GetOutputPort())
+
+    actor = vtk.vtkActor()
+    actor.SetMapper(mapper)
+    actor.GetProperty().SetColor(colors.GetColor3d('Black'))
+    return actor
+
+# Builds the stripped mesh of one tissue in a worker process, returned as a
+# binary legacy VTK file together with the peak memory of the worker during the build.
+def build_tissue_mesh(head_fn, head_tissue_fn, tissue, flying_edges, decimate, lean=False):
+    reset_peak_rss()
+    normals = create_tissue_mesh(head_fn, head_tissue_fn, tissue, flying_edges, decimate, lean)
+
+    stripper = vtk.vtkStripper()
+    stripper.SetInputConnection(normals.GetOutputPort())
+    stripper.Update()
+    return polydata_to_bytes(stripper.GetOutput()), peak_rss()
+
 # Function to create an actor for the head visualization
-def create_head_actor(head_fn, head_tissue_fn, tissue, flying_edges, decimate, lut):
+def create_head_actor(head_fn, head_tissue_fn, tissue, flying_edges, decimate, lut, lean=False):
+    normals = create_tissue_mesh(head_fn, head_tissue_fn, tissue, flying_edges, decimate, lean)
+
+    # Create triangle strips for efficient rendering
+    stripper = vtk.vtkStripper()
+    stripper.SetInputConnection(normals.GetOutputPort())
+    stripper.Update()
+
+    return create_tissue_actor(stripper.GetOutput(), tissue, lut)
+
+# Function to create the actor of a finished tissue mesh
+def create_tissue_actor(mesh, tissue, lut):
+    # Map the data to geometry
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputData(mesh)
+
+    # Create an actor for the tissue with properties such as color and opacity
+    actor = vtk.vtkActor()
+    actor.SetMapper(mapper)
+    actor.GetProperty().SetOpacity(tissue['OPACITY'])
+    actor.GetProperty().SetDiffuseColor(lut.GetTableValue(tissue['TISSUE'])[:3])
+    actor.GetProperty().SetSpecular(0.5)
+    actor.GetProperty().SetSpecularPower(10)
+
+    return actor
+
+# Function to build the triangle mesh (with normals) of one tissue. The returned
+# filter is also what the exporters write, so the geometry matches the viewer.
+# With lean set, every filter frees its output once the next one has read it,
+# so the output of the returned filter can only be consumed once.
+def create_tissue_mesh(head_fn, head_tissue_fn, tissue, flying_edges, decimate, lean=False):
+    last_connection = create_iso_surface(head_fn, head_tissue_fn, tissue, flying_edges, lean)
+
+    # Optionally drop the small disconnected fragments before the costly stages
+    if tissue['MIN_FRAGMENT_SIZE'] > 0:
+        last_connection = create_fragment_filter(last_connection, tissue)
+
+    # Optionally decimate the mesh to reduce complexity
+    if decimate:
+        decimator = create_decimator(tissue)
+        decimator.SetInputConnection(last_connection.GetOutputPort())
+        last_connection = decimator
+
+    # Smooth the mesh with a windowed sinc filter
+    smoother = create_smoother(tissue)
+    smoother.SetInputConnection(last_connection.GetOutputPort())
+    if lean:
+        release_data_upstream(smoother)
+    smoother.Update()
+
+    # Compute normals for better lighting effects
+    normals = vtk.vtkPolyDataNormals()
+    normals.SetInputConnection(smoother.GetOutputPort())
+    normals.SetFeatureAngle(tissue['FEATURE_ANGLE'])
+    if lean:
+        normals.ReleaseDataFlagOn()
+
+    return normals
+
+# Function to remove the disconnected pieces of an iso-surface that have fewer
+# than tissue['MIN_FRAGMENT_SIZE'] triangles, like the islands left by label
+# noise and the tails of the Gaussian. The connectivity filter runs once to
+# measure the regions and again to extract the large ones.
+def create_fragment_filter(last_connection, tissue):
+    connectivity = vtk.vtkPolyDataConnectivityFilter()
+    connectivity.SetInputConnection(last_connection.GetOutputPort())
+    connectivity.SetExtractionModeToAllRegions()
+    connectivity.Update()
+    triangles = connectivity.GetOutput().GetNumberOfCells()
+
+    sizes = connectivity.GetRegionSizes()
+    connectivity.SetExtractionModeToSpecifiedRegions()
+    removed = 0
+    for region in range(connectivity.GetNumberOfExtractedRegions()):
+        if sizes.GetValue(region) >= tissue['MIN_FRAGMENT_SIZE']:
+            connectivity.AddSpecifiedRegion(region)
+        else:
+            removed += 1
+    connectivity.Update()
+
+    print('Tissue: {:>9s}, removed {:d} of {:d} fragments, {:d} of {:d} triangles'.format(
+        tissue['NAME'], removed, connectivity.GetNumberOfExtractedRegions(),
+        triangles - connectivity.GetOutput().GetNumberOfCells(), triangles))
+    return connectivity
+
+# Function to let every filter of a linear pipeline free its output as soon as
+# the filter downstream has consumed it.
+def release_data_upstream(algorithm):
+    while algorithm is not None:
+        algorithm.ReleaseDataFlagOn()
+        has_input = algorithm.GetNumberOfInputPorts() and algorithm.GetNumberOfInputConnections(0)
+        algorithm = algorithm.GetInputAlgorithm() if has_input else None
+
+# Function to extract the raw iso-surface of one tissue in the viewer orientation.
+def create_iso_surface(head_fn, head_tissue_fn, tissue, flying_edges, lean=False):
 
     # Choose the file based on whether the tissue is the skull or not
     if tissue['NAME'] == 'skull':
@@ -81,16 +355,31 @@ def create_head_actor(head_fn, head_tissue_fn, tissue, flying_edges, decimate, l
 
     reader = vtk.vtkNrrdReader()
     reader.SetFileName(str(fn))
-    reader.Update()
+    # Only the header is read here. The voxels are read when the pipeline runs,
+    # and only the part of the volume the tissue is cropped to.
+    reader.UpdateInformation()
+    whole_extent = reader.GetOutputInformation(0).Get(vtk.vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT())
 
     last_connection = reader
 
-    # If not processing the skull, threshold the image to select the tissue
+    # If not processing the skull, crop the image to the tissue (using the label
+    # index stored next to the label volume) and threshold it to select the tissue
     if not tissue['NAME'] == 'skull':
+        extent = crop_extent(load_label_index(str(fn)), tissue, whole_extent)
+        if extent is not None:
+            voi = vtk.vtkExtractVOI()
+            voi.SetInputConnection(last_connection.GetOutputPort())
+            voi.SetVOI(*extent)
+            last_connection = voi
+
         select_tissue = vtk.vtkImageThreshold()
         select_tissue.ThresholdBetween(tissue['TISSUE'], tissue['TISSUE'])
         select_tissue.SetInValue(255)
         select_tissue.SetOutValue(0)
+        # The mask, and the shrunk and smoothed volumes made from it, hold 0 .. 255
+        # and are kept as bytes whatever the type the labels are stored in.
+        if tissue['COMPACT_TYPES']:
+            select_tissue.SetOutputScalarTypeToUnsignedChar()
         select_tissue.SetInputConnection(last_connection.GetOutputPort())
         last_connection = select_tissue
 
@@ -109,6 +398,10 @@ def create_head_actor(head_fn, head_tissue_fn, tissue, flying_edges, decimate, l
         gaussian.SetInputConnection(shrinker.GetOutputPort())
         last_connection = gaussian
 
+    # The volumes are freed once the iso-surface has been extracted.
+    if lean:
+        release_data_upstream(last_connection)
+
     # Create an isosurface using either flying edges or marching cubes
     iso_value = tissue['VALUE']
     if flying_edges:
@@ -129,65 +422,96 @@ def create_head_actor(head_fn, head_tissue_fn, tissue, flying_edges, decimate, l
         iso_surface.Update()
 
     # Apply a transform to correct for the slice order
+    tf = vtk.vtkTransformPolyDataFilter()
+    tf.SetTransform(slice_order_transform())
+    tf.SetInputConnection(iso_surface.GetOutputPort())
+
+    return tf
+
+# Function to create the transform from the image coordinates of the volumes
+# to the orientation the tissues are shown in.
+def slice_order_transform():
     so = SliceOrder()
     transform = so.get('hfap')
     transform.Scale(1, -1, 1)
-    tf = vtk.vtkTransformPolyDataFilter()
-    tf.SetTransform(transform)
-    tf.SetInputConnection(iso_surface.GetOutputPort())
-    last_connection = tf
-    
-    # Optionally decimate the mesh to reduce complexity
-    if decimate:
+    return transform
+
+# Function to compute the extent the tissue pipeline can be cropped to: the
+# bounding box of the label, grown by the reach of the Gaussian kernel and
+# aligned to the shrink factors, so the iso-surface is the same as without
+# cropping. Returns None if the label is not in the volume.
+def crop_extent(index, tissue, whole_extent):
+    extent = index.extent(tissue['TISSUE'])
+    if extent is None:
+        return None
+
+    res = []
+    for a in range(3):
+        rate = tissue['SAMPLE_RATE'][a]
+        radius = tissue['GAUSSIAN_STANDARD_DEVIATION'][a] * tissue['GAUSSIAN_RADIUS_FACTORS'][a]
+        margin = (int(math.ceil(radius)) + 2) * rate
+        lo = max(whole_extent[2 * a], whole_extent[2 * a] + extent[2 * a] - margin)
+        lo -= (lo - whole_extent[2 * a]) % rate
+        hi = min(whole_extent[2 * a + 1], whole_extent[2 * a] + extent[2 * a + 1] + margin)
+        # The shrinker drops a partial cell at the end, the kernel would then
+        # reach the end of the cropped volume one sample earlier.
+        hi = min(whole_extent[2 * a + 1], lo + -(-(hi - lo + 1) // rate) * rate - 1)
+        res += [lo, hi]
+    return res
+
+# Function to create the windowed sinc smoothing filter selected by
+# tissue['SMOOTH_ENGINE'], with SMOOTH_ITERATIONS and SMOOTH_FACTOR.
+#   sinc   - vtkWindowedSincPolyDataFilter.
+#   sparse - the same filter as sparse matrix products over the mesh Laplacian
+#            (see Sparse_Smoothing.py, needs scipy).
+def create_smoother(tissue):
+    engine = tissue['SMOOTH_ENGINE']
+    if engine == 'sinc':
+        smoother = vtk.vtkWindowedSincPolyDataFilter()
+        smoother.SetNumberOfIterations(tissue['SMOOTH_ITERATIONS'])
+        smoother.BoundarySmoothingOff()
+        smoother.FeatureEdgeSmoothingOff()
+        smoother.SetFeatureAngle(tissue['SMOOTH_ANGLE'])
+        smoother.SetPassBand(tissue['SMOOTH_FACTOR'])
+        smoother.NonManifoldSmoothingOn()
+        smoother.NormalizeCoordinatesOff()
+    elif engine == 'sparse':
+        from Sparse_Smoothing import SparseSmoothingFilter
+        smoother = SparseSmoothingFilter(tissue['SMOOTH_ITERATIONS'], tissue['SMOOTH_FACTOR'])
+    else:
+        s = 'No such smoothing engine "{:s}" exists.'.format(engine)
+        raise Exception(s)
+    return smoother
+
+# Function to create the decimation filter selected by tissue['DECIMATE_ENGINE'].
+#   pro        - vtkDecimatePro, topology preserving, the most faithful but slowest.
+#   quadric    - vtkQuadricDecimation, edge collapse driven by the quadric error,
+#                reliably reaches DECIMATE_REDUCTION.
+#   clustering - vtkQuadricClustering, vertex clustering on a DECIMATE_DIVISIONS
+#                grid. Very fast, meant for previews.
+def create_decimator(tissue):
+    engine = tissue['DECIMATE_ENGINE']
+    if engine == 'pro':
         decimator = vtk.vtkDecimatePro()
-        decimator.SetInputConnection(last_connection.GetOutputPort())
         decimator.SetFeatureAngle(tissue['DECIMATE_ANGLE'])
         decimator.MaximumIterations = tissue['DECIMATE_ITERATIONS']
         decimator.PreserveTopologyOn()
         decimator.SetErrorIsAbsolute(1)
         decimator.SetAbsoluteError(tissue['DECIMATE_ERROR'])
         decimator.SetTargetReduction(tissue['DECIMATE_REDUCTION'])
-        last_connection = decimator
-
-    # Smooth the mesh with a windowed sinc filter
-    smoother = vtk.vtkWindowedSincPolyDataFilter()
-    smoother.SetInputConnection(last_connection.GetOutputPort())
-    smoother.SetNumberOfIterations(tissue['SMOOTH_ITERATIONS'])
-    smoother.BoundarySmoothingOff()
-    smoother.FeatureEdgeSmoothingOff()
-    smoother.SetFeatureAngle(tissue['SMOOTH_ANGLE'])
-    smoother.SetPassBand(tissue['SMOOTH_FACTOR'])
-    smoother.NonManifoldSmoothingOn()
-    smoother.NormalizeCoordinatesOff()
-    smoother.Update()
-
-    # Compute normals for better lighting effects
-    normals = vtk.vtkPolyDataNormals()
-    normals.SetInputConnection(smoother.GetOutputPort())
-    normals.SetFeatureAngle(tissue['FEATURE_ANGLE'])
-
-    # Create triangle strips for efficient rendering
-    stripper = vtk.vtkStripper()
-    stripper.SetInputConnection(normals.GetOutputPort())
-
-    # Map the data to geometry
-    mapper = vtk.vtkPolyDataMapper()
-    mapper.SetInputConnection(stripper.GetOutputPort())
-
-    # Create iso-surface
-    contour = vtk.vtkContourFilter()
-    contour.SetInputConnection(reader.GetOutputPort())
-    contour.SetValue(0, iso_value)
-
-    # Create an actor for the tissue with properties such as color and opacity
-    actor = vtk.vtkActor()
-    actor.SetMapper(mapper)
-    actor.GetProperty().SetOpacity(tissue['OPACITY'])
-    actor.GetProperty().SetDiffuseColor(lut.GetTableValue(tissue['TISSUE'])[:3])
-    actor.GetProperty().SetSpecular(0.5)
-    actor.GetProperty().SetSpecularPower(10)
-
-    return actor
+    elif engine == 'quadric':
+        decimator = vtk.vtkQuadricDecimation()
+        decimator.SetTargetReduction(tissue['DECIMATE_REDUCTION'])
+        decimator.VolumePreservationOn()
+    elif engine == 'clustering':
+        decimator = vtk.vtkQuadricClustering()
+        decimator.SetNumberOfDivisions(*tissue['DECIMATE_DIVISIONS'])
+        decimator.AutoAdjustNumberOfDivisionsOn()
+        decimator.CopyCellDataOff()
+    else:
+        s = 'No such decimation engine "{:s}" exists.'.format(engine)
+        raise Exception(s)
+    return decimator
 
 # The remaining code defines specific tissue characteristics and parameters
 # used in the visualization, such as tissue name, label, and visual properties.
@@ -373,14 +697,21 @@ def default_parameters():
     p['SMOOTH_ANGLE'] = 60
     p['SMOOTH_ITERATIONS'] = 20
     p['SMOOTH_FACTOR'] = 0.001
+    p['SMOOTH_ENGINE'] = 'sinc'
     p['DECIMATE_ITERATIONS'] = 1
     p['DECIMATE_REDUCTION'] = 1
     p['DECIMATE_ERROR'] = 0.0002
     p['DECIMATE_ERROR_INCREMENT'] = 0.0002
+    p['DECIMATE_ENGINE'] = 'pro'
+    p['DECIMATE_DIVISIONS'] = [64, 64, 64]
     p['GAUSSIAN_STANDARD_DEVIATION'] = [1, 1, 1]
     p['GAUSSIAN_RADIUS_FACTORS'] = [1, 1, 1]
     p['SAMPLE_RATE'] = [1, 1, 1]
     p['OPACITY'] = 1.0
+    # Disconnected pieces of the iso-surface with fewer triangles are dropped, 0 keeps all.
+    p['MIN_FRAGMENT_SIZE'] = 0
+    # Keep the tissue mask and the volumes made from it as bytes, see Compact_Labels.py.
+    p['COMPACT_TYPES'] = True
     return p
 
 def hyoid():
@@ -574,6 +905,28 @@ if __name__ == '__main__':
     # Enable flying edges and decimation options
     flying_edges=True
     decimate=0
-    
+
+    # Show the frame-time overlay ('h' toggles it) and log every frame to a CSV file.
+    hud = False
+    perf_log = None     # e.g. 'perf_log.csv'
+
+    # Processes building the tissue meshes while the window is already open,
+    # 0 builds them all before the window opens.
+    workers = os.cpu_count()
+
+    # Free the intermediate images and meshes of every tissue as soon as the
+    # next filter has read them, to lower the peak memory of the builds.
+    lean = False
+
+    # Technique for the translucent tissues, 'peeling' or 'sort' (see Translucency.py).
+    translucency = 'peeling'
+
+    # Drop the pieces of the iso-surfaces with fewer triangles than this (e.g.
+    # 200), None keeps MIN_FRAGMENT_SIZE of tissue_parameters().
+    min_fragment_size = None
+
+    # Atlas folder, the first argument or MDV_DATASET_ROOT if given.
+    root = sys.argv[1] if len(sys.argv) > 1 else None
+
     # Call the main function to start the visualization
-    main(tissues, flying_edges, decimate)
\ No newline at end of file
+    main(tissues, flying_edges, decimate, hud, perf_log, workers, root, lean, translucency, min_fragment_size)
\ No newline at end of file
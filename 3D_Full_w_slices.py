@@ -2,13 +2,12 @@ import vtk
 import os
 import pandas as pd
 import random
+import sys
 
-def load_data(file_path):
-    reader = vtk.vtkNrrdReader()
-    reader.SetFileName(file_path)
-    reader.Update()
-
-    return reader
+from Atlas_Paths import dataset_root, grey_file, label_file
+from Performance_HUD import FrameTimeHUD
+from Thread_Settings import apply_thread_settings
+from Volume_Pyramid import ProgressiveLoader
 
 def create_outline(reader):
     outline = vtk.vtkOutlineFilter()
@@ -67,11 +66,11 @@ def create_lookup_table():
 
     return lut
 
-def create_mesh_from_segmentation(reader):
+def create_mesh_from_segmentation(image):
     marching_cubes = vtk.vtkDiscreteMarchingCubes()
-    marching_cubes.SetInputConnection(reader.GetOutputPort())
+    marching_cubes.SetInputData(image)
     
-    scalar_range = reader.GetOutput().GetScalarRange()
+    scalar_range = image.GetScalarRange()
     min_label = int(scalar_range[0])
     max_label = int(scalar_range[1])
     
@@ -105,10 +104,51 @@ def color_mesh(mesh, lut):
     
     return mesh_actor
 
-def main():
+# Uses the plane widgets as clipping planes of the mesh mappers. The mapper
+# clips while drawing, so moving a plane costs one render and the mesh itself
+# is never recomputed. Press 'c' to switch the clipping on and off.
+class PlaneClipping:
+    def __init__(self, mappers, plane_widgets, enabled=False):
+        self.mappers = mappers
+        self.plane_widgets = plane_widgets
+        self.planes = [vtk.vtkPlane() for _ in plane_widgets]
+        for plane_widget in plane_widgets:
+            plane_widget.AddObserver('InteractionEvent', self.update)
+        self.update()
+        self.set_enabled(enabled)
+
+    # Keeps every plane on its widget, the mesh on the side of the normal is kept.
+    def update(self, caller=None, ev=None):
+        for plane_widget, plane in zip(self.plane_widgets, self.planes):
+            plane.SetOrigin(plane_widget.GetOrigin())
+            plane.SetNormal(plane_widget.GetNormal())
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        for mapper in self.mappers:
+            mapper.RemoveAllClippingPlanes()
+            if enabled:
+                for plane in self.planes:
+                    mapper.AddClippingPlane(plane)
+
+    def attach(self, interactor, key='c'):
+        self.key = key
+        interactor.AddObserver('KeyPressEvent', self.on_key)
+
+    def on_key(self, caller, ev):
+        if caller.GetKeySym() == self.key:
+            self.update()
+            self.set_enabled(not self.enabled)
+            caller.GetRenderWindow().Render()
+
+def main(hud=False, perf_log=None, progressive=True, clip=False, root=None):
+    # Threads of the VTK filters, see Thread_Settings.py.
+    apply_thread_settings()
+
     # File paths for the grayscale and segmentation data
-    grayscale_file_path = r'./head-neck-2016-09/grayscale/Osirix-Manix-255-res.nrrd'
-    segmentation_file_path = r'./head-neck-2016-09/labels/HN-Atlas-labels.nrrd'
+    root = dataset_root(root)
+    grayscale_file_path = grey_file(root)
+    segmentation_file_path = label_file(root)
     
     # Create a renderer, render window, and interactor
     renderer = vtk.vtkRenderer()
@@ -117,11 +157,12 @@ def main():
     render_window_interactor = vtk.vtkRenderWindowInteractor()
     render_window_interactor.SetRenderWindow(render_window)
     
-    # Load the grayscale data
-    grayscale_reader = load_data(grayscale_file_path)
-    
-    # Load the segmentation data
-    segmentation_reader = load_data(segmentation_file_path)
+    # Load the grayscale and segmentation data. With a pyramid (see Volume_Pyramid.py)
+    # the coarsest level is shown first; the finer levels, and their meshes, are
+    # prepared in the background.
+    volumes = ProgressiveLoader([grayscale_file_path, segmentation_file_path], progressive,
+                                lambda images: create_mesh_from_segmentation(images[1]))
+    grayscale_reader = volumes.producers[0]
     
     # Create the outline of the data
     outline_actor = create_outline(grayscale_reader)
@@ -131,7 +172,7 @@ def main():
     lut = create_lookup_table()
     
     # Get the extent of the grayscale data to position the planes correctly
-    extent = grayscale_reader.GetOutput().GetExtent()
+    extent = volumes.image(0).GetExtent()
     x_middle = int((extent[0] + extent[1]) / 2)
     y_middle = int((extent[2] + extent[3]) / 2)
     z_middle = int((extent[4] + extent[5]) / 2)
@@ -140,6 +181,7 @@ def main():
     colors = vtk.vtkImageMapToColors()
     colors.SetLookupTable(lut)
     colors.SetInputConnection(grayscale_reader.GetOutputPort())
+    colors.Update()
 
     plane_widget_x = vtk.vtkImagePlaneWidget()
     plane_widget_x.SetInteractor(render_window_interactor)
@@ -166,12 +208,7 @@ def main():
     plane_widget_z.On()
     
     # Create mesh from segmentation and color it
-    mesh = create_mesh_from_segmentation(segmentation_reader)
-    mesh_actor = color_mesh(mesh, lut)
-    renderer.AddActor(mesh_actor)
-
-    # Create mesh from segmentation and color it
-    mesh = create_mesh_from_segmentation(segmentation_reader)
+    mesh = create_mesh_from_segmentation(volumes.image(1))
     mesh_actor = color_mesh(mesh, lut)
     renderer.AddActor(mesh_actor)
     
@@ -181,10 +218,44 @@ def main():
     # Set background color to black
     renderer.SetBackground(0, 0, 0)
     
+    if hud or perf_log:
+        frame_hud = FrameTimeHUD(render_window, renderer, perf_log, hud)
+        frame_hud.attach(render_window_interactor)
+        for plane_widget in (plane_widget_x, plane_widget_y, plane_widget_z):
+            frame_hud.watch(plane_widget, 'plane move')
+
+    # The planes can cut away the mesh to show its inside ('c' toggles it).
+    clipping = PlaneClipping([mesh_actor.GetMapper()], [plane_widget_x, plane_widget_y, plane_widget_z], clip)
+    clipping.attach(render_window_interactor)
+
+    # Swap in the mesh of the finer level and keep the planes where they are.
+    def on_level(factor, mesh):
+        mesh_actor.GetMapper().SetInputData(mesh)
+        for plane_widget in (plane_widget_x, plane_widget_y, plane_widget_z):
+            position = plane_widget.GetSlicePosition()
+            plane_widget.UpdatePlacement()
+            plane_widget.SetSlicePosition(position)
+        clipping.update()
+
+    volumes.attach(render_window_interactor, render_window, on_level)
+
     # Render and start interaction
     render_window.Render()
     render_window_interactor.Initialize()
     render_window_interactor.Start()
 
 if __name__ == "__main__":
-    main()
+    # Show the frame-time overlay ('h' toggles it) and log every frame to a CSV file.
+    hud = False
+    perf_log = None     # e.g. 'perf_log.csv'
+
+    # Show the coarsest pyramid level first, if Volume_Pyramid.py has been run.
+    progressive = True
+
+    # Start with the slice planes clipping the mesh ('c' toggles it).
+    clip = False
+
+    # Atlas folder, the first argument or MDV_DATASET_ROOT if given.
+    root = sys.argv[1] if len(sys.argv) > 1 else None
+
+    main(hud, perf_log, progressive, clip, root)
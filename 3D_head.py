@@ -1,7 +1,17 @@
 from pathlib import Path
 import vtk
 
-def main(tissues):
+from Atlas_Paths import dataset_root, model_file
+from Performance_HUD import FrameTimeHUD
+from Render_Report import RenderReportToggle
+from Thread_Settings import apply_thread_settings
+from Tissue_Picker import TissuePicker
+from Translucency import TranslucencyManager
+
+def main(tissues, hud=False, perf_log=None, root=None, translucency='peeling'):
+    # Threads of the VTK filters, see Thread_Settings.py.
+    apply_thread_settings()
+
     colors = vtk.vtkNamedColors()
 
     # Setup render window, renderers, and interactor.
@@ -22,10 +32,11 @@ def main(tissues):
 
     # Create a mapping from tissue names to their properties.
     tm = create_tissue_map()
-    path = r'./head-neck-2016-09/models/'
+    root = dataset_root(root)
     lut = create_head_lut(colors)
 
-    # Dictionary to store slider widgets for each tissue.
+    # Dictionaries to store the actor and the slider widget of each tissue.
+    actors = dict()
     sliders = dict()
 
     # Define the position step size for the sliders.
@@ -36,7 +47,7 @@ def main(tissues):
     res = ['Using the following tissues:']
     for tissue in tissues:
         source = None
-        source = r'{}{}.vtk'.format(path,tissue)
+        source = model_file(root, tissue)
 
         actor = create_head_actor(str(source), tissue, tm[tissue][1])
         actor.GetProperty().SetOpacity(tm[tissue][2])
@@ -44,6 +55,7 @@ def main(tissues):
         actor.GetProperty().SetSpecular(0.2)
         actor.GetProperty().SetSpecularPower(10)
         ren_1.AddActor(actor)
+        actors[tissue] = actor
         res.append('{:>11s}, label: {:2d}'.format(tissue, tm[tissue][0]))
 
         slider_properties = SliderProperties()
@@ -95,10 +107,43 @@ def main(tissues):
     widget.SetEnabled(1)
     widget.InteractiveOn()
 
+    # Press 'm' to show the render cost of every tissue.
+    RenderReportToggle(render_window, ren_1, actors).attach(render_window_interactor)
+
+    # Hover over a tissue to see its name, shift + click prints it.
+    picker = TissuePicker(render_window, ren_1)
+    for tissue, actor in actors.items():
+        picker.add_tissue(actor, tissue, tm[tissue][0])
+    picker.attach(render_window_interactor)
+
+    # Tissues at opacity 0 are not drawn, the translucent ones get a translucent
+    # pass of capped cost; 'g' times it.
+    TranslucencyManager(render_window, ren_1, actors, translucency).attach(render_window_interactor)
+
+    if hud or perf_log:
+        frame_hud = FrameTimeHUD(render_window, ren_1, perf_log, hud)
+        frame_hud.attach(render_window_interactor)
+        for slider_widget in sliders.values():
+            frame_hud.watch(slider_widget, 'slider drag')
+
     render_window_interactor.Start()
 
 # Define a function to create the actor for each tissue model.
 def create_head_actor(file_name, tissue, transform):
+    normals = create_tissue_mesh(file_name, tissue, transform)
+
+    # Set up the mapper which maps the model data to graphics primitives.
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputConnection(normals.GetOutputPort())
+
+    actor = vtk.vtkActor()
+    actor.SetMapper(mapper)
+
+    return actor
+
+# Read one tissue model, orient it and compute its normals. The exporters use
+# the returned filter directly, so exported meshes match what the viewer shows.
+def create_tissue_mesh(file_name, tissue, transform):
     so = SliceOrder()
 
     reader = vtk.vtkPolyDataReader()
@@ -122,14 +167,7 @@ def create_head_actor(file_name, tissue, transform):
     normals.SetInputConnection(tf.GetOutputPort())
     normals.SetFeatureAngle(60.0)
 
-    # Set up the mapper which maps the model data to graphics primitives.
-    mapper = vtk.vtkPolyDataMapper()
-    mapper.SetInputConnection(normals.GetOutputPort())
-
-    actor = vtk.vtkActor()
-    actor.SetMapper(mapper)
-
-    return actor
+    return normals
 
 # SliceOrder class contains transformation matrices for different slice orders.
 # These transformations ensure the correct orientation of the model data.
@@ -449,6 +487,16 @@ if __name__ == '__main__':
               'Model_28_sternum','Model_31_rib1',
               'Model_32_rib2','Model_33_rib3',
               'Model_34_rib4','Model_35_rib5']
-    
+
+    # Show the frame-time overlay ('h' toggles it) and log every frame to a CSV file.
+    hud = False
+    perf_log = None     # e.g. 'perf_log.csv'
+
+    # Technique for the translucent tissues, 'peeling' or 'sort' (see Translucency.py).
+    translucency = 'peeling'
+
+    # Atlas folder, the first argument or MDV_DATASET_ROOT if given.
+    root = sys.argv[1] if len(sys.argv) > 1 else None
+
     # Call the main function to start the visualization process.
-    main(tissues)
+    main(tissues, hud, perf_log, root, translucency)
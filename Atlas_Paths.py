@@ -0,0 +1,20 @@
+import os
+
+# Locations of the atlas files. Every script reads the atlas from a dataset
+# root, by default the SPL Head and Neck Atlas next to the scripts. Another
+# root (e.g. one written by Synthetic_Atlas.py) is chosen with --root, as the
+# first argument of the viewers, or with the MDV_DATASET_ROOT environment variable.
+
+DEFAULT_ROOT = './head-neck-2016-09'
+
+def dataset_root(root=None):
+    return root or os.environ.get('MDV_DATASET_ROOT') or DEFAULT_ROOT
+
+def grey_file(root):
+    return os.path.join(root, 'grayscale', 'Osirix-Manix-255-res.nrrd')
+
+def label_file(root):
+    return os.path.join(root, 'labels', 'HN-Atlas-labels.nrrd')
+
+def model_file(root, name):
+    return os.path.join(root, 'models', '{}.vtk'.format(name))
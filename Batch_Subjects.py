@@ -0,0 +1,189 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from Atlas_Paths import grey_file, label_file
+from Export_Tissues import FORMATS, export_tissue
+from Label_Index import load_label_index
+from Thread_Settings import add_thread_arguments, apply_thread_settings, process_pool
+from Tissue_Scene import default_tissues, scene_parameters
+
+# Builds the tissue meshes of 3D_From_Slices.py for every subject in a folder:
+#
+#   subjects/<subject>/grayscale/Osirix-Manix-255-res.nrrd
+#   subjects/<subject>/labels/HN-Atlas-labels.nrrd
+#
+# Every (subject, tissue) pair is one job of a process pool and is written to
+# <output>/<subject>/<tissue>.<format> like Export_Tissues.py does. The label
+# index of a subject is built by one job before its tissues are scheduled.
+#
+# Every finished job is appended to <output>/manifest.jsonl with a key hashed
+# from the volumes and the build settings. An interrupted run started again
+# skips the jobs that are in the manifest with the same key and whose files
+# still exist, so it resumes where it stopped.
+
+MANIFEST = 'manifest.jsonl'
+
+def main(subjects_dir, output_dir, tissues, formats, flying_edges, decimate, lean, workers):
+    subjects = find_subjects(subjects_dir)
+    if not subjects:
+        print('No subjects with a label volume in {:s}'.format(subjects_dir))
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_file = os.path.join(output_dir, MANIFEST)
+    done = read_manifest(manifest_file)
+
+    # Jobs that are still to do, per subject.
+    todo = dict()
+    keys = dict()
+    for subject, root in subjects.items():
+        for name in tissues:
+            keys[subject, name] = job_key(root, name, formats, flying_edges, decimate)
+            entry = done.get((subject, name))
+            if entry and entry['key'] == keys[subject, name] and all(os.path.exists(f) for f in entry['files']):
+                continue
+            todo.setdefault(subject, []).append(name)
+
+    total = sum(len(names) for names in todo.values())
+    print('{:d} subjects, {:d} tissues: {:d} jobs to do, {:d} already done'.format(
+        len(subjects), len(tissues), total, len(subjects) * len(tissues) - total))
+    if not todo:
+        return
+
+    start = time.perf_counter()
+    finished = 0
+    failed = 0
+    # A subject is settled when all its jobs are, it is finished if none failed.
+    subjects_finished = 0
+    subjects_failed = 0
+    remaining = {subject: len(names) for subject, names in todo.items()}
+    subject_failed = set()
+
+    def settle(subject, jobs, ok):
+        nonlocal subjects_finished, subjects_failed
+        if not ok:
+            subject_failed.add(subject)
+        remaining[subject] -= jobs
+        if remaining[subject] == 0:
+            if subject in subject_failed:
+                subjects_failed += 1
+            else:
+                subjects_finished += 1
+
+    with process_pool(workers) as executor, \
+            open(manifest_file, 'a') as manifest:
+        pending = {executor.submit(prepare_subject, subjects[subject]): (subject, None) for subject in todo}
+        try:
+            while pending:
+                completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    subject, name = pending.pop(future)
+                    e = future.exception()
+                    if e:
+                        print('{:s} {:s} failed: {}'.format(subject, name or 'label index', e))
+                        print(''.join(traceback.format_exception(type(e), e, e.__traceback__)))
+                        jobs = len(todo[subject]) if name is None else 1
+                        failed += jobs
+                        settle(subject, jobs, False)
+                        continue
+
+                    # The label index is ready, schedule the tissues of the subject.
+                    if name is None:
+                        os.makedirs(os.path.join(output_dir, subject), exist_ok=True)
+                        for name in todo[subject]:
+                            job = ('slices', name, subjects[subject], flying_edges, decimate, formats,
+                                   os.path.join(output_dir, subject), False, lean)
+                            pending[executor.submit(export_tissue, job)] = (subject, name)
+                        continue
+
+                    rows = future.result()
+                    entry = {
+                        'subject': subject,
+                        'tissue': name,
+                        'key': keys[subject, name],
+                        'files': [row['file_name'] for row in rows],
+                        'triangles': rows[0]['triangles'],
+                        'build_time': rows[0]['build_time'],
+                    }
+                    manifest.write(json.dumps(entry) + '\n')
+                    manifest.flush()
+
+                    finished += 1
+                    settle(subject, 1, True)
+                    elapsed = time.perf_counter() - start
+                    print('[{:d}/{:d}] {:>20s} {:>15s} {:>8d} tris  build {:6.2f} s  {:6.1f} subjects/hour'.format(
+                        finished, total, subject, name, entry['triangles'], entry['build_time'],
+                        subjects_per_hour(finished, total, len(todo), elapsed)))
+        except KeyboardInterrupt:
+            print('Interrupted, {:d} of {:d} jobs are done. Run again to resume.'.format(finished, total))
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    elapsed = time.perf_counter() - start
+    print('{:d} subjects ({:d} jobs) in {:.1f} s, {:.1f} subjects/hour'.format(
+        subjects_finished, finished, elapsed, subjects_per_hour(finished, total, len(todo), elapsed)))
+    if failed:
+        print('{:d} jobs of {:d} subjects failed and are tried again by the next run.'.format(failed, subjects_failed))
+
+# Subject folders that contain a label volume, by name.
+def find_subjects(subjects_dir):
+    subjects = dict()
+    for name in sorted(os.listdir(subjects_dir)):
+        root = os.path.join(subjects_dir, name)
+        if os.path.isfile(label_file(root)):
+            subjects[name] = root
+    return subjects
+
+# Finished jobs by (subject, tissue). A line cut off by an interrupted run is skipped.
+def read_manifest(manifest_file):
+    done = dict()
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                done[entry['subject'], entry['tissue']] = entry
+    return done
+
+# The key changes with the volumes of the subject and the build settings.
+def job_key(root, name, formats, flying_edges, decimate):
+    settings = {
+        'volumes': [[os.path.getsize(f), os.path.getmtime(f)] for f in (grey_file(root), label_file(root))],
+        'parameters': scene_parameters('slices').get(name),
+        'formats': sorted(formats),
+        'flying_edges': flying_edges,
+        'decimate': decimate,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+def prepare_subject(root):
+    return len(load_label_index(label_file(root)).labels())
+
+# Throughput of this run, counting partly built subjects by their share of jobs.
+def subjects_per_hour(finished, total, subjects, elapsed):
+    if not elapsed:
+        return 0.0
+    return finished / total * subjects / elapsed * 3600
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the tissue meshes of every subject in a folder, resuming interrupted runs.')
+    parser.add_argument('subjects', help='Folder with one atlas folder per subject.')
+    parser.add_argument('tissues', nargs='*', help='Tissue names, all tissues by default.')
+    parser.add_argument('--output', default='./subjects_export')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=['glb'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--marching-cubes', action='store_true', help='Use marching cubes instead of flying edges.')
+    parser.add_argument('--decimate', action='store_true')
+    parser.add_argument('--lean', action='store_true', help='Free the intermediate data of every tissue build early.')
+    add_thread_arguments(parser)
+    args = parser.parse_args()
+    apply_thread_settings(args.threads, args.smp_backend)
+
+    main(args.subjects, args.output, args.tissues or default_tissues('slices'), args.formats,
+         not args.marching_cubes, args.decimate, args.lean, args.workers)
@@ -1,15 +1,39 @@
 from pathlib import Path
 import vtk
 
-def main():
+from Atlas_Paths import dataset_root, grey_file, label_file
+from Label_Index import load_label_index
+from Linked_Panes import LinkedPanes
+from Oblique_Reslice import ORIENTATIONS, ObliqueInteraction, ObliquePlane
+from Performance_HUD import FrameTimeHUD
+from Slice_Contours import SliceOutlines, create_slicers, load_meshes
+from Thread_Settings import apply_thread_settings
+from Tissue_Scene import default_tissues
+from Volume_IO import read_geometry
+from Volume_Pyramid import ProgressiveLoader, level_extent
+
+# Distance of the outlines in front of the slice, in view sizes.
+OUTLINE_OFFSET = 1e-3
+
+def main(overlay_alpha=0.5, hud=False, perf_log=None, progressive=True, root=None, oblique=False,
+         outlines=None):
+    # Threads of the VTK filters, see Thread_Settings.py.
+    apply_thread_settings()
+
     colors = vtk.vtkNamedColors()
 
-    fn_1= r'./head-neck-2016-09/grayscale/Osirix-Manix-255-res.nrrd'
-    fn_2= r'./head-neck-2016-09/labels/HN-Atlas-labels.nrrd'
+    root = dataset_root(root)
+    fn_1= grey_file(root)
+    fn_2= label_file(root)
+
+    # Tissue outlines cut from the meshes of 3D_From_Slices.py ('slices') or
+    # 3D_head.py ('models') replace the label colours, see Slice_Contours.py.
+    # The meshes are read from their cache, or built, before the window opens.
+    slicers = None
+    if outlines:
+        slicers = create_slicers(load_meshes(outlines, default_tissues(outlines), root))
+        overlay_alpha = 0.0
 
-    # SliceOrder class instance to manage image orientation.
-    so = SliceOrder()
-    
     # Create RenderWindow and Renderers for axial, sagittal, and coronal views.
     ren1 = vtk.vtkRenderer() #axial
     ren2 = vtk.vtkRenderer() #sagittal
@@ -24,284 +48,104 @@ def main():
     iren = vtk.vtkRenderWindowInteractor()
     iren.SetRenderWindow(ren_win)
 
-    # Read the grayscale data.
-    grey_reader = vtk.vtkNrrdReader()
-    grey_reader.SetFileName(str(fn_1))
-    grey_reader.Update()
+    # Read the grayscale and the segmented data. With a pyramid (see Volume_Pyramid.py)
+    # the coarsest level is shown first and the full resolution is read in the background.
+    volumes = ProgressiveLoader([fn_1, fn_2], progressive)
+    grey_reader = volumes.producers[0]
+    segment_reader = volumes.producers[1]
     
     # Set up a lookup table for window and level adjustment.
-    wllut = vtk.vtkWindowLevelLookupTable()
-    wllut.SetWindow(255)
-    wllut.SetLevel(128)
-    wllut.SetTableRange(-980,5144)
-    wllut.Build()
-    
-    #AXIAL
-    
-    aslice_number=int(input("Input slice number from 0 to 206 for axial plane: "))
-    
-    # Pad the grayscale data to the desired slice number.
-    agrey_padder = vtk.vtkImageConstantPad()
-    agrey_padder.SetInputConnection(grey_reader.GetOutputPort())
-    agrey_padder.SetOutputWholeExtent(0, 255, 0, 255, aslice_number, aslice_number)
-    agrey_padder.SetConstant(0)
-
-    # Create the plane source for axial view.
-    agrey_plane = vtk.vtkPlaneSource()
-
-    # Apply transformation to the axial plane.
-    agrey_transform = vtk.vtkTransformPolyDataFilter()
-    agrey_transform.SetTransform(so.get('hfsi'))
-    agrey_transform.SetInputConnection(agrey_plane.GetOutputPort())
-
-    # Compute normals for the axial plane.
-    agrey_normals = vtk.vtkPolyDataNormals()
-    agrey_normals.SetInputConnection(agrey_transform.GetOutputPort())
-    agrey_normals.FlipNormalsOff()
-
-    # Mapper for the axial plane.
-    agrey_mapper = vtk.vtkPolyDataMapper()
-    agrey_mapper.SetInputConnection(agrey_plane.GetOutputPort())
-
-    # Texture mapping for the axial plane.
-    agrey_texture = vtk.vtkTexture()
-    agrey_texture.SetInputConnection(agrey_padder.GetOutputPort())
-    agrey_texture.SetLookupTable(wllut)
-    agrey_texture.SetColorModeToMapScalars()
-    agrey_texture.InterpolateOn()
-
-    # Actor for the axial plane.
-    agrey_actor = vtk.vtkActor()
-    agrey_actor.SetMapper(agrey_mapper)
-    agrey_actor.SetTexture(agrey_texture)
-
-    # Read the segmented data.
-    segment_reader = vtk.vtkNrrdReader()
-    segment_reader.SetFileName(str(fn_2))
-    segment_reader.Update()
-
-    # ... (Similar setup for segmented data padding, plane source, transformation,
-    # normals, mapper, texture, and actor creation as for grayscale data)
-    asegment_padder = vtk.vtkImageConstantPad()
-    asegment_padder.SetInputConnection(segment_reader.GetOutputPort())
-    asegment_padder.SetOutputWholeExtent(0, 255, 0, 255, aslice_number, aslice_number)
-    asegment_padder.SetConstant(0)
-
-    asegment_plane = vtk.vtkPlaneSource()
-
-    asegment_transform = vtk.vtkTransformPolyDataFilter()
-    asegment_transform.SetTransform(so.get('hfsi'))
-    asegment_transform.SetInputConnection(asegment_plane.GetOutputPort())
-
-    asegment_normals = vtk.vtkPolyDataNormals()
-    asegment_normals.SetInputConnection(asegment_transform.GetOutputPort())
-    asegment_normals.FlipNormalsOn()
+    wllut = create_window_level_lut()
 
     lut = create_head_lut(colors)
 
-    asegment_mapper = vtk.vtkPolyDataMapper()
-    asegment_mapper.SetInputConnection(asegment_plane.GetOutputPort())
+    # Label index of the segmentation, to list the labels on every chosen slice.
+    index = load_label_index(str(fn_2))
 
-    asegment_texture = vtk.vtkTexture()
-    asegment_texture.SetInputConnection(asegment_padder.GetOutputPort())
-    asegment_texture.SetLookupTable(lut)
-    asegment_texture.SetColorModeToMapScalars()
-    asegment_texture.InterpolateOff()
-    
-    asegment_actor = vtk.vtkActor()
-    asegment_actor.SetMapper(asegment_mapper)
-    asegment_actor.SetTexture(asegment_texture)
-    
-    asegment_overlay_actor = vtk.vtkActor()
-    asegment_overlay_actor.SetMapper(asegment_mapper)
-    asegment_overlay_actor.SetTexture(asegment_texture)
+    # Slice numbers are voxels of the full resolution volume.
+    geometry = read_geometry(fn_1)
+    extent, spacing, origin = geometry
+    x0, x1, y0, y1, z0, z1 = extent
+
+    # The grayscale slice and its label overlay are blended into one texture. An
+    # oblique plane starts through the chosen slice, see Oblique_Reslice.py.
+    planes = dict()
+
+    def create_view(view_extent, orientation):
+        if oblique:
+            center = [origin[i] + 0.5 * (view_extent[2 * i] + view_extent[2 * i + 1]) * spacing[i] for i in range(3)]
+            planes[orientation] = ObliquePlane(geometry, orientation, center)
+            return planes[orientation].create_actor(grey_reader.GetOutputPort(), wllut, segment_reader.GetOutputPort(),
+                                                    lut, overlay_alpha, in_world=False)
+        return create_slice_actor(grey_reader, segment_reader,
+                                  level_extent(view_extent, volumes.factor, volumes.image().GetExtent()),
+                                  wllut, lut, overlay_alpha)
+
+    #AXIAL
+
+    aslice_number=int(input("Input slice number from {:d} to {:d} for axial plane: ".format(z0, z1)))
+    print_slice_labels(index, 'z', aslice_number)
+
+    a_extent = (x0, x1, y0, y1, aslice_number, aslice_number)
+    a_actor = create_view(a_extent, 'axial')
 
-    asegment_overlay_actor.GetProperty().SetOpacity(.5)
-    
     #SAGITTAL
 
 # Sagittal view setup.
 # ... (Similar setup for sagittal view as for axial view, with appropriate changes
 # to the slice number and orientation)
-    
-    sslice_number=int(input("Input slice number from 0 to 255 for sagittal plane: "))
+
+    sslice_number=int(input("Input slice number from {:d} to {:d} for sagittal plane: ".format(x0, x1)))
+    print_slice_labels(index, 'x', sslice_number)
 
     # Check if sp is 21 and ap is 37, print the special message.
     if aslice_number == 21 and sslice_number == 37:
         print("O Panie, to Ty na mnie spojrzałeś")
 
-    sgrey_padder = vtk.vtkImageConstantPad()
-    sgrey_padder.SetInputConnection(grey_reader.GetOutputPort())
-    sgrey_padder.SetOutputWholeExtent(sslice_number, sslice_number, 0, 255, 0, 206)
-    sgrey_padder.SetConstant(0)
-
-    sgrey_plane = vtk.vtkPlaneSource()
-
-    sgrey_transform = vtk.vtkTransformPolyDataFilter()
-    sgrey_transform.SetTransform(so.get('hfsi'))
-    sgrey_transform.SetInputConnection(sgrey_plane.GetOutputPort())
-
-    sgrey_normals = vtk.vtkPolyDataNormals()
-    sgrey_normals.SetInputConnection(sgrey_transform.GetOutputPort())
-    sgrey_normals.FlipNormalsOff()
-
-    sgrey_mapper = vtk.vtkPolyDataMapper()
-    sgrey_mapper.SetInputConnection(sgrey_plane.GetOutputPort())
-
-    sgrey_texture = vtk.vtkTexture()
-    sgrey_texture.SetInputConnection(sgrey_padder.GetOutputPort())
-    sgrey_texture.SetLookupTable(wllut)
-    sgrey_texture.SetColorModeToMapScalars()
-    sgrey_texture.InterpolateOn()
-
-    sgrey_actor = vtk.vtkActor()
-    sgrey_actor.SetMapper(sgrey_mapper)
-    sgrey_actor.SetTexture(sgrey_texture)
-
-    ssegment_padder = vtk.vtkImageConstantPad()
-    ssegment_padder.SetInputConnection(segment_reader.GetOutputPort())
-    ssegment_padder.SetOutputWholeExtent(sslice_number, sslice_number, 0, 255, 0, 206)
-    ssegment_padder.SetConstant(0)
-
-    ssegment_plane = vtk.vtkPlaneSource()
-
-    ssegment_transform = vtk.vtkTransformPolyDataFilter()
-    ssegment_transform.SetTransform(so.get('hfsi'))
-    ssegment_transform.SetInputConnection(ssegment_plane.GetOutputPort())
-
-    ssegment_normals = vtk.vtkPolyDataNormals()
-    ssegment_normals.SetInputConnection(ssegment_transform.GetOutputPort())
-    ssegment_normals.FlipNormalsOn()
-
-    ssegment_mapper = vtk.vtkPolyDataMapper()
-    ssegment_mapper.SetInputConnection(ssegment_plane.GetOutputPort())
-
-    ssegment_texture = vtk.vtkTexture()
-    ssegment_texture.SetInputConnection(ssegment_padder.GetOutputPort())
-    ssegment_texture.SetLookupTable(lut)
-    ssegment_texture.SetColorModeToMapScalars()
-    ssegment_texture.InterpolateOff()
-
-    ssegment_overlay_actor = vtk.vtkActor()
-    ssegment_overlay_actor.SetMapper(ssegment_mapper)
-    ssegment_overlay_actor.SetTexture(ssegment_texture)
+    s_extent = (sslice_number, sslice_number, y0, y1, z0, z1)
+    s_actor = create_view(s_extent, 'sagittal')
 
-    ssegment_overlay_actor.GetProperty().SetOpacity(.5)
-    
     #CORONAL
 
 # Coronal view setup.
 # ... (Similar setup for coronal view as for axial view, with appropriate changes
 # to the slice number and orientation)
 
-    cslice_number=int(input("Input slice from 0 to 255 for coronal plane: "))
-
-    cgrey_padder = vtk.vtkImageConstantPad()
-    cgrey_padder.SetInputConnection(grey_reader.GetOutputPort())
-    cgrey_padder.SetOutputWholeExtent(0, 255, cslice_number, cslice_number, 0, 206)
-    cgrey_padder.SetConstant(0)
-
-    cgrey_plane = vtk.vtkPlaneSource()
-
-    cgrey_transform = vtk.vtkTransformPolyDataFilter()
-    cgrey_transform.SetTransform(so.get('hfsi'))
-    cgrey_transform.SetInputConnection(cgrey_plane.GetOutputPort())
-
-    cgrey_normals = vtk.vtkPolyDataNormals()
-    cgrey_normals.SetInputConnection(cgrey_transform.GetOutputPort())
-    cgrey_normals.FlipNormalsOff()
-
-    cgrey_mapper = vtk.vtkPolyDataMapper()
-    cgrey_mapper.SetInputConnection(cgrey_plane.GetOutputPort())
-
-    cgrey_texture = vtk.vtkTexture()
-    cgrey_texture.SetInputConnection(cgrey_padder.GetOutputPort())
-    cgrey_texture.SetLookupTable(wllut)
-    cgrey_texture.SetColorModeToMapScalars()
-    cgrey_texture.InterpolateOn()
-    
-    cgrey_actor = vtk.vtkActor()
-    cgrey_actor.SetMapper(cgrey_mapper)
-    cgrey_actor.SetTexture(cgrey_texture)
-
-    csegment_padder = vtk.vtkImageConstantPad()
-    csegment_padder.SetInputConnection(segment_reader.GetOutputPort())
-    csegment_padder.SetOutputWholeExtent(0, 255, cslice_number, cslice_number, 0, 206)
-    csegment_padder.SetConstant(0)
+    cslice_number=int(input("Input slice from {:d} to {:d} for coronal plane: ".format(y0, y1)))
+    print_slice_labels(index, 'y', cslice_number)
 
-    csegment_plane = vtk.vtkPlaneSource()
+    c_extent = (x0, x1, cslice_number, cslice_number, z0, z1)
+    c_actor = create_view(c_extent, 'coronal')
 
-    csegment_transform = vtk.vtkTransformPolyDataFilter()
-    csegment_transform.SetTransform(so.get('hfsi'))
-    csegment_transform.SetInputConnection(csegment_plane.GetOutputPort())
-
-    csegment_normals = vtk.vtkPolyDataNormals()
-    csegment_normals.SetInputConnection(csegment_transform.GetOutputPort())
-    csegment_normals.FlipNormalsOn()
-
-    csegment_mapper = vtk.vtkPolyDataMapper()
-    csegment_mapper.SetInputConnection(csegment_plane.GetOutputPort())
-
-    csegment_texture = vtk.vtkTexture()
-    csegment_texture.SetInputConnection(csegment_padder.GetOutputPort())
-    csegment_texture.SetLookupTable(lut)
-    csegment_texture.SetColorModeToMapScalars()
-    csegment_texture.InterpolateOff()
-
-    csegment_overlay_actor = vtk.vtkActor()
-    csegment_overlay_actor.SetMapper(csegment_mapper)
-    csegment_overlay_actor.SetTexture(csegment_texture)
-
-    csegment_overlay_actor.GetProperty().SetOpacity(.5)
-    
-    # Set the background color and viewport for each renderer.
-    ren1.SetBackground(0, 0, 0)
+    # Set the viewport for each renderer.
     ren1.SetViewport(0, 0.5, 0.5, 1)
     ren_win.SetSize(1024,720)
-    ren1.AddActor(agrey_actor)
-    ren1.AddActor(asegment_overlay_actor)
-    asegment_overlay_actor.SetPosition(0, 0, -0.01)
-    
-    # Camera setup for axial view.
-    cam1 = vtk.vtkCamera()
-    cam1.SetViewUp(0, -1, 0)
-    cam1.SetPosition(0, 0, -1)
-    ren1.SetActiveCamera(cam1)
-    ren1.ResetCamera()
-    cam1.SetViewUp(0, -1, 0)
-    cam1.SetFocalPoint(0.0554068, -0.0596001, 0)
-    ren1.ResetCameraClippingRange()
-
-    ren2.SetBackground(0, 0, 0)
+    ren1.AddActor(a_actor)
+
     ren2.SetViewport(0.5, 0.5, 1, 1)
-    ren2.AddActor(cgrey_actor)
-    ren2.AddActor(csegment_overlay_actor)
-    csegment_overlay_actor.SetPosition(0, 0, -0.01)
-
-# ... (Similar camera setup for sagittal and coronal views)
-
-    cam2 = vtk.vtkCamera()
-    cam2.SetViewUp(0, -1, 0)
-    cam2.SetPosition(0, 0, -1)
-    ren2.SetActiveCamera(cam2)
-    ren2.ResetCamera()
-    cam2.SetViewUp(0, -1, 0)
-    cam2.SetFocalPoint(0.0554068, -0.0596001, 0)
-    ren2.ResetCameraClippingRange()
-
-    ren3.AddActor(sgrey_actor)
-    ren3.AddActor(ssegment_overlay_actor)
-    ssegment_overlay_actor.SetPosition(0, 0, -0.01)
-    
-    cam3 = vtk.vtkCamera()
-    cam3.SetViewUp(0, -1, 0)
-    cam3.SetPosition(0, 0, -1)
-    ren3.SetActiveCamera(cam3)
-    ren3.ResetCamera()
-    cam3.SetViewUp(0, -1, 0)
-    cam3.SetFocalPoint(0.0554068, -0.0596001, 0)
-    ren3.ResetCameraClippingRange()
-    
+    ren2.AddActor(c_actor)
+
+    ren3.AddActor(s_actor)
+
+    # Views as [renderer, slice actor, slice extent, orientation, outlines].
+    views = [[ren1, a_actor, a_extent, 'axial', None], [ren2, c_actor, c_extent, 'coronal', None],
+             [ren3, s_actor, s_extent, 'sagittal', None]]
+    if slicers:
+        for view in views:
+            view[4] = SliceOutlines(slicers)
+            view[4].actor.SetUserMatrix(vtk.vtkMatrix4x4() if oblique else flat_outline_matrix(geometry, view[3]))
+            view[0].AddActor(view[4].actor)
+            cut_outlines(view, geometry, planes.get(view[3]))
+
+    # Every view looks at its slice from below with the head up, the camera is
+    # fitted to the slice it shows.
+    for ren in (ren1, ren2, ren3):
+        cam = vtk.vtkCamera()
+        cam.SetViewUp(0, -1, 0)
+        cam.SetPosition(0, 0, -1)
+        ren.SetActiveCamera(cam)
+        ren.ResetCamera()
+
     # Set the background color for all renderers.
     colors.SetColor("BkgColor", [201, 214, 255, 255])
     ren1.SetBackground(colors.GetColor3d('BkgColor'))
@@ -311,9 +155,213 @@ def main():
     # Set the viewport for the coronal renderer.
     ren3.SetViewport(0, 0, 1, 0.5)
 
+    # The slices are 2D views: drag to pan with the middle button or shift,
+    # zoom with the right button or the wheel.
+    iren.SetInteractorStyle(vtk.vtkInteractorStyleImage())
+
+    if hud or perf_log:
+        FrameTimeHUD(ren_win, ren3, perf_log, hud).attach(iren)
+
+    # Only the views that changed are drawn, zoom and pan are linked across
+    # them, 'v' prints the render time of every view. See Linked_Panes.py.
+    panes = LinkedPanes(ren_win)
+    for ren, name in ((ren1, 'axial'), (ren2, 'coronal'), (ren3, 'sagittal')):
+        watch = list(volumes.producers)
+        if oblique:
+            watch += planes[name].reslices
+        if slicers:
+            watch += [view[4].polydata for view in views if view[3] == name]
+        panes.add(ren, name, watch)
+    panes.attach(iren)
+
+    if oblique:
+        interaction = ObliqueInteraction(ren_win)
+        interaction.add(planes['axial'], ren1, a_actor)
+        interaction.add(planes['coronal'], ren2, c_actor)
+        interaction.add(planes['sagittal'], ren3, s_actor)
+        interaction.attach(iren)
+
+    # The outlines of a plane that was turned or moved are cut again before
+    # the window is drawn, and before the views that changed are picked.
+    if oblique and slicers:
+        def on_render(caller, ev):
+            for view in views:
+                if planes[view[3]].axes.GetMTime() > view[4].polydata.GetMTime():
+                    cut_outlines(view, geometry, planes[view[3]])
+        ren_win.AddObserver('StartEvent', on_render, 1.0)
+
+    # Ctrl + mouse wheel moves the slice of the view under the mouse by one
+    # voxel, with its outlines.
+    def on_wheel(caller, ev):
+        if not caller.GetControlKey():
+            return
+        ren = caller.FindPokedRenderer(*caller.GetEventPosition())
+        view = next((view for view in views if view[0] is ren), None)
+        if view is None:
+            return
+        axis = normal_axis(view[3])
+        step = 1 if ev == 'MouseWheelForwardEvent' else -1
+        number = min(max(view[2][2 * axis] + step, extent[2 * axis]), extent[2 * axis + 1])
+        view_extent = list(view[2])
+        view_extent[2 * axis] = view_extent[2 * axis + 1] = number
+        view[2] = tuple(view_extent)
+        ren.RemoveActor(view[1])
+        view[1] = create_view(view[2], view[3])
+        ren.AddActor(view[1])
+        if view[4]:
+            cut_outlines(view, geometry)
+        caller.GetCommand(wheel_tags[ev]).SetAbortFlag(1)
+        ren_win.Render()
+
+    # High priority, so the wheel does not zoom the view as well.
+    if not oblique:
+        wheel_tags = {ev: iren.AddObserver(ev, on_wheel, 1.0)
+                      for ev in ('MouseWheelForwardEvent', 'MouseWheelBackwardEvent')}
+
+    # When a finer level is loaded, every view gets a new slice actor cut at
+    # that level. The textured quad keeps its size, so the cameras stay as they are.
+    # The oblique planes are cut in world coordinates and follow the new level as they are.
+
+    def on_level(factor, result):
+        if oblique:
+            return
+        for view in views:
+            ren, actor, view_extent = view[:3]
+            view[1] = create_slice_actor(grey_reader, segment_reader,
+                                         level_extent(view_extent, factor, volumes.image().GetExtent()),
+                                         wllut, lut, overlay_alpha)
+            ren.RemoveActor(actor)
+            ren.AddActor(view[1])
+
+    volumes.attach(iren, ren_win, on_level)
+
     ren_win.Render()
     iren.Start()
 
+# Axis (0 = x, 1 = y, 2 = z) along which the slices of an orientation are taken.
+def normal_axis(orientation):
+    return [abs(c) for c in ORIENTATIONS[orientation][2]].index(1)
+
+# Matrix from the volume coordinates to the unit quad of a slice view, with
+# the voxel centres where the slice texture puts them.
+def flat_outline_matrix(geometry, orientation):
+    extent, spacing, origin = geometry
+    matrix = vtk.vtkMatrix4x4()
+    matrix.Zero()
+    for row, direction in enumerate(ORIENTATIONS[orientation][:2]):
+        a = direction.index(1)
+        n = extent[2 * a + 1] - extent[2 * a] + 1
+        matrix.SetElement(row, a, 1 / (n * spacing[a]))
+        matrix.SetElement(row, 3, (0.5 - extent[2 * a] - origin[a] / spacing[a]) / n - 0.5)
+    matrix.SetElement(2, 3, -OUTLINE_OFFSET)
+    matrix.SetElement(3, 3, 1)
+    return matrix
+
+# Cuts the outlines of a view on its slice, or on its oblique plane. A plane
+# parallel to the volume axes is cut through the bins of the meshes.
+def cut_outlines(view, geometry, plane=None):
+    _, _, view_extent, orientation, outlines = view
+    extent, spacing, origin = geometry
+    if plane is None:
+        axis = normal_axis(orientation)
+        outlines.cut_axis(axis, origin[axis] + view_extent[2 * axis] * spacing[axis])
+        return
+
+    # The outlines are drawn in the coordinates of the plane, like its slice.
+    matrix = outlines.actor.GetUserMatrix()
+    matrix.DeepCopy(plane.axes)
+    matrix.Invert()
+    matrix.SetElement(2, 3, matrix.GetElement(2, 3) - OUTLINE_OFFSET * plane.size * plane.spacing)
+
+    normal = [plane.axes.GetElement(row, 2) for row in range(3)]
+    center = [plane.axes.GetElement(row, 3) for row in range(3)]
+    axis = max(range(3), key=lambda i: abs(normal[i]))
+    if abs(normal[axis]) > 1 - 1e-9:
+        outlines.cut_axis(axis, center[axis])
+    else:
+        outlines.cut_plane(center, normal)
+
+# Function to print the labels (other than the background) on a slice.
+def print_slice_labels(index, axis, slice_number):
+    labels = [label for label in index.labels_on_slice(axis, slice_number) if label != 0]
+    print('Labels on the slice: {:s}'.format(', '.join(map(str, labels)) or 'none'))
+
+# Function to create the actor of one slice view. The grayscale slice (through
+# the window/level table) and the label slice (through the head LUT) are blended
+# into a single RGB image before it is uploaded, so every view draws one opaque
+# textured quad instead of two textures and a translucent overlay.
+def create_slice_actor(grey_reader, segment_reader, extent, wllut, lut, overlay_alpha):
+    # Pad the grayscale data to the desired slice number.
+    grey_padder = vtk.vtkImageConstantPad()
+    grey_padder.SetInputConnection(grey_reader.GetOutputPort())
+    grey_padder.SetOutputWholeExtent(*extent)
+    grey_padder.SetConstant(0)
+
+    grey_colors = vtk.vtkImageMapToColors()
+    grey_colors.SetInputConnection(grey_padder.GetOutputPort())
+    grey_colors.SetLookupTable(wllut)
+    grey_colors.SetOutputFormatToRGBA()
+    last_connection = grey_colors
+
+    # Without an overlay (e.g. when the outlines replace it) the labels are not
+    # read or coloured at all.
+    if overlay_alpha > 0:
+        segment_padder = vtk.vtkImageConstantPad()
+        segment_padder.SetInputConnection(segment_reader.GetOutputPort())
+        segment_padder.SetOutputWholeExtent(*extent)
+        segment_padder.SetConstant(0)
+
+        segment_colors = vtk.vtkImageMapToColors()
+        segment_colors.SetInputConnection(segment_padder.GetOutputPort())
+        segment_colors.SetLookupTable(lut)
+        segment_colors.SetOutputFormatToRGBA()
+
+        # The label alpha (0 for the background) is scaled by the overlay alpha.
+        blend = vtk.vtkImageBlend()
+        blend.AddInputConnection(grey_colors.GetOutputPort())
+        blend.AddInputConnection(segment_colors.GetOutputPort())
+        blend.SetOpacity(1, overlay_alpha)
+        last_connection = blend
+
+    # Drop the alpha channel so that the texture is opaque.
+    rgb = vtk.vtkImageExtractComponents()
+    rgb.SetInputConnection(last_connection.GetOutputPort())
+    rgb.SetComponents(0, 1, 2)
+
+    # The texture is only interpolated without the overlay, so the label colours
+    # keep sharp edges and do not run into each other or into the grey.
+    texture = vtk.vtkTexture()
+    texture.SetInputConnection(rgb.GetOutputPort())
+    texture.SetColorModeToDirectScalars()
+    texture.SetInterpolate(overlay_alpha <= 0)
+
+    plane = vtk.vtkPlaneSource()
+
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputConnection(plane.GetOutputPort())
+
+    actor = vtk.vtkActor()
+    actor.SetMapper(mapper)
+    actor.SetTexture(texture)
+
+    return actor
+
+# Function to create the window/level lookup table of the grayscale slices,
+# also used by Slice_Atlas.py. Without a window and level it is the fixed table
+# of the viewer over -980 .. 5144, otherwise it covers level +- window / 2.
+def create_window_level_lut(window=None, level=None):
+    wllut = vtk.vtkWindowLevelLookupTable()
+    if window is None or level is None:
+        wllut.SetWindow(255)
+        wllut.SetLevel(128)
+        wllut.SetTableRange(-980,5144)
+    else:
+        wllut.SetWindow(window)
+        wllut.SetLevel(level)
+        wllut.SetTableRange(level - window / 2, level + window / 2)
+    wllut.Build()
+    return wllut
+
 # Function to create a lookup table for head tissues.
 def create_head_lut(colors):
     lut = vtk.vtkLookupTable()
@@ -514,5 +562,27 @@ class SliceOrder:
 # If this script is run as the main program, invoke the main function.
 if __name__ == '__main__':
     import sys
-    
-    main()
\ No newline at end of file
+
+    # Show the frame-time overlay ('h' toggles it) and log every frame to a CSV file.
+    hud = False
+    perf_log = None     # e.g. 'perf_log.csv'
+
+    # Opacity of the label colours blended over the grayscale slices.
+    overlay_alpha = 0.5
+
+    # Show the coarsest pyramid level first, if Volume_Pyramid.py has been run.
+    progressive = True
+
+    # Cut the slices with oblique planes: ctrl + drag turns the plane of a view,
+    # ctrl + mouse wheel moves it, 'o' resets all planes.
+    oblique = False
+
+    # Draw the tissue outlines of 'slices' (3D_From_Slices.py) or 'models'
+    # (3D_head.py) instead of the label colours, e.g. outlines = 'slices'.
+    # Ctrl + mouse wheel moves the slice of a view.
+    outlines = None
+
+    # Atlas folder, the first argument or MDV_DATASET_ROOT if given.
+    root = sys.argv[1] if len(sys.argv) > 1 else None
+
+    main(overlay_alpha, hud, perf_log, progressive, root, oblique, outlines)
\ No newline at end of file
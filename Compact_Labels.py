@@ -0,0 +1,95 @@
+import argparse
+import importlib
+import os
+
+from Atlas_Paths import dataset_root, grey_file, label_file
+from Label_Index import load_label_index
+from Thread_Benchmark import pipeline_stages, stage_name
+from Tissue_Scene import default_tissues
+from Volume_IO import compact_dtype, read_volume, write_nrrd_like
+
+# Scalar types of the label volume and of the volumes in the tissue pipeline
+# of 3D_From_Slices.py.
+#
+# The label volume is listed with the type it is stored in, its label range and
+# the smallest integer type that holds it (uint8 for the SPL label ids up to
+# 140). With --write the volume is stored again in that type, as a raw NRRD
+# next to it (HN-Atlas-labels.compact.nrrd) with the header of the original.
+# The atlas itself is left as it is; to use the compact volume, move it over
+# the original. The pyramid levels and the label index are then older than the
+# volume and are built again (see Volume_Pyramid.py and Label_Index.py).
+#
+# The tissue pipelines are run with and without COMPACT_TYPES (see
+# default_parameters() in 3D_From_Slices.py), which keeps the tissue mask, its
+# shrunk and its smoothed volume as bytes, and the voxel memory of every stage
+# is summed over the tissues.
+
+def main(tissues, root, write):
+    file_name = label_file(root)
+    labels, spacing, origin = read_volume(file_name)
+    dtype = compact_dtype(labels.min(), labels.max())
+    print('{:s}: {:s} labels from {} to {}, {:.1f} MiB; as {:s} {:.1f} MiB'.format(
+        file_name, labels.dtype.name, labels.min(), labels.max(), labels.nbytes / 2 ** 20,
+        dtype.name, labels.size * dtype.itemsize / 2 ** 20))
+
+    if write and dtype.itemsize < labels.dtype.itemsize:
+        output = compact_file_name(file_name)
+        temp_file = output + '.tmp'
+        write_nrrd_like(temp_file, labels.astype(dtype), file_name)
+        os.replace(temp_file, output)
+        print('Stored the labels as {:s} in {:s}. Move it over {:s} to use it, and run Volume_Pyramid.py again '
+              'to rebuild the pyramid levels.'.format(dtype.name, output, file_name))
+    elif write:
+        print('The labels are stored in the smallest type already.')
+    del labels
+
+    native = stage_memory(tissues, root, False)
+    compact = stage_memory(tissues, root, True)
+    print(format_table(native, compact))
+
+# The file --write stores the compact label volume in, next to the original.
+def compact_file_name(file_name):
+    return os.path.splitext(file_name)[0] + '.compact.nrrd'
+
+# Voxel memory (bytes) and scalar type of the output of every image stage of
+# the tissue pipelines, summed over the tissues, by stage name.
+def stage_memory(tissues, root, compact_types):
+    from_slices = importlib.import_module('3D_From_Slices')
+    available_tissues = from_slices.tissue_parameters()
+    load_label_index(label_file(root))
+
+    stages = dict()
+    for name in tissues:
+        tissue = dict(available_tissues[name], COMPACT_TYPES=compact_types)
+        iso_surface = from_slices.create_iso_surface(grey_file(root), label_file(root), tissue, True)
+        for stage in pipeline_stages(iso_surface):
+            image = stage.GetOutputDataObject(0)
+            if not image.IsA('vtkImageData'):
+                continue
+            size, types = stages.get(stage_name(stage), (0, set()))
+            types.add(image.GetScalarTypeAsString())
+            stages[stage_name(stage)] = (size + image.GetActualMemorySize() * 1024, types)
+    return stages
+
+def format_table(native, compact):
+    res = ['{:>22s} {:>16s} {:>12s} {:>16s} {:>12s} {:>12s}'.format(
+        'Stage', 'Type', 'MiB', 'Compact type', 'MiB', 'Saved MiB')]
+    for name, (size, types) in native.items():
+        compact_size, compact_types = compact.get(name, (0, set()))
+        res.append('{:>22s} {:>16s} {:>12.1f} {:>16s} {:>12.1f} {:>12.1f}'.format(
+            name, '/'.join(sorted(types)), size / 2 ** 20, '/'.join(sorted(compact_types)),
+            compact_size / 2 ** 20, (size - compact_size) / 2 ** 20))
+    total = sum(size for size, _ in native.values())
+    compact_total = sum(size for size, _ in compact.values())
+    res.append('{:>22s} {:>16s} {:>12.1f} {:>16s} {:>12.1f} {:>12.1f}'.format(
+        'Total', '', total / 2 ** 20, '', compact_total / 2 ** 20, (total - compact_total) / 2 ** 20))
+    return '\n'.join(res)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Memory of the label volume and the tissue pipeline volumes with compact scalar types.')
+    parser.add_argument('tissues', nargs='*', help='Tissue names, all tissues by default.')
+    parser.add_argument('--root', default=dataset_root(), help='Root folder of the atlas.')
+    parser.add_argument('--write', action='store_true', help='Store a copy of the label volume in the smallest type that holds it.')
+    args = parser.parse_args()
+
+    main(args.tissues or default_tissues('slices'), args.root, args.write)
@@ -0,0 +1,96 @@
+import argparse
+import importlib
+import time
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+from Atlas_Paths import dataset_root, grey_file, label_file
+from Thread_Settings import add_thread_arguments, apply_thread_settings
+
+# Compares the decimation engines of 3D_From_Slices.create_decimator() on the
+# atlas tissues: build time, final triangle count, the reduction reached against
+# DECIMATE_REDUCTION and the distance of the decimated surface to the original
+# iso-surface.
+
+ENGINES = ('pro', 'quadric', 'clustering')
+
+def main(tissues, engines, root, flying_edges, repeat):
+    from_slices = importlib.import_module('3D_From_Slices')
+    head_fn = grey_file(root)
+    head_tissue_fn = label_file(root)
+    available_tissues = from_slices.tissue_parameters()
+
+    rows = []
+    for name in tissues:
+        tissue = available_tissues[name]
+        iso_surface = from_slices.create_iso_surface(head_fn, head_tissue_fn, tissue, flying_edges)
+        iso_surface.Update()
+        original = iso_surface.GetOutput()
+
+        for engine in engines:
+            tissue['DECIMATE_ENGINE'] = engine
+            times = []
+            for _ in range(repeat):
+                decimator = from_slices.create_decimator(tissue)
+                decimator.SetInputData(original)
+                start = time.perf_counter()
+                decimator.Update()
+                times.append(time.perf_counter() - start)
+            decimated = decimator.GetOutput()
+
+            mean_error, max_error = surface_error(decimated, original)
+            rows.append({
+                'name': name,
+                'engine': engine,
+                'time': min(times),
+                'triangles_in': original.GetNumberOfPolys(),
+                'triangles_out': decimated.GetNumberOfPolys(),
+                'target': tissue['DECIMATE_REDUCTION'],
+                'mean_error': mean_error,
+                'max_error': max_error,
+            })
+            print(format_row(rows[-1]))
+
+    print()
+    print('{:>10s} {:>10s} {:>12s} {:>10s} {:>10s}'.format('Engine', 'Time s', 'Triangles', 'Mean err', 'Max err'))
+    for engine in engines:
+        r = [row for row in rows if row['engine'] == engine]
+        print('{:>10s} {:>10.3f} {:>12d} {:>10.4f} {:>10.4f}'.format(
+            engine, sum(x['time'] for x in r), sum(x['triangles_out'] for x in r),
+            np.mean([x['mean_error'] for x in r]), max(x['max_error'] for x in r)))
+
+# Mean and maximum distance from the points of the decimated surface to the
+# original surface, in world units (mm for the atlas).
+def surface_error(decimated, original):
+    if decimated.GetNumberOfPoints() == 0:
+        return float('nan'), float('nan')
+    distance = vtk.vtkDistancePolyDataFilter()
+    distance.SetInputData(0, decimated)
+    distance.SetInputData(1, original)
+    distance.SignedDistanceOff()
+    distance.ComputeSecondDistanceOff()
+    distance.Update()
+    d = vtk_to_numpy(distance.GetOutput().GetPointData().GetArray('Distance'))
+    return float(d.mean()), float(d.max())
+
+def format_row(row):
+    reached = 1 - row['triangles_out'] / row['triangles_in'] if row['triangles_in'] else 0.0
+    return '{:>15s} {:>10s} {:8.1f} ms {:>8d} -> {:>7d} tris  reduction {:5.1%} (target {:5.1%})  error mean {:.4f} max {:.4f}'.format(
+        row['name'], row['engine'], row['time'] * 1000, row['triangles_in'], row['triangles_out'],
+        reached, row['target'], row['mean_error'], row['max_error'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the decimation engines on the atlas tissues.')
+    parser.add_argument('tissues', nargs='*', help='Tissue names, all tissues by default.')
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+    parser.add_argument('--root', default=dataset_root(), help='Root folder of the atlas.')
+    parser.add_argument('--marching-cubes', action='store_true', help='Use marching cubes instead of flying edges.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per engine, the fastest one is reported.')
+    add_thread_arguments(parser)
+    args = parser.parse_args()
+    apply_thread_settings(args.threads, args.smp_backend)
+
+    tissues = args.tissues or [k for k in importlib.import_module('3D_From_Slices').tissue_parameters() if k != 'head']
+    main(tissues, args.engines, args.root, not args.marching_cubes, args.repeat)
@@ -0,0 +1,264 @@
+import argparse
+import json
+import os
+import struct
+import time
+from concurrent.futures import as_completed
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+from Atlas_Paths import dataset_root, grey_file, label_file, model_file
+from Memory_Usage import format_memory, peak_rss, reset_peak_rss
+from Thread_Settings import add_thread_arguments, apply_thread_settings, process_pool
+from Tissue_Scene import SOURCES, default_tissues, source_module
+
+# Output formats understood by the exporter.
+# glb - binary glTF with quantized positions (uint16) and packed normals (int8)
+# ply - binary PLY with float positions and normals
+# stl - binary STL (triangles and facet normals only)
+FORMATS = ('glb', 'ply', 'stl')
+
+def main(source, tissues, formats, output_dir, root, flying_edges, decimate, workers, compare_legacy, lean=False):
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = [(source, name, root, flying_edges, decimate, formats, output_dir, compare_legacy, lean) for name in tissues]
+    print('Exporting {:d} tissues as {:s} using {:d} workers'.format(len(jobs), ', '.join(formats), workers))
+
+    start = time.perf_counter()
+    total_size = 0
+    run_peak = 0
+    with process_pool(workers) as executor:
+        futures = [executor.submit(export_tissue, job) for job in jobs]
+        for future in as_completed(futures):
+            for row in future.result():
+                total_size += row['size']
+                run_peak = max(run_peak, row['peak_memory'])
+                print(format_row(row))
+
+    print('Wrote {:s} in {:.2f} s, peak memory {:s} per worker'.format(
+        format_size(total_size), time.perf_counter() - start, format_memory(run_peak)))
+
+# Worker entry point: build one tissue mesh and write it in every requested format.
+# Only plain Python values cross the process boundary, VTK objects stay in the worker.
+def export_tissue(job):
+    source, name, root, flying_edges, decimate, formats, output_dir, compare_legacy, lean = job
+
+    reset_peak_rss()
+    start = time.perf_counter()
+    mesh, label, lut = load_tissue_mesh(source, name, root, flying_edges, decimate, lean)
+
+    triangles = vtk.vtkTriangleFilter()
+    triangles.SetInputConnection(mesh.GetOutputPort())
+    triangles.PassLinesOff()
+    triangles.PassVertsOff()
+    triangles.Update()
+    polydata = triangles.GetOutput()
+    if not polydata.GetNumberOfPolys():
+        raise Exception('The mesh of {:s} is empty.'.format(name))
+    build_time = time.perf_counter() - start
+    peak_memory = peak_rss()
+
+    legacy_size = legacy_vtk_size(polydata) if compare_legacy else None
+    color = lut.GetTableValue(label)[:3]
+
+    rows = []
+    for fmt in formats:
+        file_name = os.path.join(output_dir, '{}.{}'.format(name, fmt))
+        start = time.perf_counter()
+        if fmt == 'glb':
+            write_glb(polydata, file_name, name, color)
+        elif fmt == 'ply':
+            write_ply(polydata, file_name, color)
+        elif fmt == 'stl':
+            write_stl(polydata, file_name)
+        else:
+            raise Exception('Unknown export format "{:s}".'.format(fmt))
+        rows.append({
+            'name': name,
+            'format': fmt,
+            'file_name': file_name,
+            'triangles': polydata.GetNumberOfPolys(),
+            'size': os.path.getsize(file_name),
+            'legacy_size': legacy_size,
+            'build_time': build_time,
+            'write_time': time.perf_counter() - start,
+            'peak_memory': peak_memory,
+        })
+    return rows
+
+def load_tissue_mesh(source, name, root, flying_edges, decimate, lean=False):
+    module = source_module(source)
+    colors = vtk.vtkNamedColors()
+    lut = module.create_head_lut(colors)
+
+    if source == 'slices':
+        head_fn = grey_file(root)
+        head_tissue_fn = label_file(root)
+        tissue = module.tissue_parameters()[name]
+        mesh = module.create_tissue_mesh(head_fn, head_tissue_fn, tissue, flying_edges, decimate, lean)
+        label = tissue['TISSUE']
+    else:
+        tm = module.create_tissue_map()
+        file_name = model_file(root, name)
+        mesh = module.create_tissue_mesh(file_name, name, tm[name][1])
+        label = tm[name][0]
+
+    return mesh, label, lut
+
+def write_glb(polydata, file_name, name, color):
+    """
+    Writes a triangle mesh as binary glTF 2.0 using KHR_mesh_quantization.
+
+    Positions are stored as normalized uint16 in the bounding box of the mesh, the
+    node scale and translation map them back to world coordinates. A uniform scale
+    is used so that the normals need no correction. Normals are stored as
+    normalized int8.
+    """
+    points = vtk_to_numpy(polydata.GetPoints().GetData()).astype(np.float64)
+    faces = vtk_to_numpy(polydata.GetPolys().GetConnectivityArray()).reshape(-1, 3)
+
+    lo = points.min(axis=0)
+    scale = float((points.max(axis=0) - lo).max()) or 1.0
+    quantized = np.round((points - lo) / scale * 65535).astype(np.uint16)
+
+    # Vertex attributes must be 4-byte aligned, so pad the elements to 4 components.
+    positions = np.zeros((len(points), 4), dtype=np.uint16)
+    positions[:, :3] = quantized
+
+    buffer_views = []
+    accessors = []
+    blobs = []
+    offset = 0
+
+    def add_view(data, target, stride=None):
+        nonlocal offset
+        blob = data.tobytes()
+        view = {'buffer': 0, 'byteOffset': offset, 'byteLength': len(blob), 'target': target}
+        if stride:
+            view['byteStride'] = stride
+        buffer_views.append(view)
+        padding = (4 - len(blob) % 4) % 4
+        blobs.append(blob + b'\x00' * padding)
+        offset += len(blob) + padding
+        return len(buffer_views) - 1
+
+    accessors.append({
+        'bufferView': add_view(positions, 34962, 8),
+        'componentType': 5123,
+        'normalized': True,
+        'count': len(points),
+        'type': 'VEC3',
+        'min': quantized.min(axis=0).tolist(),
+        'max': quantized.max(axis=0).tolist(),
+    })
+    attributes = {'POSITION': len(accessors) - 1}
+
+    normals = polydata.GetPointData().GetNormals()
+    if normals is not None:
+        packed = np.zeros((len(points), 4), dtype=np.int8)
+        packed[:, :3] = np.round(np.clip(vtk_to_numpy(normals), -1.0, 1.0) * 127)
+        accessors.append({
+            'bufferView': add_view(packed, 34962, 4),
+            'componentType': 5120,
+            'normalized': True,
+            'count': len(points),
+            'type': 'VEC3',
+        })
+        attributes['NORMAL'] = len(accessors) - 1
+
+    if len(points) < 65536:
+        indices, component_type = faces.astype(np.uint16), 5123
+    else:
+        indices, component_type = faces.astype(np.uint32), 5125
+    accessors.append({
+        'bufferView': add_view(indices, 34963),
+        'componentType': component_type,
+        'count': indices.size,
+        'type': 'SCALAR',
+    })
+
+    gltf = {
+        'asset': {'version': '2.0', 'generator': 'MDV Export_Tissues'},
+        'extensionsUsed': ['KHR_mesh_quantization'],
+        'extensionsRequired': ['KHR_mesh_quantization'],
+        'scene': 0,
+        'scenes': [{'nodes': [0]}],
+        'nodes': [{'name': name, 'mesh': 0, 'translation': lo.tolist(), 'scale': [scale] * 3}],
+        'meshes': [{'name': name, 'primitives': [{'attributes': attributes, 'indices': len(accessors) - 1, 'material': 0}]}],
+        'materials': [{'name': name, 'pbrMetallicRoughness': {'baseColorFactor': list(color) + [1.0], 'metallicFactor': 0.0, 'roughnessFactor': 0.6}}],
+        'accessors': accessors,
+        'bufferViews': buffer_views,
+        'buffers': [{'byteLength': offset}],
+    }
+
+    json_chunk = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+    json_chunk += b' ' * ((4 - len(json_chunk) % 4) % 4)
+    bin_chunk = b''.join(blobs)
+
+    with open(file_name, 'wb') as f:
+        f.write(struct.pack('<4sII', b'glTF', 2, 12 + 8 + len(json_chunk) + 8 + len(bin_chunk)))
+        f.write(struct.pack('<I4s', len(json_chunk), b'JSON'))
+        f.write(json_chunk)
+        f.write(struct.pack('<I4s', len(bin_chunk), b'BIN\x00'))
+        f.write(bin_chunk)
+
+def write_ply(polydata, file_name, color):
+    writer = vtk.vtkPLYWriter()
+    writer.SetFileName(file_name)
+    writer.SetInputData(polydata)
+    writer.SetFileTypeToBinary()
+    writer.SetColorModeToUniformCellColor()
+    writer.SetColor(*[int(round(c * 255)) for c in color])
+    writer.Write()
+
+def write_stl(polydata, file_name):
+    writer = vtk.vtkSTLWriter()
+    writer.SetFileName(file_name)
+    writer.SetInputData(polydata)
+    writer.SetFileTypeToBinary()
+    writer.Write()
+
+# Size of the same mesh written as a legacy ASCII .vtk file, for comparison only.
+def legacy_vtk_size(polydata):
+    writer = vtk.vtkPolyDataWriter()
+    writer.SetInputData(polydata)
+    writer.WriteToOutputStringOn()
+    writer.Write()
+    return writer.GetOutputStringLength()
+
+def format_size(size):
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return '{:.1f} {:s}'.format(size, unit)
+        size /= 1024
+    return '{:.1f} GiB'.format(size)
+
+def format_row(row):
+    s = '{:>24s} {:>4s} {:>10s} {:>8d} tris  build {:6.2f} s  write {:7.1f} ms  peak {:>8s}'.format(
+        row['name'], row['format'], format_size(row['size']), row['triangles'],
+        row['build_time'], row['write_time'] * 1000, format_memory(row['peak_memory']))
+    if row['legacy_size']:
+        s += '  {:5.1%} of legacy .vtk'.format(row['size'] / row['legacy_size'])
+    return s
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export tissue meshes to compact binary formats.')
+    parser.add_argument('tissues', nargs='*', help='Tissue names, all tissues of the source by default.')
+    parser.add_argument('--source', choices=sorted(SOURCES), default='slices',
+                        help='Build the meshes from the label volume (slices) or read the atlas models (models).')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=['glb'])
+    parser.add_argument('--output', default='./export')
+    parser.add_argument('--root', default=dataset_root(), help='Root folder of the atlas.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--marching-cubes', action='store_true', help='Use marching cubes instead of flying edges.')
+    parser.add_argument('--decimate', action='store_true')
+    parser.add_argument('--compare-legacy', action='store_true', help='Report the size relative to a legacy .vtk file.')
+    parser.add_argument('--lean', action='store_true', help='Free the intermediate data of every tissue build early.')
+    add_thread_arguments(parser)
+    args = parser.parse_args()
+    apply_thread_settings(args.threads, args.smp_backend)
+
+    main(args.source, args.tissues or default_tissues(args.source), args.formats, args.output, args.root,
+         not args.marching_cubes, args.decimate, args.workers, args.compare_legacy, args.lean)
@@ -0,0 +1,187 @@
+import argparse
+import functools
+import os
+import time
+
+import numpy as np
+
+from Atlas_Paths import dataset_root, label_file
+from Volume_IO import read_labels
+
+# Persistent spatial index of a label volume.
+#
+# The index is built in one pass over the label NRRD and stored next to it as
+# <name>.index.npz. It holds, for every label, the voxel count, the bounding box
+# (as a VTK extent) and per-slice presence bitmaps along x, y and z, and
+# optionally a run-length encoding of the whole volume. Once loaded, questions
+# like "which labels are on axial slice n" or "where is label 25" are answered
+# without touching voxel data.
+
+AXES = ('x', 'y', 'z')
+
+class LabelIndex:
+    def __init__(self, data):
+        self.data = data
+        self.shape = tuple(int(v) for v in data['shape'])    # (nz, ny, nx)
+        self.spacing = tuple(float(v) for v in data['spacing'])
+        self.origin = tuple(float(v) for v in data['origin'])
+        self.label_ids = data['labels']
+        self.counts = data['counts']
+        self.extents = data['extents']
+        self.row = {int(label): i for i, label in enumerate(self.label_ids)}
+
+        # Presence bitmaps, unpacked once into (labels, slices) boolean tables.
+        self.presence = dict()
+        for axis, n in zip(AXES, self.shape[::-1]):
+            self.presence[axis] = np.unpackbits(data['presence_' + axis], axis=1, count=n).astype(bool)
+        self.slice_labels = {axis: dict() for axis in AXES}
+
+    @classmethod
+    def build(cls, file_name, rle=False):
+        labels, spacing, origin = read_labels(file_name)
+        nz, ny, nx = labels.shape
+
+        # Small non-negative label ids are counted with bincount, anything else with unique.
+        if labels.min() >= 0 and labels.max() < 2 ** 16:
+            all_counts = np.bincount(labels.ravel())
+            ids = np.flatnonzero(all_counts)
+            counts = all_counts[ids]
+            lookup = np.full(len(all_counts), -1, dtype=np.int64)
+            lookup[ids] = np.arange(len(ids))
+        else:
+            ids, counts = np.unique(labels, return_counts=True)
+            lookup = None
+
+        # One bincount per slice along each axis gives the presence bitmaps.
+        def slice_presence(n, get_slice):
+            present = np.zeros((len(ids), n), dtype=bool)
+            for i in range(n):
+                values = get_slice(i)
+                if lookup is not None:
+                    rows = np.flatnonzero(np.bincount(values.ravel(), minlength=len(lookup)))
+                    present[lookup[rows], i] = True
+                else:
+                    present[np.searchsorted(ids, np.unique(values)), i] = True
+            return present
+
+        presence = {
+            'z': slice_presence(nz, lambda i: labels[i]),
+            'y': slice_presence(ny, lambda i: labels[:, i, :]),
+            'x': slice_presence(nx, lambda i: labels[:, :, i]),
+        }
+
+        # Bounding boxes follow from the first and last slice a label is on.
+        extents = np.zeros((len(ids), 6), dtype=np.int32)
+        for a, axis in enumerate(AXES):
+            p = presence[axis]
+            extents[:, 2 * a] = p.argmax(axis=1)
+            extents[:, 2 * a + 1] = p.shape[1] - 1 - p[:, ::-1].argmax(axis=1)
+
+        data = {
+            'shape': np.array(labels.shape),
+            'spacing': np.array(spacing),
+            'origin': np.array(origin),
+            'labels': ids,
+            'counts': counts.astype(np.int64),
+            'extents': extents,
+            'source': np.array(source_signature(file_name)),
+        }
+        for axis in AXES:
+            data['presence_' + axis] = np.packbits(presence[axis], axis=1)
+        if rle:
+            data['rle_values'], data['rle_lengths'] = run_length_encode(labels.ravel())
+        return cls(data)
+
+    @classmethod
+    def load(cls, index_file):
+        with np.load(index_file) as f:
+            return cls({k: f[k] for k in f.files})
+
+    def save(self, index_file):
+        np.savez_compressed(index_file, **self.data)
+
+    def labels(self):
+        return [int(label) for label in self.label_ids]
+
+    def voxel_count(self, label):
+        i = self.row.get(label)
+        return 0 if i is None else int(self.counts[i])
+
+    # Bounding box of the label as a VTK extent (x0, x1, y0, y1, z0, z1), or None.
+    def extent(self, label):
+        i = self.row.get(label)
+        return None if i is None else tuple(int(v) for v in self.extents[i])
+
+    def contains(self, label, axis, n):
+        i = self.row.get(label)
+        return i is not None and 0 <= n < self.presence[axis].shape[1] and bool(self.presence[axis][i, n])
+
+    # Labels on slice n along the axis, none for a slice outside the volume.
+    def labels_on_slice(self, axis, n):
+        if not 0 <= n < self.presence[axis].shape[1]:
+            return []
+        cache = self.slice_labels[axis]
+        if n not in cache:
+            cache[n] = [int(v) for v in self.label_ids[self.presence[axis][:, n]]]
+        return cache[n]
+
+    def has_rle(self):
+        return 'rle_values' in self.data
+
+    # Restores the (z, y, x) label volume from the run-length encoding.
+    def decode(self):
+        return np.repeat(self.data['rle_values'], self.data['rle_lengths']).reshape(self.shape)
+
+def run_length_encode(values):
+    change = np.flatnonzero(values[1:] != values[:-1]) + 1
+    starts = np.concatenate(([0], change))
+    lengths = np.diff(np.concatenate((starts, [len(values)])))
+    return values[starts], lengths.astype(np.uint32)
+
+def index_file_name(file_name):
+    root, _ = os.path.splitext(str(file_name))
+    return root + '.index.npz'
+
+# The index is rebuilt when the size or modification time of the NRRD changes.
+def source_signature(file_name):
+    st = os.stat(str(file_name))
+    return [st.st_size, st.st_mtime_ns]
+
+# Loads the index stored next to the label volume, building (and storing) it
+# first if it is missing or out of date.
+@functools.lru_cache(maxsize=None)
+def load_label_index(file_name, rle=False):
+    index_file = index_file_name(file_name)
+    if os.path.exists(index_file):
+        index = LabelIndex.load(index_file)
+        if list(index.data['source']) == source_signature(file_name) and (index.has_rle() or not rle):
+            return index
+
+    index = LabelIndex.build(file_name, rle)
+    try:
+        index.save(index_file)
+    except OSError as e:
+        print('Could not store the label index {:s}: {}'.format(index_file, e))
+    return index
+
+def main(file_name, rle, rebuild):
+    start = time.perf_counter()
+    if rebuild:
+        index = LabelIndex.build(file_name, rle)
+        index.save(index_file_name(file_name))
+    else:
+        index = load_label_index(file_name, rle)
+    print('Index of {:s} ready in {:.2f} s ({:s})'.format(file_name, time.perf_counter() - start, index_file_name(file_name)))
+
+    print('{:>6s} {:>10s}  {:s}'.format('Label', 'Voxels', 'Extent'))
+    for label in index.labels():
+        print('{:>6d} {:>10d}  {}'.format(label, index.voxel_count(label), index.extent(label)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build and show the spatial index of a label volume.')
+    parser.add_argument('file_name', nargs='?', default=label_file(dataset_root()))
+    parser.add_argument('--rle', action='store_true', help='Also store a run-length encoding of the volume.')
+    parser.add_argument('--rebuild', action='store_true')
+    args = parser.parse_args()
+
+    main(args.file_name, args.rle, args.rebuild)
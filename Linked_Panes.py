@@ -0,0 +1,153 @@
+import collections
+import time
+
+import vtk
+
+from Performance_HUD import percentiles
+
+# Rendering of a window split into panes, like the three views of Colour_Slices.py.
+#
+# Only the panes whose content or camera changed since they were last drawn are
+# rendered. Before every render of the window each pane compares the
+# modification times of its camera, props and watched objects (e.g. the reslice
+# filters of an oblique plane) with those at its last draw; the unchanged panes
+# are skipped with SetDraw(0) and keep their pixels in the framebuffer.
+#
+# Zoom and pan are linked: when an interaction in one pane ends, its zoom and
+# pan relative to its starting camera are applied to the other panes, which are
+# then drawn once. During the interaction only the pane under the mouse is drawn.
+#
+# The render time of every pane is taken from the Start and End events of its
+# renderer; 'v' prints them, and they are printed again on exit.
+
+class LinkedPanes:
+    def __init__(self, render_window, window=240, key='v'):
+        self.render_window = render_window
+        self.window = window
+        self.key = key
+        self.panes = []
+        self.size = None
+        self.renders = 0
+        render_window.AddObserver('StartEvent', self.on_start)
+
+    # Adds a pane. Its current camera is the starting camera that zoom and pan
+    # are measured from.
+    def add(self, renderer, name, watch=()):
+        self.panes.append(Pane(renderer, name, watch, self.window))
+
+    def attach(self, interactor):
+        interactor.GetInteractorStyle().AddObserver('EndInteractionEvent', self.on_end_interaction)
+        interactor.AddObserver('KeyPressEvent', self.on_key)
+        interactor.AddObserver('ExitEvent', lambda caller, ev: print(self.report()))
+
+    # Marks the panes that have changed as the only ones to draw.
+    def on_start(self, caller, ev):
+        self.renders += 1
+        size = tuple(caller.GetSize())
+        resized = size != self.size
+        self.size = size
+        for pane in self.panes:
+            pane.renderer.SetDraw(resized or pane.changed())
+
+    # Applies the zoom and pan of the pane that was interacted with to the others.
+    def on_end_interaction(self, caller, ev):
+        source = next((pane for pane in self.panes if pane.renderer is caller.GetCurrentRenderer()), None)
+        if source is None:
+            return
+        zoom, pan = source.zoom_and_pan()
+        for pane in self.panes:
+            if pane is not source:
+                pane.set_zoom_and_pan(zoom, pan)
+        self.render_window.Render()
+
+    def on_key(self, caller, ev):
+        if caller.GetKeySym() == self.key:
+            print(self.report())
+
+    def report(self):
+        res = ['{:>10s} {:>8s} {:>8s} {:>10s} {:>10s}'.format('Pane', 'Drawn', 'Skipped', 'Mean ms', 'p95 ms')]
+        for pane in self.panes:
+            times = list(pane.times)
+            mean = sum(times) / len(times) if times else 0.0
+            p95 = percentiles(times, [95])[0]
+            res.append('{:>10s} {:>8d} {:>8d} {:>10.2f} {:>10.2f}'.format(
+                pane.name, pane.drawn, self.renders - pane.drawn, mean, p95))
+        return '\n'.join(res)
+
+class Pane:
+    def __init__(self, renderer, name, watch, window):
+        self.renderer = renderer
+        self.name = name
+        self.watch = list(watch)
+        self.times = collections.deque(maxlen=window)
+        self.drawn = 0
+        self.drawn_mtime = 0
+        self.start = None
+
+        camera = renderer.GetActiveCamera()
+        self.home_focal = camera.GetFocalPoint()
+        self.home_distance = camera.GetDistance()
+        self.home_scale = camera.GetParallelScale()
+        self.home_right, self.home_up = view_axes(camera)
+
+        renderer.AddObserver('StartEvent', self.on_start)
+        renderer.AddObserver('EndEvent', self.on_end)
+
+    # Latest modification of anything that changes what the pane shows. The
+    # renderer itself is left out, SetDraw() modifies it.
+    def mtime(self):
+        props = self.renderer.GetViewProps()
+        objects = [self.renderer.GetActiveCamera(), props] + self.watch
+        objects += [props.GetItemAsObject(i) for i in range(props.GetNumberOfItems())]
+        return max(o.GetMTime() for o in objects)
+
+    def changed(self):
+        return self.mtime() > self.drawn_mtime
+
+    def on_start(self, caller, ev):
+        self.start = time.perf_counter()
+
+    # The modification time is taken after drawing, which updates the pipelines.
+    def on_end(self, caller, ev):
+        self.times.append(1000 * (time.perf_counter() - self.start))
+        self.drawn += 1
+        self.drawn_mtime = self.mtime()
+
+    # Zoom factor and pan (in units of the starting view distance along the
+    # starting view axes) of the camera.
+    def zoom_and_pan(self):
+        camera = self.renderer.GetActiveCamera()
+        if camera.GetParallelProjection():
+            zoom = self.home_scale / camera.GetParallelScale()
+        else:
+            zoom = self.home_distance / camera.GetDistance()
+        offset = [f - h for f, h in zip(camera.GetFocalPoint(), self.home_focal)]
+        pan = (vtk.vtkMath.Dot(offset, self.home_right) / self.home_distance,
+               vtk.vtkMath.Dot(offset, self.home_up) / self.home_distance)
+        return zoom, pan
+
+    # Moves the camera to a zoom and pan, keeping its direction of view.
+    def set_zoom_and_pan(self, zoom, pan):
+        camera = self.renderer.GetActiveCamera()
+        direction = camera.GetDirectionOfProjection()
+        focal = [h + self.home_distance * (pan[0] * r + pan[1] * u)
+                 for h, r, u in zip(self.home_focal, self.home_right, self.home_up)]
+        if camera.GetParallelProjection():
+            camera.SetParallelScale(self.home_scale / zoom)
+            distance = camera.GetDistance()
+        else:
+            distance = self.home_distance / zoom
+        camera.SetFocalPoint(focal)
+        camera.SetPosition([f - distance * d for f, d in zip(focal, direction)])
+        self.renderer.ResetCameraClippingRange()
+
+# Unit vectors pointing right and up on the screen of a camera.
+def view_axes(camera):
+    direction = camera.GetDirectionOfProjection()
+    up = list(camera.GetViewUp())
+    right = [0.0, 0.0, 0.0]
+    vtk.vtkMath.Cross(direction, up, right)
+    vtk.vtkMath.Normalize(right)
+    vtk.vtkMath.Cross(right, direction, up)
+    vtk.vtkMath.Normalize(up)
+    return right, up
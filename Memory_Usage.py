@@ -0,0 +1,45 @@
+import sys
+
+# Resident memory of the current process, used to report the peak memory of
+# the tissue builds.
+#
+# On Linux the peak (VmHWM) is read from /proc and can be reset, so the peak of
+# every tissue can be measured on its own. Elsewhere the peak of the whole
+# process from getrusage() is reported and reset_peak_rss() does nothing.
+
+def peak_rss():
+    try:
+        return read_status('VmHWM')
+    except (OSError, KeyError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS.
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def current_rss():
+    try:
+        return read_status('VmRSS')
+    except (OSError, KeyError):
+        return peak_rss()
+
+# Resets the peak to the current resident memory. Returns False if the peak
+# can not be reset on this system.
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+# Value of a memory field of /proc/self/status in bytes.
+def read_status(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name == field:
+                return int(value.split()[0]) * 1024
+    raise KeyError(field)
+
+def format_memory(size):
+    return '{:.0f} MiB'.format(size / 2 ** 20)
@@ -0,0 +1,284 @@
+import math
+
+import vtk
+
+# Oblique multi-planar reformatting for the slice viewers.
+#
+# An ObliquePlane cuts the grayscale volume (linear interpolation) and the label
+# volume (nearest neighbour, so no label values are invented) along a plane of
+# any orientation. The plane is a vtkMatrix4x4 whose columns are the in-plane
+# axes, the normal and the centre, shared by the vtkImageReslice filters and
+# the actor. The filters are built once on a fixed output grid; turning or
+# moving the plane only modifies the matrix and the output extent, which is
+# cut down to the rectangle around the part of the plane inside the volume, so
+# every update reuses the same pipeline and resamples only that part. While a
+# plane is dragged it is cut at a coarser spacing and at full resolution again
+# when the mouse is released.
+#
+# The geometry comes from the extent, spacing and origin of the full resolution
+# volume (see read_geometry() in Volume_IO.py). Reslicing happens in world
+# coordinates, so coarser pyramid levels are cut along the same plane.
+#
+# Ctrl + left drag turns the plane under the mouse, ctrl + mouse wheel moves it
+# along its normal by one voxel and 'o' puts all planes back.
+
+# In-plane x axis, in-plane y axis and normal of the starting orientations.
+ORIENTATIONS = {
+    'axial': ((1, 0, 0), (0, 1, 0), (0, 0, 1)),
+    'coronal': ((1, 0, 0), (0, 0, 1), (0, -1, 0)),
+    'sagittal': ((0, 1, 0), (0, 0, 1), (1, 0, 0)),
+}
+
+# Degrees the plane turns per pixel of mouse movement.
+DEGREES_PER_PIXEL = 0.5
+
+# Output spacing of a plane being dragged, in output voxels.
+DRAG_FACTOR = 2
+
+class ObliquePlane:
+    def __init__(self, geometry, orientation='axial', center=None):
+        extent, spacing, origin = geometry
+        self.lo = [origin[i] + extent[2 * i] * spacing[i] for i in range(3)]
+        self.hi = [origin[i] + extent[2 * i + 1] * spacing[i] for i in range(3)]
+        self.orientation = orientation
+        self.center = list(center) if center is not None else [0.5 * (a + b) for a, b in zip(self.lo, self.hi)]
+
+        # The output grid is a square that covers the volume diagonal, so the
+        # cut is never clipped whatever the orientation, at the finest voxel spacing.
+        self.spacing = min(spacing)
+        diagonal = math.sqrt(sum((b - a) ** 2 for a, b in zip(self.lo, self.hi)))
+        self.size = int(math.ceil(diagonal / self.spacing)) + 1
+        self.factor = 1
+
+        self.axes = vtk.vtkMatrix4x4()
+        self.reslices = []
+        self.reset()
+
+    # Puts the plane back to its starting orientation through its centre.
+    def reset(self):
+        for column, axis in enumerate(ORIENTATIONS[self.orientation]):
+            for row in range(3):
+                self.axes.SetElement(row, column, axis[row])
+        for row in range(3):
+            self.axes.SetElement(row, 3, self.center[row])
+        self.axes.Modified()
+        self.update_output()
+
+    # Reslice filter for one volume. Labels use nearest neighbour interpolation.
+    def create_reslice(self, input_port, labels=False):
+        reslice = vtk.vtkImageReslice()
+        reslice.SetInputConnection(input_port)
+        reslice.SetResliceAxes(self.axes)
+        reslice.SetOutputDimensionality(2)
+        reslice.SetBackgroundLevel(0)
+        if labels:
+            reslice.SetInterpolationModeToNearestNeighbor()
+        else:
+            reslice.SetInterpolationModeToLinear()
+        self.reslices.append(reslice)
+        self.update_output()
+        return reslice
+
+    # Output grid of the reslice filters, factor times coarser than the finest
+    # voxel spacing, and the extent of the plane inside the volume on it.
+    def update_output(self):
+        spacing = self.spacing * self.factor
+        n = (self.size - 1) // self.factor + 1
+        half = 0.5 * (n - 1) * spacing
+        extent = self.plane_extent(spacing, half, n)
+        for reslice in self.reslices:
+            reslice.SetOutputSpacing(spacing, spacing, spacing)
+            reslice.SetOutputOrigin(-half, -half, 0)
+            reslice.SetOutputExtent(extent)
+
+    # Rectangle on the output grid around the points where the plane crosses
+    # the edges of the volume box.
+    def plane_extent(self, spacing, half, n):
+        m = [[self.axes.GetElement(row, column) for row in range(3)] for column in range(4)]
+        u, v, normal, center = m
+
+        def dot(a, b):
+            return sum(x * y for x, y in zip(a, b))
+
+        xs, ys = [], []
+        for axis in range(3):
+            others = [i for i in range(3) if i != axis]
+            for k in range(4):
+                a = [0.0] * 3
+                a[others[0]] = (self.lo, self.hi)[k & 1][others[0]]
+                a[others[1]] = (self.lo, self.hi)[k >> 1][others[1]]
+                a[axis] = self.lo[axis]
+                b = list(a)
+                b[axis] = self.hi[axis]
+                da = dot([p - c for p, c in zip(a, center)], normal)
+                db = dot([p - c for p, c in zip(b, center)], normal)
+                if da == db or da * db > 0:
+                    continue
+                t = da / (da - db)
+                p = [pa + t * (pb - pa) - c for pa, pb, c in zip(a, b, center)]
+                xs.append(dot(p, u))
+                ys.append(dot(p, v))
+
+        # A plane outside the volume shows a single background voxel.
+        if not xs:
+            return (n // 2, n // 2, n // 2, n // 2, 0, 0)
+
+        def index(value, rounding):
+            return min(max(int(rounding((value + half) / spacing)), 0), n - 1)
+        return (index(min(xs), math.floor), index(max(xs), math.ceil),
+                index(min(ys), math.floor), index(max(ys), math.ceil), 0, 0)
+
+    def set_dragging(self, dragging):
+        self.factor = DRAG_FACTOR if dragging else 1
+        self.update_output()
+
+    # Image actor of the plane: the grayscale through its lookup table and, if
+    # given and the overlay alpha is not 0, the label colours blended over it.
+    # The slice is only interpolated without the labels, so their edges stay
+    # sharp. With in_world the actor follows the plane in world coordinates,
+    # otherwise it stays in the plane coordinates, facing a 2D view.
+    def create_actor(self, grey_port, grey_lut, label_port=None, label_lut=None, overlay_alpha=0.5, in_world=True):
+        grey_colors = vtk.vtkImageMapToColors()
+        grey_colors.SetInputConnection(self.create_reslice(grey_port).GetOutputPort())
+        grey_colors.SetLookupTable(grey_lut)
+        grey_colors.SetOutputFormatToRGBA()
+        last = grey_colors
+
+        labels = label_port is not None and overlay_alpha > 0
+        if labels:
+            label_colors = vtk.vtkImageMapToColors()
+            label_colors.SetInputConnection(self.create_reslice(label_port, labels=True).GetOutputPort())
+            label_colors.SetLookupTable(label_lut)
+            label_colors.SetOutputFormatToRGBA()
+
+            blend = vtk.vtkImageBlend()
+            blend.AddInputConnection(grey_colors.GetOutputPort())
+            blend.AddInputConnection(label_colors.GetOutputPort())
+            blend.SetOpacity(1, overlay_alpha)
+            last = blend
+
+        # Drop the alpha channel so that the slice is opaque.
+        rgb = vtk.vtkImageExtractComponents()
+        rgb.SetInputConnection(last.GetOutputPort())
+        rgb.SetComponents(0, 1, 2)
+
+        actor = vtk.vtkImageActor()
+        actor.GetMapper().SetInputConnection(rgb.GetOutputPort())
+        actor.SetInterpolate(not labels)
+        if in_world:
+            actor.SetUserMatrix(self.axes)
+        return actor
+
+    # Turns the plane around its in-plane x (0) or y (1) axis through the centre
+    # of the plane.
+    def rotate(self, axis, degrees):
+        transform = vtk.vtkTransform()
+        transform.SetMatrix(self.axes)
+        if axis == 0:
+            transform.RotateX(degrees)
+        else:
+            transform.RotateY(degrees)
+        self.axes.DeepCopy(transform.GetMatrix())
+        self.update_output()
+
+    # Moves the plane along its normal.
+    def move(self, distance):
+        for row in range(3):
+            self.axes.SetElement(row, 3, self.axes.GetElement(row, 3) + distance * self.axes.GetElement(row, 2))
+        self.axes.Modified()
+        self.update_output()
+
+# Mouse and keyboard control of the oblique planes of a render window. Every
+# plane is registered with the renderer and the actor it is shown with; a
+# press goes to the plane of the renderer under the mouse, or to the picked
+# actor if the renderer shows several planes.
+class ObliqueInteraction:
+    def __init__(self, render_window):
+        self.render_window = render_window
+        self.planes = []
+        self.picker = vtk.vtkPropPicker()
+        self.active = None
+        self.last = None
+
+    def add(self, plane, renderer, actor):
+        self.planes.append((plane, renderer, actor))
+
+    def attach(self, interactor):
+        # High priority, so the press does not reach the interactor style when
+        # the plane handles it.
+        self.interactor = interactor
+        for event, callback in (('LeftButtonPressEvent', self.on_press),
+                                ('MouseMoveEvent', self.on_move),
+                                ('LeftButtonReleaseEvent', self.on_release),
+                                ('MouseWheelForwardEvent', self.on_wheel),
+                                ('MouseWheelBackwardEvent', self.on_wheel)):
+            self.observe(interactor, event, callback)
+        interactor.AddObserver('KeyPressEvent', self.on_key)
+
+    def observe(self, interactor, event, callback):
+        tag = None
+
+        def handler(caller, ev):
+            if callback(caller, ev):
+                caller.GetCommand(tag).SetAbortFlag(1)
+        tag = interactor.AddObserver(event, handler, 1.0)
+
+    # The plane at the display position, or None.
+    def find_plane(self, x, y):
+        renderer = self.interactor.FindPokedRenderer(x, y)
+        candidates = [(plane, actor) for plane, ren, actor in self.planes if ren is renderer]
+        if len(candidates) == 1:
+            return candidates[0][0]
+        if candidates and self.picker.Pick(x, y, 0, renderer):
+            for plane, actor in candidates:
+                if actor is self.picker.GetViewProp():
+                    return plane
+        return None
+
+    def on_press(self, caller, ev):
+        if not caller.GetControlKey():
+            return False
+        x, y = caller.GetEventPosition()
+        self.active = self.find_plane(x, y)
+        self.last = (x, y)
+        if self.active is None:
+            return False
+        self.active.set_dragging(True)
+        return True
+
+    def on_move(self, caller, ev):
+        if self.active is None:
+            return False
+        x, y = caller.GetEventPosition()
+        dx, dy = x - self.last[0], y - self.last[1]
+        self.last = (x, y)
+        if dx:
+            self.active.rotate(1, dx * DEGREES_PER_PIXEL)
+        if dy:
+            self.active.rotate(0, -dy * DEGREES_PER_PIXEL)
+        self.render_window.Render()
+        return True
+
+    def on_release(self, caller, ev):
+        if self.active is None:
+            return False
+        self.active.set_dragging(False)
+        self.active = None
+        self.render_window.Render()
+        return True
+
+    def on_wheel(self, caller, ev):
+        if not caller.GetControlKey():
+            return False
+        plane = self.find_plane(*caller.GetEventPosition())
+        if plane is None:
+            return False
+        plane.move(plane.spacing if ev == 'MouseWheelForwardEvent' else -plane.spacing)
+        self.render_window.Render()
+        return True
+
+    def on_key(self, caller, ev):
+        if caller.GetKeySym() == 'o':
+            for plane, _, _ in self.planes:
+                plane.reset()
+            self.render_window.Render()
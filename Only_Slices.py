@@ -1,9 +1,21 @@
+import sys
+
 import vtk
 
-def main():
+from Atlas_Paths import dataset_root, grey_file
+from Oblique_Reslice import ObliqueInteraction, ObliquePlane
+from Performance_HUD import FrameTimeHUD
+from Thread_Settings import apply_thread_settings
+from Volume_IO import read_geometry
+from Volume_Pyramid import ProgressiveLoader, level_extent
+
+def main(hud=False, perf_log=None, progressive=True, root=None, oblique=False):
+    # Threads of the VTK filters, see Thread_Settings.py.
+    apply_thread_settings()
+
     colors = vtk.vtkNamedColors()
 
-    fileName = r'./head-neck-2016-09/grayscale/Osirix-Manix-255-res.nrrd'
+    fileName = grey_file(dataset_root(root))
 
     colors.SetColor("BkgColor", [201, 214, 255, 255])
 
@@ -20,14 +32,13 @@ def main():
     renWin.SetSize(1024,720)
     renWin.SetWindowName("Raw data in three planes: Axial, Sagittal, Coronal")
 
-    # Reading slices from .nrrd file
-    reader = vtk.vtkNrrdReader()
-    reader.SetFileName(fileName)
-    reader.Update()
+    # Reading slices from .nrrd file. With a pyramid (see Volume_Pyramid.py) the
+    # coarsest level is shown first and the full resolution is read in the background.
+    volume = ProgressiveLoader([fileName], progressive)
 
     # Outline
     outlineData = vtk.vtkOutlineFilter()
-    outlineData.SetInputConnection(reader.GetOutputPort())
+    outlineData.SetInputConnection(volume.output_port())
     outlineData.Update()
 
     mapOutline = vtk.vtkPolyDataMapper()
@@ -45,43 +56,67 @@ def main():
     bwLut.SetValueRange(0, 1)
     bwLut.Build()  # effective built
 
+    # Slice numbers are voxels of the full resolution volume.
+    geometry = read_geometry(fileName)
+    extent, spacing, origin = geometry
+    x0, x1, y0, y1, z0, z1 = extent
+
     #Defining planes    
 
     # Axial plane
-    ap = int(input("Input slice number for axial plane from range 0-206: "))
+    ap = int(input("Input slice number for axial plane from range {:d}-{:d}: ".format(z0, z1)))
     
     axialColors = vtk.vtkImageMapToColors()
-    axialColors.SetInputConnection(reader.GetOutputPort())
+    axialColors.SetInputConnection(volume.output_port())
     axialColors.SetLookupTable(bwLut)
     axialColors.Update()
 
     axial = vtk.vtkImageActor()
     axial.GetMapper().SetInputConnection(axialColors.GetOutputPort())
-    axial.SetDisplayExtent(0, 255, 0, 255, ap, ap)
 
     # Sagittal plane
-    sp = int(input("Input slice number for sagittal plane from range 0-255: "))
+    sp = int(input("Input slice number for sagittal plane from range {:d}-{:d}: ".format(x0, x1)))
     
     sagittalColors = vtk.vtkImageMapToColors()
-    sagittalColors.SetInputConnection(reader.GetOutputPort())
+    sagittalColors.SetInputConnection(volume.output_port())
     sagittalColors.SetLookupTable(bwLut)
     sagittalColors.Update()
 
     sagittal = vtk.vtkImageActor()
     sagittal.GetMapper().SetInputConnection(sagittalColors.GetOutputPort())
-    sagittal.SetDisplayExtent(sp, sp, 0, 255, 0, 206)
 
     # Coronal plane
-    cp = int(input("Input slice number for coronal plane from range 0-255: "))
+    cp = int(input("Input slice number for coronal plane from range {:d}-{:d}: ".format(y0, y1)))
     
     coronalColors = vtk.vtkImageMapToColors()
-    coronalColors.SetInputConnection(reader.GetOutputPort())
+    coronalColors.SetInputConnection(volume.output_port())
     coronalColors.SetLookupTable(bwLut)
     coronalColors.Update()
 
     coronal = vtk.vtkImageActor()
     coronal.GetMapper().SetInputConnection(coronalColors.GetOutputPort())
-    coronal.SetDisplayExtent(0, 255, cp, cp, 0, 206)
+
+    # The slice numbers are full resolution voxels, scaled to the level shown.
+    def set_display_extents(factor, result=None):
+        whole = volume.image().GetExtent()
+        axial.SetDisplayExtent(level_extent((x0, x1, y0, y1, ap, ap), factor, whole))
+        sagittal.SetDisplayExtent(level_extent((sp, sp, y0, y1, z0, z1), factor, whole))
+        coronal.SetDisplayExtent(level_extent((x0, x1, cp, cp, z0, z1), factor, whole))
+
+    set_display_extents(volume.factor)
+
+    # Oblique planes through the chosen slices instead, see Oblique_Reslice.py.
+    # They are cut in world coordinates and follow every pyramid level as they are.
+    if oblique:
+        interaction = ObliqueInteraction(renWin)
+        center = [origin[i] + 0.5 * (extent[2 * i] + extent[2 * i + 1]) * spacing[i] for i in range(3)]
+        slices = []
+        for orientation, axis, number in (('axial', 2, ap), ('sagittal', 0, sp), ('coronal', 1, cp)):
+            plane_center = list(center)
+            plane_center[axis] = origin[axis] + number * spacing[axis]
+            plane = ObliquePlane(geometry, orientation, plane_center)
+            slices.append((plane, plane.create_actor(volume.output_port(), bwLut)))
+        (_, axial), (_, sagittal), (_, coronal) = slices
 
     # Initial view of data
     aCamera = vtk.vtkCamera()
@@ -105,10 +140,34 @@ def main():
     aRenderer.ResetCamera()
     aRenderer.ResetCameraClippingRange()
 
+    if hud or perf_log:
+        FrameTimeHUD(renWin, aRenderer, perf_log, hud).attach(iren)
+
+    if oblique:
+        for plane, actor in slices:
+            interaction.add(plane, aRenderer, actor)
+        interaction.attach(iren)
+
+    volume.attach(iren, renWin, None if oblique else set_display_extents)
+
     # Interact with the data.
     renWin.Render()
     iren.Initialize()
     iren.Start()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # Show the frame-time overlay ('h' toggles it) and log every frame to a CSV file.
+    hud = False
+    perf_log = None     # e.g. 'perf_log.csv'
+
+    # Show the coarsest pyramid level first, if Volume_Pyramid.py has been run.
+    progressive = True
+
+    # Cut the volume with oblique planes: ctrl + drag turns the plane under the
+    # mouse, ctrl + mouse wheel moves it, 'o' resets all planes.
+    oblique = False
+
+    # Atlas folder, the first argument or MDV_DATASET_ROOT if given.
+    root = sys.argv[1] if len(sys.argv) > 1 else None
+
+    main(hud, perf_log, progressive, root, oblique)
\ No newline at end of file
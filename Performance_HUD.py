@@ -0,0 +1,127 @@
+import atexit
+import collections
+import csv
+import time
+
+import vtk
+
+# Frame-time overlay and performance log shared by all viewers.
+#
+# Every render of the window is timed between its StartEvent and EndEvent. The
+# overlay shows the current FPS and frame time with rolling p50/p95/p99 over the
+# last frames, and every sample is appended to a CSV file (if given) together
+# with the interaction that caused the frame: rotate, pan, zoom, slider drag,
+# plane move or idle. Press 'h' to show or hide the overlay.
+
+class FrameTimeHUD:
+    def __init__(self, render_window, renderer, log_file=None, visible=True, window=240, key='h'):
+        self.render_window = render_window
+        self.key = key
+        self.samples = collections.deque(maxlen=window)
+        self.interaction = 'idle'
+        self.widget_interaction = None
+        self.one_shot = False
+        self.session_start = time.perf_counter()
+        self.frame_start = None
+
+        self.text = vtk.vtkTextActor()
+        self.text.GetTextProperty().SetFontFamilyToCourier()
+        self.text.GetTextProperty().SetFontSize(14)
+        self.text.GetTextProperty().SetColor(1.0, 1.0, 0.0)
+        self.text.GetTextProperty().SetBackgroundColor(0.0, 0.0, 0.0)
+        self.text.GetTextProperty().SetBackgroundOpacity(0.6)
+        self.text.GetTextProperty().SetJustificationToRight()
+        self.text.GetPositionCoordinate().SetCoordinateSystemToNormalizedViewport()
+        self.text.SetPosition(0.99, 0.01)
+        self.text.SetVisibility(visible)
+        renderer.AddViewProp(self.text)
+
+        self.log = None
+        if log_file:
+            self.log_file = open(log_file, 'w', newline='')
+            self.log = csv.writer(self.log_file)
+            self.log.writerow(['time_s', 'frame_ms', 'fps', 'interaction'])
+            atexit.register(self.close)
+
+        render_window.AddObserver('StartEvent', self.on_start)
+        render_window.AddObserver('EndEvent', self.on_end)
+
+    def attach(self, interactor):
+        # Low priority, so that widgets handling the same press come first.
+        for event, interaction in (('LeftButtonPressEvent', 'rotate'),
+                                   ('MiddleButtonPressEvent', 'pan'),
+                                   ('RightButtonPressEvent', 'zoom')):
+            interactor.AddObserver(event, self.start_interaction(interaction), -1.0)
+        for event in ('LeftButtonReleaseEvent', 'MiddleButtonReleaseEvent', 'RightButtonReleaseEvent'):
+            interactor.AddObserver(event, self.end_interaction, -1.0)
+        for event in ('MouseWheelForwardEvent', 'MouseWheelBackwardEvent'):
+            interactor.AddObserver(event, self.wheel, -1.0)
+        interactor.AddObserver('KeyPressEvent', self.toggle)
+        interactor.AddObserver('ExitEvent', lambda caller, ev: self.close())
+
+    # Tag the frames rendered while the widget is being dragged.
+    def watch(self, widget, interaction):
+        def start(caller, ev):
+            self.widget_interaction = interaction
+
+        def end(caller, ev):
+            self.widget_interaction = None
+
+        widget.AddObserver('StartInteractionEvent', start)
+        widget.AddObserver('EndInteractionEvent', end)
+
+    def start_interaction(self, interaction):
+        def callback(caller, ev):
+            self.interaction = interaction
+        return callback
+
+    def end_interaction(self, caller, ev):
+        self.interaction = 'idle'
+
+    def wheel(self, caller, ev):
+        self.interaction = 'zoom'
+        self.one_shot = True
+
+    def toggle(self, caller, ev):
+        if caller.GetKeySym() == self.key:
+            self.text.SetVisibility(not self.text.GetVisibility())
+            self.render_window.Render()
+
+    def on_start(self, caller, ev):
+        self.frame_start = time.perf_counter()
+
+    def on_end(self, caller, ev):
+        if self.frame_start is None:
+            return
+        now = time.perf_counter()
+        frame_time = now - self.frame_start
+        self.frame_start = None
+        self.samples.append(frame_time)
+
+        interaction = self.widget_interaction or self.interaction
+        if self.one_shot:
+            self.interaction = 'idle'
+            self.one_shot = False
+
+        fps = 1.0 / frame_time if frame_time > 0 else 0.0
+        if self.log is not None:
+            self.log.writerow(['{:.4f}'.format(now - self.session_start), '{:.3f}'.format(frame_time * 1000),
+                               '{:.1f}'.format(fps), interaction])
+
+        # The text is shown with the next frame, updating it does not trigger a render.
+        if self.text.GetVisibility():
+            p50, p95, p99 = percentiles(self.samples, (50, 95, 99))
+            self.text.SetInput('{:6.1f} FPS {:7.2f} ms  {:s}\np50 {:6.2f}  p95 {:6.2f}  p99 {:6.2f} ms'.format(
+                fps, frame_time * 1000, interaction, p50 * 1000, p95 * 1000, p99 * 1000))
+
+    def close(self):
+        if self.log is not None:
+            self.log_file.close()
+            self.log = None
+
+# Nearest-rank percentiles of the samples.
+def percentiles(samples, ranks):
+    ordered = sorted(samples)
+    if not ordered:
+        return [0.0 for _ in ranks]
+    return [ordered[min(len(ordered) - 1, max(0, int(round(r / 100 * len(ordered))) - 1))] for r in ranks]
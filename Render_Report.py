@@ -0,0 +1,187 @@
+import argparse
+import time
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+from Atlas_Paths import dataset_root
+from Thread_Settings import add_thread_arguments, apply_thread_settings
+from Tissue_Scene import SOURCES, create_tissue_actors, default_tissues, reset_camera
+
+# Collects per-actor render statistics of a tissue scene: geometry size, an
+# estimate of the GPU memory the OpenGL mapper uploads and the share of the
+# frame time every actor is responsible for. The report can be printed from the
+# command line or toggled inside the viewers with the 'm' key ('i' belongs to
+# the orientation marker widget, which it turns on and off).
+
+# Bytes per vertex and per index the OpenGL mapper uploads (float positions and
+# normals, unsigned char RGBA colours, 32 bit indices).
+POSITION_BYTES = 12
+NORMAL_BYTES = 12
+COLOR_BYTES = 4
+INDEX_BYTES = 4
+
+def main(source, tissues, root, frames):
+    renderer = vtk.vtkRenderer()
+    render_window = vtk.vtkRenderWindow()
+    render_window.SetOffScreenRendering(1)
+    render_window.AddRenderer(renderer)
+    render_window.SetSize(1024, 720)
+
+    actors = create_tissue_actors(source, tissues, root)
+    for actor in actors.values():
+        renderer.AddActor(actor)
+    reset_camera(source, renderer)
+    render_window.Render()
+
+    rows = render_report(render_window, actors, frames)
+    print(format_report(rows))
+
+def actor_statistics(actor):
+    mapper = actor.GetMapper()
+    mapper.Update()
+    polydata = mapper.GetInput()
+
+    triangles = count_triangles(polydata.GetPolys()) + count_triangles(polydata.GetStrips())
+
+    # Number of strips the stripper produces for this geometry.
+    if polydata.GetNumberOfPolys() == 0:
+        strips = polydata.GetNumberOfStrips()
+    else:
+        stripper = vtk.vtkStripper()
+        stripper.SetInputData(polydata)
+        stripper.Update()
+        strips = stripper.GetOutput().GetNumberOfStrips()
+
+    points = polydata.GetNumberOfPoints()
+    vertex_bytes = POSITION_BYTES
+    if polydata.GetPointData().GetNormals() is not None:
+        vertex_bytes += NORMAL_BYTES
+    if mapper.GetScalarVisibility() and polydata.GetPointData().GetScalars() is not None:
+        vertex_bytes += COLOR_BYTES
+
+    return {
+        'points': points,
+        'triangles': triangles,
+        'strips': strips,
+        'gpu_bytes': points * vertex_bytes + triangles * 3 * INDEX_BYTES,
+        'translucent': bool(actor.HasTranslucentPolygonalGeometry()),
+        'opacity': actor.GetProperty().GetOpacity(),
+    }
+
+# Polygons and strips with n points both make n - 2 triangles.
+def count_triangles(cells):
+    if cells.GetNumberOfCells() == 0:
+        return 0
+    sizes = np.diff(vtk_to_numpy(cells.GetOffsetsArray()))
+    return int(np.maximum(sizes - 2, 0).sum())
+
+def measure_frame_shares(render_window, actors, frames=10):
+    """
+    Measures which share of the frame time each actor is responsible for.
+
+    Every actor is rendered on its own and the time of an empty frame is
+    subtracted, the remaining cost is then normalized over all actors. This is the
+    isolated cost of each actor, overlap and depth culling between tissues are
+    not taken into account. The timers are read after the GPU has finished the
+    frames, so the times are those of the GPU, not of submitting the commands.
+    """
+    visibility = {name: actor.GetVisibility() for name, actor in actors.items()}
+
+    def time_frames():
+        render_window.Render()
+        render_window.WaitForCompletion()
+        start = time.perf_counter()
+        for _ in range(frames):
+            render_window.Render()
+        render_window.WaitForCompletion()
+        return (time.perf_counter() - start) / frames
+
+    for actor in actors.values():
+        actor.VisibilityOff()
+    empty = time_frames()
+
+    costs = dict()
+    for name, actor in actors.items():
+        actor.VisibilityOn()
+        costs[name] = max(time_frames() - empty, 0.0)
+        actor.VisibilityOff()
+
+    for name, actor in actors.items():
+        actor.SetVisibility(visibility[name])
+    render_window.Render()
+
+    total = sum(costs.values()) or 1.0
+    return {name: (cost, cost / total) for name, cost in costs.items()}
+
+def render_report(render_window, actors, frames=10):
+    shares = measure_frame_shares(render_window, actors, frames)
+    rows = []
+    for name, actor in actors.items():
+        row = actor_statistics(actor)
+        row['name'] = name
+        row['frame_time'], row['frame_share'] = shares[name]
+        rows.append(row)
+    rows.sort(key=lambda r: r['frame_share'], reverse=True)
+    return rows
+
+def format_report(rows):
+    res = ['{:>24s} {:>9s} {:>7s} {:>9s} {:>9s} {:>7s} {:>8s} {:>6s}'.format(
+        'Tissue', 'Triangles', 'Strips', 'Points', 'GPU KiB', 'Opacity', 'Time ms', 'Share')]
+    for r in rows:
+        res.append('{:>24s} {:>9d} {:>7d} {:>9d} {:>9.0f} {:>6.2f}{:1s} {:>8.2f} {:>6.1%}'.format(
+            r['name'], r['triangles'], r['strips'], r['points'], r['gpu_bytes'] / 1024,
+            r['opacity'], '*' if r['translucent'] else ' ', r['frame_time'] * 1000, r['frame_share']))
+    res.append('{:>24s} {:>9d} {:>7d} {:>9d} {:>9.0f}'.format(
+        'Total', sum(r['triangles'] for r in rows), sum(r['strips'] for r in rows),
+        sum(r['points'] for r in rows), sum(r['gpu_bytes'] for r in rows) / 1024))
+    res.append('* translucent')
+    return '\n'.join(res)
+
+# Key press callback for the viewers. Pressing 'm' measures the scene, prints
+# the report and shows it on top of the renderer, pressing it again hides it.
+class RenderReportToggle:
+    def __init__(self, render_window, renderer, actors, key='m', frames=5):
+        self.render_window = render_window
+        self.actors = actors
+        self.key = key
+        self.frames = frames
+
+        self.text = vtk.vtkTextActor()
+        self.text.GetTextProperty().SetFontFamilyToCourier()
+        self.text.GetTextProperty().SetFontSize(12)
+        self.text.GetTextProperty().SetColor(0, 0, 0)
+        self.text.GetTextProperty().SetVerticalJustificationToTop()
+        self.text.GetPositionCoordinate().SetCoordinateSystemToNormalizedViewport()
+        self.text.SetPosition(0.01, 0.99)
+        self.text.VisibilityOff()
+        renderer.AddViewProp(self.text)
+
+    def attach(self, interactor):
+        interactor.AddObserver('KeyPressEvent', self)
+
+    def __call__(self, caller, ev):
+        if caller.GetKeySym() != self.key:
+            return
+        if self.text.GetVisibility():
+            self.text.VisibilityOff()
+        else:
+            report = format_report(render_report(self.render_window, self.actors, self.frames))
+            print(report)
+            self.text.SetInput(report)
+            self.text.VisibilityOn()
+        self.render_window.Render()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report the render cost of every tissue actor.')
+    parser.add_argument('tissues', nargs='*', help='Tissue names, all tissues of the source by default.')
+    parser.add_argument('--source', choices=sorted(SOURCES), default='slices',
+                        help='Build the actors like 3D_From_Slices.py (slices) or 3D_head.py (models).')
+    parser.add_argument('--root', default=dataset_root(), help='Root folder of the atlas.')
+    parser.add_argument('--frames', type=int, default=10, help='Frames rendered per timing.')
+    add_thread_arguments(parser)
+    args = parser.parse_args()
+    apply_thread_settings(args.threads, args.smp_backend)
+
+    main(args.source, args.tissues or default_tissues(args.source), args.root, args.frames)
@@ -0,0 +1,261 @@
+import argparse
+import collections
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+from Atlas_Paths import dataset_root
+from Performance_HUD import percentiles
+from Thread_Settings import add_thread_arguments, apply_thread_settings
+from Tissue_Scene import SOURCES, create_tissue_actors, default_tissues, orbit_camera, reset_camera
+
+# Local render server for thin clients.
+#
+# The head scene of 3D_From_Slices.py or 3D_head.py is rendered offscreen and
+# served as JPEG frames over HTTP. Every frame request carries the whole view:
+#   GET /frame?azimuth=30&elevation=10&zoom=1.2&opacity=Mandible:0.3,Hyoid:0
+# Camera angles, zoom and opacities are quantized and the encoded frames are
+# cached by that quantized state, so repeated views are served without
+# rendering. All VTK work runs on a single render thread, requests are handled
+# concurrently. GET / serves a small viewer page, GET /stats the latencies.
+
+PAGE = '''<!DOCTYPE html>
+<html><head><title>Head and Neck Reconstruction</title>
+<style>body{margin:0;background:#c9d6ff;font-family:sans-serif}img{display:block;cursor:grab}
+#stats{position:fixed;top:4px;right:8px;font-size:12px}</style></head>
+<body><img id="frame"><div id="stats"></div>
+<script>
+var view = {azimuth: 0, elevation: 0, zoom: 1}, drag = null, img = document.getElementById('frame');
+function update() {
+  var t = performance.now();
+  img.onload = function() { document.getElementById('stats').textContent = (performance.now() - t).toFixed(1) + ' ms'; };
+  img.src = '/frame?azimuth=' + view.azimuth + '&elevation=' + view.elevation + '&zoom=' + view.zoom;
+}
+img.onmousedown = function(e) { drag = [e.clientX, e.clientY]; e.preventDefault(); };
+document.onmouseup = function() { drag = null; };
+document.onmousemove = function(e) {
+  if (!drag) return;
+  view.azimuth -= (e.clientX - drag[0]) * 0.5;
+  view.elevation = Math.max(-89, Math.min(89, view.elevation + (e.clientY - drag[1]) * 0.5));
+  drag = [e.clientX, e.clientY];
+  update();
+};
+img.onwheel = function(e) { view.zoom = Math.max(0.2, view.zoom * (e.deltaY < 0 ? 1.1 : 0.9)); update(); e.preventDefault(); };
+update();
+</script></body></html>
+'''
+
+class SceneRenderer:
+    def __init__(self, source, tissues, root, size, quality, angle_step, cache_size):
+        self.source = source
+        self.tissues = tissues
+        self.root = root
+        self.size = size
+        self.quality = quality
+        self.angle_step = angle_step
+        self.cache_size = cache_size
+
+        self.cache = collections.OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=1000)
+        self.render_times = collections.deque(maxlen=1000)
+        self.requests = 0
+        self.hits = 0
+
+        # OpenGL contexts belong to one thread, so everything VTK runs here.
+        self.render_thread = ThreadPoolExecutor(max_workers=1)
+        self.render_thread.submit(self.build).result()
+
+    def build(self):
+        self.render_window = vtk.vtkRenderWindow()
+        self.render_window.SetOffScreenRendering(1)
+        self.render_window.SetSize(*self.size)
+        self.renderer = vtk.vtkRenderer()
+        self.render_window.AddRenderer(self.renderer)
+
+        colors = vtk.vtkNamedColors()
+        colors.SetColor("BkgColor", [201, 214, 255, 255])
+        self.renderer.SetBackground(colors.GetColor3d('BkgColor'))
+
+        self.actors = create_tissue_actors(self.source, self.tissues, self.root)
+        self.default_opacity = {name: actor.GetProperty().GetOpacity() for name, actor in self.actors.items()}
+        for actor in self.actors.values():
+            self.renderer.AddActor(actor)
+        reset_camera(self.source, self.renderer)
+
+        self.initial_camera = vtk.vtkCamera()
+        self.initial_camera.DeepCopy(self.renderer.GetActiveCamera())
+
+        self.window_to_image = vtk.vtkWindowToImageFilter()
+        self.window_to_image.SetInput(self.render_window)
+        self.window_to_image.ReadFrontBufferOff()
+        self.writer = vtk.vtkJPEGWriter()
+        self.writer.SetInputConnection(self.window_to_image.GetOutputPort())
+        self.writer.SetQuality(self.quality)
+        self.writer.WriteToMemoryOn()
+
+    # Parses and quantizes the query of a frame request into a hashable state.
+    # Raises ValueError for a value that is not a finite number.
+    def view_state(self, query):
+        def finite(key, text):
+            try:
+                value = float(text)
+            except ValueError:
+                value = math.nan
+            if not math.isfinite(value):
+                raise ValueError('{:s} must be a finite number, not "{:s}"'.format(key, text))
+            return value
+
+        def number(key, default):
+            return finite(key, query.get(key, [str(default)])[0])
+
+        step = self.angle_step
+        azimuth = round(number('azimuth', 0) / step) * step % 360
+        elevation = max(-89.0, min(89.0, round(number('elevation', 0) / step) * step))
+        zoom = max(0.05, round(number('zoom', 1) * 20) / 20)
+
+        opacity = dict(self.default_opacity)
+        for item in ','.join(query.get('opacity', [])).split(','):
+            if ':' in item:
+                name, value = item.rsplit(':', 1)
+                if name in opacity:
+                    opacity[name] = max(0.0, min(1.0, round(finite('opacity of ' + name, value) * 20) / 20))
+        return azimuth, elevation, zoom, tuple(sorted(opacity.items()))
+
+    def frame(self, state):
+        with self.cache_lock:
+            data = self.cache.get(state)
+            if data is not None:
+                self.cache.move_to_end(state)
+                return data, True, 0.0
+        return self.render_thread.submit(self.render, state).result()
+
+    def render(self, state):
+        # Another request may have rendered the same view in the meantime.
+        with self.cache_lock:
+            if state in self.cache:
+                return self.cache[state], True, 0.0
+
+        start = time.perf_counter()
+        azimuth, elevation, zoom, opacity = state
+        for name, value in opacity:
+            self.actors[name].GetProperty().SetOpacity(value)
+            self.actors[name].SetVisibility(value > 0)
+
+        orbit_camera(self.renderer, self.initial_camera, azimuth, elevation, zoom)
+        self.render_window.Render()
+        self.window_to_image.Modified()
+        self.writer.Write()
+        data = vtk_to_numpy(self.writer.GetResult()).tobytes()
+        render_time = time.perf_counter() - start
+
+        with self.cache_lock:
+            self.cache[state] = data
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        with self.stats_lock:
+            self.render_times.append(render_time)
+        return data, False, render_time
+
+    def record(self, latency, hit):
+        with self.stats_lock:
+            self.requests += 1
+            self.hits += hit
+            self.latencies.append(latency)
+
+    def stats(self):
+        with self.stats_lock:
+            latency = percentiles(self.latencies, (50, 95, 99))
+            render = percentiles(self.render_times, (50, 95, 99))
+            return {
+                'requests': self.requests,
+                'cache_hits': self.hits,
+                'cached_frames': len(self.cache),
+                'latency_ms': dict(zip(('p50', 'p95', 'p99'), [round(v * 1000, 2) for v in latency])),
+                'render_ms': dict(zip(('p50', 'p95', 'p99'), [round(v * 1000, 2) for v in render])),
+            }
+
+def make_handler(scene):
+    class Handler(BaseHTTPRequestHandler):
+        latency = 0.0
+
+        def do_GET(self):
+            start = time.perf_counter()
+            url = urlparse(self.path)
+            if url.path == '/frame':
+                try:
+                    state = scene.view_state(parse_qs(url.query))
+                except ValueError as e:
+                    self.latency = time.perf_counter() - start
+                    self.send_error(400, str(e))
+                    return
+                data, hit, render_time = scene.frame(state)
+                latency = self.latency = time.perf_counter() - start
+                scene.record(latency, hit)
+                self.send(data, 'image/jpeg', {'X-Cache': 'hit' if hit else 'miss',
+                                               'X-Render-Time': '{:.2f}'.format(render_time * 1000),
+                                               'X-Latency': '{:.2f}'.format(latency * 1000)})
+            elif url.path == '/stats':
+                self.send(json.dumps(scene.stats()).encode(), 'application/json')
+            elif url.path == '/tissues':
+                self.send(json.dumps(scene.default_opacity).encode(), 'application/json')
+            elif url.path == '/':
+                self.send(PAGE.encode(), 'text/html')
+            else:
+                self.send_error(404)
+
+        def send(self, data, content_type, headers=None):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Cache-Control', 'no-store')
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_request(self, code='-', size='-'):
+            if self.path.startswith('/frame'):
+                print('{:s} {:s} {:.1f} ms'.format(self.client_address[0], self.path, self.latency * 1000))
+
+    return Handler
+
+def main(source, tissues, root, host, port, size, quality, angle_step, cache_size):
+    print('Building the scene ...')
+    scene = SceneRenderer(source, tissues, root, size, quality, angle_step, cache_size)
+    server = ThreadingHTTPServer((host, port), make_handler(scene))
+    print('Serving the head scene on http://{:s}:{:d}/'.format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(scene.stats()))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve rendered frames of the head scene over HTTP.')
+    parser.add_argument('tissues', nargs='*', help='Tissue names, all tissues of the source by default.')
+    parser.add_argument('--source', choices=sorted(SOURCES), default='slices',
+                        help='Build the scene like 3D_From_Slices.py (slices) or 3D_head.py (models).')
+    parser.add_argument('--root', default=dataset_root(), help='Root folder of the atlas.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--size', type=int, nargs=2, default=[800, 600])
+    parser.add_argument('--quality', type=int, default=85, help='JPEG quality.')
+    parser.add_argument('--angle-step', type=float, default=2.0, help='Camera angles are quantized to this step.')
+    parser.add_argument('--cache-size', type=int, default=2000, help='Frames kept in the cache.')
+    add_thread_arguments(parser)
+    args = parser.parse_args()
+    apply_thread_settings(args.threads, args.smp_backend)
+
+    main(args.source, args.tissues or default_tissues(args.source), args.root, args.host, args.port,
+         args.size, args.quality, args.angle_step, args.cache_size)
@@ -0,0 +1,134 @@
+import argparse
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import vtk
+
+from Atlas_Paths import dataset_root, grey_file, label_file
+from Colour_Slices import create_head_lut, create_window_level_lut
+from Volume_IO import read_labels, read_volume, lut_to_numpy, map_scalars
+
+# Exports every axial, sagittal and coronal slice of the grayscale volume,
+# blended with its label overlay, as PNG tiles for the teaching atlas.
+#
+# The slices are cut straight out of the volume arrays and coloured with the
+# same window/level and create_head_lut() colours as Colour_Slices.py, using
+# array operations on whole blocks of slices. The tiles are written from a
+# process pool, no VTK pipeline is involved per slice.
+
+# Axis of the (z, y, x) volume array each plane is cut along.
+AXES = {'axial': 0, 'coronal': 1, 'sagittal': 2}
+
+# Volumes and colour tables, set once per worker process by init_worker().
+_grey = None
+_labels = None
+_grey_table = None
+_label_table = None
+_overlay_alpha = None
+
+def main(root, output_dir, planes, window, level, overlay_alpha, workers, chunk, compression):
+    grey, _, _ = read_volume(grey_file(root))
+    labels, _, _ = read_labels(label_file(root))
+    if grey.shape != labels.shape:
+        print('The grayscale {} and label {} volumes differ in size!'.format(grey.shape, labels.shape))
+        return
+
+    # Same lookup tables as Colour_Slices.py.
+    wllut = create_window_level_lut(window, level)
+    lut = create_head_lut(vtk.vtkNamedColors())
+
+    jobs = []
+    for plane in planes:
+        os.makedirs(os.path.join(output_dir, plane), exist_ok=True)
+        n = grey.shape[AXES[plane]]
+        for start in range(0, n, chunk):
+            jobs.append((plane, start, min(start + chunk, n), output_dir, compression))
+
+    start = time.perf_counter()
+    tiles = 0
+    size = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(grey, labels, lut_to_numpy(wllut), lut_to_numpy(lut), overlay_alpha)) as executor:
+        for count, written in executor.map(export_slices, jobs):
+            tiles += count
+            size += written
+
+    elapsed = time.perf_counter() - start
+    print('Wrote {:d} tiles ({:.1f} MiB) to {:s} in {:.2f} s, {:.0f} tiles/s'.format(
+        tiles, size / 2 ** 20, output_dir, elapsed, tiles / elapsed if elapsed else 0))
+
+def init_worker(grey, labels, grey_table, label_table, overlay_alpha):
+    global _grey, _labels, _grey_table, _label_table, _overlay_alpha
+    _grey = grey
+    _labels = labels
+    _grey_table = grey_table
+    _label_table = label_table
+    _overlay_alpha = overlay_alpha
+
+def export_slices(job):
+    plane, start, stop, output_dir, compression = job
+    axis = AXES[plane]
+    index = [slice(None)] * 3
+    index[axis] = slice(start, stop)
+
+    # Move the slice axis to the front, so that rgb[i] is slice start + i.
+    grey = np.moveaxis(_grey[tuple(index)], axis, 0)
+    labels = np.moveaxis(_labels[tuple(index)], axis, 0)
+    rgb = composite(grey, labels, _grey_table, _label_table, _overlay_alpha)
+
+    written = 0
+    for i, tile in enumerate(rgb):
+        file_name = os.path.join(output_dir, plane, '{}_{:04d}.png'.format(plane, start + i))
+        # Image rows run bottom to top in VTK, PNG rows top to bottom.
+        written += write_png(file_name, tile[::-1], compression)
+    return stop - start, written
+
+# Blends the label colours over the window/levelled grayscale. The overlay
+# alpha is scaled by the alpha of the label colour, so the background label
+# (alpha 0 in create_head_lut()) leaves the grayscale untouched.
+def composite(grey, labels, grey_table, label_table, overlay_alpha):
+    grey_rgba = map_scalars(grey, *grey_table)
+    label_rgba = map_scalars(labels, *label_table)
+
+    alpha = label_rgba[..., 3:4].astype(np.float32) * (overlay_alpha / 255.0)
+    rgb = grey_rgba[..., :3] * (1.0 - alpha) + label_rgba[..., :3] * alpha
+    return np.rint(rgb).astype(np.uint8)
+
+# Minimal 8 bit RGB PNG encoder, returns the file size.
+def write_png(file_name, rgb, compression=6):
+    height, width, _ = rgb.shape
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgb.reshape(height, width * 3)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    png = b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)),
+        chunk(b'IDAT', zlib.compress(raw.tobytes(), compression)),
+        chunk(b'IEND', b''),
+    ])
+    with open(file_name, 'wb') as f:
+        f.write(png)
+    return len(png)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export all slices with their label overlay as PNG tiles.')
+    parser.add_argument('--root', default=dataset_root(), help='Root folder of the atlas.')
+    parser.add_argument('--output', default='./slice_atlas')
+    parser.add_argument('--planes', nargs='+', choices=list(AXES), default=list(AXES))
+    parser.add_argument('--window', type=float, help='Grey window, the fixed table of Colour_Slices.py by default.')
+    parser.add_argument('--level', type=float, help='Grey level, the fixed table of Colour_Slices.py by default.')
+    parser.add_argument('--overlay-alpha', type=float, default=0.5, help='Opacity of the label overlay.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk', type=int, default=16, help='Slices per job.')
+    parser.add_argument('--compression', type=int, default=6, help='zlib level of the PNG files (0-9).')
+    args = parser.parse_args()
+
+    main(args.root, args.output, args.planes, args.window, args.level, args.overlay_alpha,
+         args.workers, args.chunk, args.compression)
@@ -0,0 +1,276 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, numpy_to_vtkIdTypeArray, vtk_to_numpy
+
+from Atlas_Paths import dataset_root, grey_file, label_file, model_file
+from Label_Index import load_label_index, source_signature
+from Thread_Settings import add_thread_arguments, apply_thread_settings, process_pool
+from Tissue_Scene import default_tissues, scene_parameters, scene_signatures, source_module
+
+# Tissue outlines on the slices of the slice viewers, cut from the meshes of
+# 3D_From_Slices.py ('slices') or the atlas models of 3D_head.py ('models').
+#
+# The triangles of every mesh are stored in the volume coordinates of the atlas
+# next to the label volume as <name>.<source>.meshes.npz, and rebuilt when the
+# volumes, the models, the tissue list or the tissue parameters change. The meshes of
+# 3D_From_Slices.py are taken back through the inverse of its slice order
+# transform; the models of 3D_head.py are used as read, before the transform
+# the viewer shows them with, so they have to be in the space of the volumes.
+#
+# Every mesh gets a MeshSlicer, built once: along each axis the triangles are
+# sorted into bins of about their own size, so the triangles a slice can cut
+# are read from one bin and a cut costs about as much as the number of cut
+# triangles, not the size of the mesh. The segments are computed for all cut
+# triangles of a mesh at once with numpy.
+#
+#   python Slice_Contours.py Mandible Hyoid
+# times the cut of every slice with and without the bins.
+
+# Width of the outlines in pixels.
+LINE_WIDTH = 2.0
+
+# Bin size along an axis, in mean triangle sizes along that axis.
+BIN_FACTOR = 2.0
+
+def main(source, tissues, root, flying_edges, decimate, workers):
+    start = time.perf_counter()
+    meshes = load_meshes(source, tissues, root, flying_edges, decimate, workers)
+    print('{:d} meshes, {:d} triangles, ready in {:.2f} s'.format(
+        len(meshes), sum(len(t) for _, t, _ in meshes.values()), time.perf_counter() - start))
+
+    start = time.perf_counter()
+    slicers = [slicer for slicer, _ in create_slicers(meshes)]
+    print('Bins built in {:.3f} s'.format(time.perf_counter() - start))
+
+    index = load_label_index(label_file(root))
+    for axis, name in enumerate(('sagittal', 'coronal', 'axial')):
+        positions = [index.origin[axis] + i * index.spacing[axis] for i in range(index.shape[2 - axis])]
+        normal = np.eye(3)[axis]
+        binned = full = 0.0
+        segments = 0
+        for position in positions:
+            start = time.perf_counter()
+            segments += sum(len(slicer.cut_axis(axis, position)) for slicer in slicers)
+            binned += time.perf_counter() - start
+            start = time.perf_counter()
+            for slicer in slicers:
+                slicer.cut_plane(normal * position, normal)
+            full += time.perf_counter() - start
+        print('{:>9s}: {:4d} slices, {:7.0f} segments per slice, {:6.2f} ms per slice ({:6.2f} ms without bins)'.format(
+            name, len(positions), segments / len(positions), 1000 * binned / len(positions), 1000 * full / len(positions)))
+
+# Plane cuts of one triangle mesh.
+class MeshSlicer:
+    def __init__(self, points, triangles):
+        self.points = points
+        self.triangles = triangles
+        corners = points[triangles]                      # (triangles, 3 corners, 3 coordinates)
+        self.lo = corners.min(axis=1)
+        self.hi = corners.max(axis=1)
+        self.bins = [self.build_bins(a) for a in range(3)]
+
+    # Bins along one axis as (start, size, offsets, triangle ids): the ids of
+    # bin b are ids[offsets[b]:offsets[b + 1]], a triangle is in every bin it spans.
+    def build_bins(self, axis):
+        lo, hi = self.lo[:, axis], self.hi[:, axis]
+        if not len(lo):
+            return 0.0, 1.0, np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        start = float(lo.min())
+        size = max(BIN_FACTOR * float(np.mean(hi - lo)), (float(hi.max()) - start) / 65536, 1e-6)
+        first = ((lo - start) / size).astype(np.int64)
+        last = ((hi - start) / size).astype(np.int64)
+        count = last - first + 1
+
+        ids = np.repeat(np.arange(len(lo)), count)
+        bins = np.repeat(first, count) + np.arange(len(ids)) - np.repeat(np.cumsum(count) - count, count)
+        order = np.argsort(bins, kind='stable')
+        offsets = np.searchsorted(bins[order], np.arange(int(last.max()) + 2))
+        return start, size, offsets, ids[order]
+
+    # Segments (n, 2, 3) where the plane at position along an axis cuts the mesh.
+    def cut_axis(self, axis, position):
+        start, size, offsets, ids = self.bins[axis]
+        b = int(np.floor((position - start) / size))
+        if b < 0 or b >= len(offsets) - 1:
+            return np.zeros((0, 2, 3), dtype=np.float32)
+        candidates = ids[offsets[b]:offsets[b + 1]]
+        candidates = candidates[(self.lo[candidates, axis] <= position) & (self.hi[candidates, axis] >= position)]
+        corners = self.points[self.triangles[candidates]]
+        return cut_triangles(corners, corners[:, :, axis] - position)
+
+    # Segments where any plane, through origin with the given normal, cuts the
+    # mesh. The bins do not help here, all triangles are tested.
+    def cut_plane(self, origin, normal):
+        corners = self.points[self.triangles]
+        distance = (corners - np.asarray(origin, dtype=np.float32)) @ np.asarray(normal, dtype=np.float32)
+        return cut_triangles(corners, distance)
+
+# Segments where the zero level of the corner distances crosses the triangles.
+def cut_triangles(corners, distance):
+    above = distance >= 0
+    n_above = above.sum(axis=1)
+    cut = (n_above > 0) & (n_above < 3)
+    corners, distance, above = corners[cut], distance[cut], above[cut]
+
+    # Every cut triangle crosses the plane on exactly two of its edges.
+    points = np.empty(corners.shape, dtype=np.float32)
+    crosses = np.empty(above.shape, dtype=bool)
+    for e in range(3):
+        i, j = e, (e + 1) % 3
+        crosses[:, e] = above[:, i] != above[:, j]
+        d = distance[:, i] - distance[:, j]
+        t = np.divide(distance[:, i], d, out=np.zeros_like(d), where=crosses[:, e])
+        points[:, e] = corners[:, i] + t[:, None] * (corners[:, j] - corners[:, i])
+    edges = np.argsort(~crosses, axis=1, kind='stable')[:, :2]
+    return np.take_along_axis(points, edges[:, :, None], axis=1)
+
+# (MeshSlicer, colour) of every mesh from load_meshes(), shared by the views.
+def create_slicers(meshes):
+    return [(MeshSlicer(points, triangles), color) for points, triangles, color in meshes.values()]
+
+# Outlines of all tissues on the slice of one view, drawn in the colours of
+# the tissues. The user matrix of the actor maps the volume coordinates to the
+# coordinates of the view.
+class SliceOutlines:
+    def __init__(self, slicers, line_width=LINE_WIDTH):
+        self.slicers = slicers
+        self.polydata = vtk.vtkPolyData()
+        self.cut_time = 0.0
+
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(self.polydata)
+        mapper.SetScalarModeToUseCellData()
+        mapper.SetColorModeToDirectScalars()
+
+        self.actor = vtk.vtkActor()
+        self.actor.SetMapper(mapper)
+        self.actor.GetProperty().SetLineWidth(line_width)
+        self.actor.GetProperty().LightingOff()
+
+    # Outlines on the plane at position (mm) along an axis (0 = x, 1 = y, 2 = z).
+    def cut_axis(self, axis, position):
+        start = time.perf_counter()
+        self.show([(slicer.cut_axis(axis, position), color) for slicer, color in self.slicers])
+        self.cut_time = time.perf_counter() - start
+
+    # Outlines on any plane, through origin with the given normal.
+    def cut_plane(self, origin, normal):
+        start = time.perf_counter()
+        self.show([(slicer.cut_plane(origin, normal), color) for slicer, color in self.slicers])
+        self.cut_time = time.perf_counter() - start
+
+    def show(self, cuts):
+        segments = np.concatenate([s for s, _ in cuts]) if cuts else np.zeros((0, 2, 3), dtype=np.float32)
+        colors = np.concatenate([np.repeat([color], len(s), axis=0) for s, color in cuts]).astype(np.uint8) \
+            if cuts else np.zeros((0, 3), dtype=np.uint8)
+        n = len(segments)
+
+        points = vtk.vtkPoints()
+        points.SetData(numpy_to_vtk(segments.reshape(-1, 3), deep=True))
+        lines = vtk.vtkCellArray()
+        lines.SetData(numpy_to_vtkIdTypeArray(np.arange(0, 2 * n + 1, 2, dtype=np.int64), deep=True),
+                      numpy_to_vtkIdTypeArray(np.arange(2 * n, dtype=np.int64), deep=True))
+
+        self.polydata.SetPoints(points)
+        self.polydata.SetLines(lines)
+        self.polydata.GetCellData().SetScalars(numpy_to_vtk(colors, deep=True))
+        self.polydata.Modified()
+
+# Returns {tissue name: (points, triangles, rgb colour)} in the volume
+# coordinates, from the cache next to the label volume or built and cached.
+def load_meshes(source, tissues, root, flying_edges=True, decimate=0, workers=os.cpu_count()):
+    cache_file = mesh_cache_file(root, source)
+    key = cache_key(source, tissues, root, flying_edges, decimate)
+    if os.path.exists(cache_file):
+        with np.load(cache_file) as data:
+            if str(data['key']) == key:
+                return {name: (data['points_{:d}'.format(i)], data['triangles_{:d}'.format(i)],
+                               data['color_{:d}'.format(i)]) for i, name in enumerate(data['names'])}
+
+    jobs = [(source, name, root, flying_edges, decimate) for name in tissues]
+    if workers:
+        with process_pool(workers) as executor:
+            built = list(executor.map(build_mesh, jobs))
+    else:
+        built = [build_mesh(job) for job in jobs]
+    meshes = dict(zip(tissues, built))
+
+    arrays = {'key': key, 'names': np.array(list(tissues))}
+    for i, (points, triangles, color) in enumerate(meshes.values()):
+        arrays['points_{:d}'.format(i)] = points
+        arrays['triangles_{:d}'.format(i)] = triangles
+        arrays['color_{:d}'.format(i)] = color
+    try:
+        np.savez(cache_file, **arrays)
+    except OSError as e:
+        print('Could not store the tissue meshes {:s}: {}'.format(cache_file, e))
+    return meshes
+
+def mesh_cache_file(root, source):
+    base, _ = os.path.splitext(str(label_file(root)))
+    return '{:s}.{:s}.meshes.npz'.format(base, source)
+
+def cache_key(source, tissues, root, flying_edges, decimate):
+    settings = {
+        'source': source,
+        'tissues': list(tissues),
+        'parameters': {name: scene_parameters(source).get(name) for name in tissues},
+        'volumes': [source_signature(grey_file(root)), source_signature(label_file(root))],
+        'scene': scene_signatures(source, tissues, root),
+        'flying_edges': flying_edges,
+        'decimate': decimate,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+# Worker entry point: the triangles of one tissue in the volume coordinates.
+def build_mesh(job):
+    source, name, root, flying_edges, decimate = job
+    module = source_module(source)
+    lut = module.create_head_lut(vtk.vtkNamedColors())
+    if source == 'slices':
+        tissue = module.tissue_parameters()[name]
+        label = tissue['TISSUE']
+        mesh = module.create_tissue_mesh(grey_file(root), label_file(root), tissue, flying_edges, decimate)
+        to_volume = vtk.vtkTransformPolyDataFilter()
+        to_volume.SetInputConnection(mesh.GetOutputPort())
+        to_volume.SetTransform(module.slice_order_transform().GetInverse())
+        mesh = to_volume
+    else:
+        label = module.create_tissue_map()[name][0]
+        mesh = vtk.vtkPolyDataReader()
+        mesh.SetFileName(model_file(root, name))
+
+    triangles = vtk.vtkTriangleFilter()
+    triangles.SetInputConnection(mesh.GetOutputPort())
+    triangles.PassLinesOff()
+    triangles.PassVertsOff()
+    triangles.Update()
+    polydata = triangles.GetOutput()
+
+    points = np.zeros((0, 3), dtype=np.float32)
+    if polydata.GetPoints() is not None:
+        points = vtk_to_numpy(polydata.GetPoints().GetData()).astype(np.float32)
+    cells = vtk_to_numpy(polydata.GetPolys().GetConnectivityArray()).reshape(-1, 3).astype(np.int32)
+    color = (255 * np.array(lut.GetTableValue(label)[:3])).astype(np.uint8)
+    return points, cells, color
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the tissue meshes of the slice outlines and time the slice cuts.')
+    parser.add_argument('tissues', nargs='*', help='Tissue names, all tissues by default.')
+    parser.add_argument('--source', choices=('slices', 'models'), default='slices')
+    parser.add_argument('--root', default=dataset_root(), help='Root folder of the atlas.')
+    parser.add_argument('--marching-cubes', action='store_true', help='Use marching cubes instead of flying edges.')
+    parser.add_argument('--decimate', action='store_true')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    add_thread_arguments(parser)
+    args = parser.parse_args()
+    apply_thread_settings(args.threads, args.smp_backend)
+
+    main(args.source, args.tissues or default_tissues(args.source), args.root, not args.marching_cubes,
+         args.decimate, args.workers)
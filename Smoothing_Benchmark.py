@@ -0,0 +1,129 @@
+import argparse
+import importlib
+import sys
+import time
+
+import numpy as np
+from vtk.util.numpy_support import vtk_to_numpy
+
+from Atlas_Paths import dataset_root, grey_file, label_file
+from Sparse_Smoothing import polygon_arrays, sinc_coefficients, smooth_meshes, smooth_points, smoothing_operator
+from Thread_Settings import add_thread_arguments, apply_thread_settings
+
+# Compares the smoothing engines of 3D_From_Slices.create_smoother() on the
+# iso-surfaces of the atlas tissues, with the SMOOTH_ITERATIONS and
+# SMOOTH_FACTOR of every tissue:
+#
+#   sinc    - vtkWindowedSincPolyDataFilter, one tissue after the other.
+#   sparse  - the sparse matrix filter of Sparse_Smoothing.py, one tissue after
+#             the other; the time to build the operator is listed on its own.
+#   batched - the sparse matrix filter on all tissues with the same parameters
+#             at once, in one block-diagonal system.
+#
+# The smoothed points of the sparse engines are compared with those of the VTK
+# filter, the meshes have the same points in the same order. The run fails if
+# any point differs by more than the tolerance.
+
+def main(tissues, root, flying_edges, repeat, tolerance):
+    from_slices = importlib.import_module('3D_From_Slices')
+    head_fn = grey_file(root)
+    head_tissue_fn = label_file(root)
+    available_tissues = from_slices.tissue_parameters()
+
+    meshes = dict()
+    rows = []
+    for name in tissues:
+        tissue = dict(available_tissues[name], SMOOTH_ENGINE='sinc')
+        iso_surface = from_slices.create_iso_surface(head_fn, head_tissue_fn, tissue, flying_edges)
+        iso_surface.Update()
+        mesh = iso_surface.GetOutput()
+        if mesh.GetNumberOfPoints() == 0:
+            continue
+        points = vtk_to_numpy(mesh.GetPoints().GetData())
+        meshes[name] = (points, mesh.GetPolys(), tissue)
+
+        times = []
+        for _ in range(repeat):
+            smoother = from_slices.create_smoother(tissue)
+            smoother.SetInputData(mesh)
+            start = time.perf_counter()
+            smoother.Update()
+            times.append(time.perf_counter() - start)
+        reference = vtk_to_numpy(smoother.GetOutput().GetPoints().GetData())
+
+        # The coefficients are measured once per parameter pair, see
+        # Sparse_Smoothing.sinc_coefficients().
+        sinc_coefficients(tissue['SMOOTH_ITERATIONS'], tissue['SMOOTH_FACTOR'])
+        build_times, smooth_times = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            operator = smoothing_operator(points, *polygon_arrays(mesh.GetPolys()))
+            build_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            smoothed = smooth_points(points, operator, tissue['SMOOTH_ITERATIONS'], tissue['SMOOTH_FACTOR'])
+            smooth_times.append(time.perf_counter() - start)
+
+        moved = np.linalg.norm(reference - points, axis=1)
+        difference = np.linalg.norm(smoothed - reference, axis=1)
+        rows.append({
+            'name': name,
+            'points': len(points),
+            'iterations': tissue['SMOOTH_ITERATIONS'],
+            'sinc': min(times),
+            'build': min(build_times),
+            'sparse': min(smooth_times),
+            'moved': float(moved.mean()),
+            'mean_difference': float(difference.mean()),
+            'max_difference': float(difference.max()),
+        })
+        meshes[name] += (reference,)
+        print(format_row(rows[-1]))
+
+    # All tissues with the same parameters in one system.
+    groups = dict()
+    for name, (points, polys, tissue, reference) in meshes.items():
+        groups.setdefault((tissue['SMOOTH_ITERATIONS'], tissue['SMOOTH_FACTOR']), []).append(name)
+    batched_time = 0.0
+    differences = []
+    for (iterations, factor), names in groups.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = smooth_meshes([meshes[name][:2] for name in names], iterations, factor)
+            times.append(time.perf_counter() - start)
+        batched_time += min(times)
+        differences += [np.linalg.norm(result - meshes[name][3], axis=1) for name, result in zip(names, results)]
+
+    print()
+    print('{:>10s} {:>10s} {:>12s} {:>12s}'.format('Engine', 'Time s', 'Mean diff', 'Max diff'))
+    print('{:>10s} {:>10.3f} {:>12s} {:>12s}'.format('sinc', sum(r['sinc'] for r in rows), '', ''))
+    print('{:>10s} {:>10.3f} {:>12.4f} {:>12.4f}'.format(
+        'sparse', sum(r['build'] + r['sparse'] for r in rows),
+        np.mean([r['mean_difference'] for r in rows]), max(r['max_difference'] for r in rows)))
+    all_differences = np.concatenate(differences)
+    print('{:>10s} {:>10.3f} {:>12.4f} {:>12.4f}'.format('batched', batched_time, all_differences.mean(), all_differences.max()))
+    print('{:d} tissues in {:d} batches, {:d} points'.format(len(rows), len(groups), sum(r['points'] for r in rows)))
+
+    largest = max(max(r['max_difference'] for r in rows), all_differences.max())
+    if largest > tolerance:
+        sys.exit('The sparse engine differs from the VTK filter by up to {:.4f} mm, more than the tolerance of {:g} mm.'.format(
+            largest, tolerance))
+
+def format_row(row):
+    return '{:>15s} {:>8d} pts {:>3d} it  sinc {:8.1f} ms  sparse {:8.1f} ms (+{:6.1f} ms operator)  moved {:.4f}  difference mean {:.4f} max {:.4f}'.format(
+        row['name'], row['points'], row['iterations'], row['sinc'] * 1000, row['sparse'] * 1000, row['build'] * 1000,
+        row['moved'], row['mean_difference'], row['max_difference'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the smoothing engines on the atlas tissues.')
+    parser.add_argument('tissues', nargs='*', help='Tissue names, all tissues by default.')
+    parser.add_argument('--root', default=dataset_root(), help='Root folder of the atlas.')
+    parser.add_argument('--marching-cubes', action='store_true', help='Use marching cubes instead of flying edges.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per engine, the fastest one is reported.')
+    parser.add_argument('--tolerance', type=float, default=1e-3, help='Largest allowed point difference to the VTK filter (mm).')
+    add_thread_arguments(parser)
+    args = parser.parse_args()
+    apply_thread_settings(args.threads, args.smp_backend)
+
+    tissues = args.tissues or [k for k in importlib.import_module('3D_From_Slices').tissue_parameters() if k != 'head']
+    main(tissues, args.root, not args.marching_cubes, args.repeat, args.tolerance)
@@ -0,0 +1,221 @@
+import functools
+import math
+
+import numpy as np
+import scipy.optimize
+import scipy.sparse
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+from vtkmodules.util.vtkAlgorithm import VTKPythonAlgorithmBase
+
+# Windowed sinc smoothing of triangle meshes with sparse matrices, the 'sparse'
+# SMOOTH_ENGINE of 3D_From_Slices.py.
+#
+# This is the filter of vtkWindowedSincPolyDataFilter as set up by
+# create_smoother() (Taubin, Zhang and Golub, "Optimal surface smoothing as
+# filter design"): a Nuttall-windowed sinc of the mesh Laplacian with its pass
+# band at SMOOTH_FACTOR, expanded in Chebyshev polynomials up to
+# SMOOTH_ITERATIONS. The Laplacian is built once per mesh as a sparse matrix
+# from the edges of its polygons, and every iteration is one sparse matrix
+# product over the points of all meshes.
+#
+# As in the VTK filter, every neighbour of a vertex is weighted by the number
+# of polygons using their edge, so the vertices on non-manifold edges (used by
+# more than two polygons) are smoothed too (NonManifoldSmoothingOn). Vertices on
+# boundary edges (used by one polygon) follow the VTK filter, which does so
+# whether BoundarySmoothing is on or off: a vertex with two boundary edges that
+# turn by less than EDGE_ANGLE is smoothed along the boundary, by its two
+# boundary neighbours only, every other boundary vertex is fixed. Like in the
+# VTK filter the polynomial still scales the fixed vertices by its value at 0,
+# which is within 1e-3 of 1. Several meshes with the same parameters can be
+# smoothed together in one block-diagonal system, see smooth_meshes().
+#
+# Known limitation: the engine is not independent of VTK. The VTK filter widens
+# its pass band by an offset it searches for itself, and that search is not
+# reproduced here. Instead the cut-off is measured from the VTK filter once per
+# (SMOOTH_ITERATIONS, SMOOTH_FACTOR), see sinc_coefficients(), so the engine
+# still runs vtkWindowedSincPolyDataFilter on a small grid, and it raises an
+# exception if a VTK release changes the filter so that no cut-off matches.
+# With a matching cut-off the points agree with those of the VTK filter within
+# float precision, Smoothing_Benchmark.py checks this on the atlas tissues.
+
+# The default edge angle of vtkWindowedSincPolyDataFilter (degrees).
+EDGE_ANGLE = 15.0
+
+# Offsets and connectivity of a vtkCellArray as numpy arrays.
+def polygon_arrays(polys):
+    return (vtk_to_numpy(polys.GetOffsetsArray()).astype(np.int64),
+            vtk_to_numpy(polys.GetConnectivityArray()).astype(np.int64))
+
+# Smoothing operator M = I + L / 2 of a mesh for its Laplacian L, the identity
+# for the fixed vertices. The mesh is given by its points (n, 3) and the offsets
+# and connectivity of its polygons, see polygon_arrays().
+def smoothing_operator(points, offsets, connectivity):
+    n_points = len(points)
+    # Every polygon edge from a vertex to the next one of its polygon.
+    following = np.arange(1, len(connectivity) + 1)
+    following[offsets[1:] - 1] = offsets[:-1]
+    a, b = connectivity, connectivity[following]
+    keys, counts = np.unique(np.minimum(a, b) * n_points + np.maximum(a, b), return_counts=True)
+    lo, hi = np.divmod(keys, n_points)
+
+    # Every edge in both directions, weighted by the number of polygons using it.
+    rows = np.concatenate([lo, hi])
+    columns = np.concatenate([hi, lo])
+    weights = np.concatenate([counts, counts]).astype(np.float64)
+    boundary = weights == 1
+    n_boundary = np.bincount(rows[boundary], minlength=n_points)
+
+    # The boundary vertices with two boundary edges, and the turn of the
+    # boundary at them.
+    order = np.argsort(rows[boundary], kind='stable')
+    starts = np.searchsorted(rows[boundary][order], np.arange(n_points))
+    ends = columns[boundary][order]
+    along = np.flatnonzero(n_boundary == 2)
+    points = np.asarray(points, dtype=np.float64)
+    l1 = points[along] - points[ends[starts[along]]]
+    l2 = points[ends[starts[along] + 1]] - points[along]
+    length = np.linalg.norm(l1, axis=1) * np.linalg.norm(l2, axis=1)
+    cosine = np.divide(np.einsum('ij,ij->i', l1, l2), length, out=np.zeros(len(along)), where=length > 0)
+
+    smooth_along = np.zeros(n_points, dtype=bool)
+    smooth_along[along[cosine >= math.cos(math.radians(EDGE_ANGLE))]] = True
+    fixed = (n_boundary > 0) & ~smooth_along
+
+    # The vertices along the boundary only use their boundary edges.
+    moving = (n_boundary[rows] == 0) | (smooth_along[rows] & boundary)
+    adjacency = scipy.sparse.csr_matrix((weights[moving], (rows[moving], columns[moving])),
+                                        shape=(n_points, n_points))
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    fixed |= degree == 0
+
+    # M = I + (D^-1 A - I) / 2, and the identity for the fixed vertices.
+    scale = np.divide(0.5, degree, out=np.zeros(n_points), where=degree > 0)
+    diagonal = np.where(fixed, 1.0, 0.5)
+    operator = scipy.sparse.diags(scale) @ adjacency + scipy.sparse.diags(diagonal)
+    return operator.tocsr()
+
+# Chebyshev coefficients of the windowed sinc filter with its cut-off at
+# theta + sigma, for the Nuttall window of the VTK filter.
+def windowed_sinc(iterations, cutoff):
+    window = [nuttall_window(i * math.pi / (iterations + 1)) for i in range(iterations + 1)]
+    c = [window[0] * cutoff / math.pi]
+    c += [2.0 * window[i] * math.sin(i * cutoff) / (i * math.pi) for i in range(1, iterations + 1)]
+    return c
+
+# Chebyshev coefficients of vtkWindowedSincPolyDataFilter. The filter widens its
+# pass band by an offset sigma, so that it keeps the mesh from shrinking, and
+# the search for sigma is its own. The cut-off is therefore measured: the VTK
+# filter smooths a unit displacement of one vertex of a closed grid, and the
+# cut-off whose windowed sinc gives the same response is looked up.
+@functools.lru_cache()
+def sinc_coefficients(iterations, pass_band):
+    response, basis = probe_response(iterations, pass_band)
+
+    def error(cutoff):
+        return np.abs(np.dot(windowed_sinc(iterations, cutoff), basis) - response).max()
+
+    cutoffs = np.linspace(0.0, math.pi, 629)
+    errors = np.abs(np.array([windowed_sinc(iterations, cutoff) for cutoff in cutoffs]) @ basis - response).max(axis=1)
+    best = cutoffs[np.argmin(errors)]
+    step = cutoffs[1]
+    cutoff = scipy.optimize.minimize_scalar(error, bounds=(max(best - step, 0.0), min(best + step, math.pi)),
+                                            method='bounded', options={'xatol': 1e-12}).x
+    if error(cutoff) > 1e-6:
+        s = 'The sinc filter of {:d} iterations and pass band {:g} could not be matched.'.format(iterations, pass_band)
+        raise Exception(s)
+    return windowed_sinc(iterations, cutoff)
+
+# Displacements the VTK filter gives the vertices of a closed n x n triangle
+# grid (a torus) for a unit displacement of vertex 0, and the Chebyshev
+# polynomials T_i(M) of the grid applied to that displacement.
+def probe_response(iterations, pass_band):
+    n = 2 * iterations + 5
+    i, j = np.meshgrid(np.arange(n), np.arange(n))
+    a, b = j * n + i, j * n + (i + 1) % n
+    c, d = (j + 1) % n * n + i, (j + 1) % n * n + (i + 1) % n
+    connectivity = np.stack([a, b, d, a, d, c], axis=-1).ravel()
+    offsets = np.arange(0, len(connectivity) + 1, 3)
+
+    points = np.zeros((n * n, 3))
+    points[0, 0] = 1.0
+    polys = vtk.vtkCellArray()
+    polys.SetData(numpy_to_vtk(offsets, deep=True, array_type=vtk.VTK_ID_TYPE),
+                  numpy_to_vtk(connectivity, deep=True, array_type=vtk.VTK_ID_TYPE))
+    grid = vtk.vtkPolyData()
+    grid.SetPoints(vtk.vtkPoints())
+    grid.GetPoints().SetData(numpy_to_vtk(points, deep=True))
+    grid.SetPolys(polys)
+
+    smoother = vtk.vtkWindowedSincPolyDataFilter()
+    smoother.SetInputData(grid)
+    smoother.SetNumberOfIterations(iterations)
+    smoother.SetPassBand(pass_band)
+    smoother.NonManifoldSmoothingOn()
+    smoother.NormalizeCoordinatesOff()
+    smoother.Update()
+    response = vtk_to_numpy(smoother.GetOutput().GetPoints().GetData())[:, 0]
+
+    operator = smoothing_operator(points, offsets, connectivity)
+    basis = [points[:, 0], operator @ points[:, 0]]
+    for _ in range(2, iterations + 1):
+        basis.append(2.0 * (operator @ basis[-1]) - basis[-2])
+    return response, np.array(basis[:iterations + 1])
+
+# The default window of vtkWindowedSincPolyDataFilter.
+def nuttall_window(x):
+    return 0.355768 + 0.487396 * math.cos(x) + 0.144232 * math.cos(2 * x) + 0.012604 * math.cos(3 * x)
+
+# Smoothed points (n, 3) for the smoothing operator from smoothing_operator().
+def smooth_points(points, operator, iterations, pass_band):
+    x0 = np.asarray(points, dtype=np.float64)
+    if iterations == 0:
+        return x0.copy()
+    c = sinc_coefficients(iterations, pass_band)
+    x1 = operator @ x0
+    result = c[0] * x0 + c[1] * x1
+    for i in range(2, iterations + 1):
+        x0, x1 = x1, 2.0 * (operator @ x1) - x0
+        result += c[i] * x1
+    return result
+
+# Smooths several meshes in one block-diagonal system: their polygons are
+# joined into one mesh with the point ids shifted. Every mesh is (points,
+# polys); the smoothed points of every mesh are returned.
+def smooth_meshes(meshes, iterations, pass_band):
+    sizes = [len(points) for points, _ in meshes]
+    starts = np.cumsum([0] + sizes[:-1])
+    offsets, connectivity = [np.zeros(1, dtype=np.int64)], []
+    for start, (_, polys) in zip(starts, meshes):
+        o, c = polygon_arrays(polys)
+        offsets.append(o[1:] + offsets[-1][-1])
+        connectivity.append(c + start)
+    points = np.concatenate([points for points, _ in meshes])
+    operator = smoothing_operator(points, np.concatenate(offsets), np.concatenate(connectivity))
+    smoothed = smooth_points(points, operator, iterations, pass_band)
+    return np.split(smoothed, starts[1:])
+
+# Pipeline filter that smooths the points of its input polygons, used in
+# place of vtkWindowedSincPolyDataFilter.
+class SparseSmoothingFilter(VTKPythonAlgorithmBase):
+    def __init__(self, iterations=20, pass_band=0.1):
+        VTKPythonAlgorithmBase.__init__(self, nInputPorts=1, inputType='vtkPolyData',
+                                        nOutputPorts=1, outputType='vtkPolyData')
+        self.iterations = iterations
+        self.pass_band = pass_band
+
+    def RequestData(self, request, in_info, out_info):
+        source = vtk.vtkPolyData.GetData(in_info[0])
+        output = vtk.vtkPolyData.GetData(out_info)
+        output.ShallowCopy(source)
+        if source.GetNumberOfPoints() == 0:
+            return 1
+
+        points = vtk_to_numpy(source.GetPoints().GetData())
+        operator = smoothing_operator(points, *polygon_arrays(source.GetPolys()))
+        smoothed = smooth_points(points, operator, self.iterations, self.pass_band)
+
+        new_points = vtk.vtkPoints()
+        new_points.SetData(numpy_to_vtk(smoothed.astype(points.dtype), deep=True))
+        output.SetPoints(new_points)
+        return 1
@@ -0,0 +1,187 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk
+
+from Atlas_Paths import grey_file, label_file, model_file
+from Thread_Settings import add_thread_arguments, apply_thread_settings
+from Volume_IO import nrrd_header
+
+# Writes a synthetic head and neck phantom laid out like the SPL atlas: a
+# grayscale volume, a label volume and one .vtk model per tissue, at any size
+# from 64^3 to 1024^3. The bones are simple analytic shapes carrying the label
+# values of create_head_lut() and create_tissue_map(), so every viewer and
+# batch tool runs on it unchanged, e.g.
+#   python Synthetic_Atlas.py --output ./synthetic-256 --size 256
+#   python Label_Index.py --root ./synthetic-256
+#
+# The volumes only depend on the size and the seed and are written slab by
+# slab, so large sizes never hold more than a few slices in memory.
+
+SIZES = (64, 1024)
+
+# Physical size of the volume in mm along every axis.
+FIELD_OF_VIEW = 256.0
+
+# Slices evaluated at once.
+SLAB = 8
+
+# Grayscale values of the background, the soft tissue and the bones, and the
+# standard deviation of the noise added to every voxel.
+BACKGROUND = 0
+SOFT_TISSUE = 90
+BONE = 230
+NOISE = 6.0
+
+# Tissues of the phantom: label value, model name of create_tissue_map() and
+# shape. Coordinates are normalized to [-1, 1], x goes to the left, y to the
+# back and z up, like the LPS space of the atlas.
+TISSUES = [
+    (10, 'Model_10_skull', ('shell', (0.0, 0.05, 0.42), (0.56, 0.66, 0.52), 0.07)),
+    (25, 'Model_25_mandible', ('arc', (0.0, -0.05, -0.05), 0.38, 0.07, 'front')),
+    (9, 'Model_9_hyoid', ('arc', (0.0, -0.1, -0.25), 0.18, 0.045, 'front')),
+    (11, 'Model_11_atlas', ('arc', (0.0, 0.3, -0.08), 0.13, 0.045, 'all')),
+    (12, 'Model_12_axis', ('cylinder', (0.0, 0.3), 0.11, (-0.24, -0.14))),
+    (13, 'Model_13_cervical3', ('cylinder', (0.0, 0.3), 0.11, (-0.36, -0.27))),
+    (14, 'Model_14_cervical4', ('cylinder', (0.0, 0.3), 0.11, (-0.48, -0.39))),
+    (26, 'Model_26_right_clavicle', ('capsule', (-0.08, -0.32, -0.6), (-0.62, 0.0, -0.52), 0.05)),
+    (27, 'Model_27_left_clavicle', ('capsule', (0.08, -0.32, -0.6), (0.62, 0.0, -0.52), 0.05)),
+    (28, 'Model_28_sternum', ('box', (-0.09, -0.47, -0.98), (0.09, -0.38, -0.63))),
+    (31, 'Model_31_rib1', ('arc', (0.0, 0.05, -0.68), 0.42, 0.035, 'back')),
+    (32, 'Model_32_rib2', ('arc', (0.0, 0.05, -0.75), 0.48, 0.035, 'back')),
+    (33, 'Model_33_rib3', ('arc', (0.0, 0.05, -0.82), 0.54, 0.035, 'back')),
+    (34, 'Model_34_rib4', ('arc', (0.0, 0.05, -0.89), 0.6, 0.035, 'back')),
+    (35, 'Model_35_rib5', ('arc', (0.0, 0.05, -0.96), 0.66, 0.035, 'back')),
+]
+
+def main(output_dir, size, seed, model_size, slab):
+    if not SIZES[0] <= size <= SIZES[1]:
+        print('The size must be between {:d} and {:d}.'.format(*SIZES))
+        return
+    for d in ('grayscale', 'labels', 'models'):
+        os.makedirs(os.path.join(output_dir, d), exist_ok=True)
+
+    start = time.perf_counter()
+    write_volumes(output_dir, size, seed, slab)
+    print('Volumes: {:d}^3 voxels in {:.2f} s'.format(size, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    write_models(output_dir, min(model_size, size))
+    print('Models: {:d} tissues in {:.2f} s'.format(len(TISSUES), time.perf_counter() - start))
+
+# Spacing and origin of a grid with n voxels along every axis, centred on the
+# field of view.
+def grid_geometry(n):
+    spacing = FIELD_OF_VIEW / n
+    origin = -0.5 * FIELD_OF_VIEW + 0.5 * spacing
+    return [spacing] * 3, [origin] * 3
+
+# Labels of the slices z0 to z1 of an n^3 grid as a (z, y, x) uint8 array and
+# the mask of the soft tissue around them.
+def label_slab(n, z0, z1):
+    coords = (np.arange(n, dtype=np.float32) + 0.5) * (2.0 / n) - 1.0
+    z, y, x = np.meshgrid(coords[z0:z1], coords, coords, indexing='ij')
+
+    # Head, neck and shoulders.
+    body = ((x / 0.62) ** 2 + ((y - 0.05) / 0.72) ** 2 + ((z - 0.42) / 0.58) ** 2 < 1) \
+        | ((x ** 2 + (y - 0.05) ** 2 < 0.36 ** 2) & (z > -0.6) & (z < 0.1)) \
+        | (((x / 0.85) ** 2 + ((y - 0.05) / 0.58) ** 2 < 1) & (z <= -0.5))
+
+    labels = np.zeros(z.shape, dtype=np.uint8)
+    for label, _, shape in TISSUES:
+        labels[shape_mask(shape, x, y, z)] = label
+    return labels, body
+
+def shape_mask(shape, x, y, z):
+    kind = shape[0]
+    if kind == 'shell':
+        _, (cx, cy, cz), (rx, ry, rz), thickness = shape
+        r = np.sqrt(((x - cx) / rx) ** 2 + ((y - cy) / ry) ** 2 + ((z - cz) / rz) ** 2)
+        return (r < 1) & (r > 1 - thickness / min(rx, ry, rz)) & (z > cz - 0.5 * rz)
+    if kind == 'arc':
+        # Torus around the z axis, 'front' and 'back' keep the half with y < cy or y > cy.
+        _, (cx, cy, cz), radius, tube, part = shape
+        mask = (np.sqrt((x - cx) ** 2 + (y - cy) ** 2) - radius) ** 2 + (z - cz) ** 2 < tube ** 2
+        if part == 'front':
+            mask &= y < cy
+        elif part == 'back':
+            mask &= y > cy
+        return mask
+    if kind == 'cylinder':
+        _, (cx, cy), radius, (z0, z1) = shape
+        return ((x - cx) ** 2 + (y - cy) ** 2 < radius ** 2) & (z > z0) & (z < z1)
+    if kind == 'capsule':
+        _, a, b, radius = shape
+        a, b = np.array(a, dtype=np.float32), np.array(b, dtype=np.float32)
+        ab = b - a
+        t = ((x - a[0]) * ab[0] + (y - a[1]) * ab[1] + (z - a[2]) * ab[2]) / ab.dot(ab)
+        t = np.clip(t, 0, 1)
+        return (x - a[0] - t * ab[0]) ** 2 + (y - a[1] - t * ab[1]) ** 2 + (z - a[2] - t * ab[2]) ** 2 < radius ** 2
+    if kind == 'box':
+        _, lo, hi = shape
+        return (x > lo[0]) & (x < hi[0]) & (y > lo[1]) & (y < hi[1]) & (z > lo[2]) & (z < hi[2])
+    raise ValueError('Unknown shape "{:s}"'.format(kind))
+
+def write_volumes(output_dir, n, seed, slab):
+    spacing, origin = grid_geometry(n)
+    with open(grey_file(output_dir), 'wb') as grey_out, open(label_file(output_dir), 'wb') as label_out:
+        grey_out.write(nrrd_header((n, n, n), np.uint8, spacing, origin))
+        label_out.write(nrrd_header((n, n, n), np.uint8, spacing, origin))
+        for z0 in range(0, n, slab):
+            z1 = min(z0 + slab, n)
+            labels, body = label_slab(n, z0, z1)
+
+            grey = np.where(labels > 0, BONE, np.where(body, SOFT_TISSUE, BACKGROUND)).astype(np.float32)
+            # Every slice has its own generator, so the noise does not depend on the slab size.
+            for i, z in enumerate(range(z0, z1)):
+                grey[i] += np.random.default_rng((seed, z)).normal(0, NOISE, (n, n)).astype(np.float32)
+            np.clip(np.rint(grey), 0, 255, out=grey)
+
+            grey_out.write(grey.astype(np.uint8).tobytes())
+            label_out.write(labels.tobytes())
+
+# Extracts the surface of every tissue from a label grid of n^3 voxels and
+# writes it as a legacy .vtk file named like the atlas models.
+def write_models(output_dir, n):
+    labels, _ = label_slab(n, 0, n)
+    spacing, origin = grid_geometry(n)
+
+    image = vtk.vtkImageData()
+    image.SetDimensions(n, n, n)
+    image.SetSpacing(spacing)
+    image.SetOrigin(origin)
+    image.GetPointData().SetScalars(numpy_to_vtk(labels.ravel(), deep=True))
+
+    for label, name, _ in TISSUES:
+        surface = vtk.vtkDiscreteMarchingCubes()
+        surface.SetInputData(image)
+        surface.SetValue(0, label)
+
+        smoother = vtk.vtkWindowedSincPolyDataFilter()
+        smoother.SetInputConnection(surface.GetOutputPort())
+        smoother.SetNumberOfIterations(15)
+        smoother.SetPassBand(0.1)
+        smoother.NonManifoldSmoothingOn()
+        smoother.NormalizeCoordinatesOn()
+
+        writer = vtk.vtkPolyDataWriter()
+        writer.SetInputConnection(smoother.GetOutputPort())
+        writer.SetFileName(model_file(output_dir, name))
+        writer.SetFileTypeToBinary()
+        writer.Write()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic head and neck atlas for testing and benchmarking.')
+    parser.add_argument('--output', default='./synthetic-atlas', help='Root folder of the synthetic atlas.')
+    parser.add_argument('--size', type=int, default=128, help='Voxels along every axis, 64 to 1024.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the grayscale noise.')
+    parser.add_argument('--model-size', type=int, default=128, help='Voxels along every axis of the grid the models are extracted from.')
+    parser.add_argument('--slab', type=int, default=SLAB, help='Slices evaluated at once.')
+    add_thread_arguments(parser)
+    args = parser.parse_args()
+    apply_thread_settings(args.threads, args.smp_backend)
+
+    main(args.output, args.size, args.seed, args.model_size, args.slab)
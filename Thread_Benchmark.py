@@ -0,0 +1,119 @@
+import argparse
+import importlib
+import os
+import time
+
+import vtk
+
+from Atlas_Paths import dataset_root, grey_file, label_file
+from Label_Index import load_label_index
+from Thread_Settings import SMP_BACKEND, SMP_BACKENDS, apply_thread_settings, thread_settings
+from Tissue_Scene import default_tissues
+
+# Measures how the tissue pipeline of 3D_From_Slices.py scales with the number
+# of threads. The pipelines of all tissues are built once and executed again
+# for every thread count; the time of every stage (reader, crop, threshold,
+# shrink, Gaussian, iso-surface, ...) is taken from its Start and End events
+# and summed over the tissues, the fastest of the repeats is reported.
+
+def main(tissues, root, counts, backend, flying_edges, decimate, repeat):
+    from_slices = importlib.import_module('3D_From_Slices')
+    head_fn = grey_file(root)
+    head_tissue_fn = label_file(root)
+    available_tissues = from_slices.tissue_parameters()
+    load_label_index(head_tissue_fn)
+
+    pipelines = []
+    for name in tissues:
+        normals = from_slices.create_tissue_mesh(head_fn, head_tissue_fn, available_tissues[name], flying_edges, decimate)
+        stripper = vtk.vtkStripper()
+        stripper.SetInputConnection(normals.GetOutputPort())
+        pipelines.append((normals, stripper, pipeline_stages(stripper)))
+
+    results = dict()
+    for threads in counts:
+        apply_thread_settings(threads, backend)
+        print('{:d} threads: {:s}'.format(threads, thread_settings()))
+        best = None
+        for _ in range(repeat):
+            times = dict()
+            for _, stripper, stages in pipelines:
+                timers = [StageTimer(stage, times) for stage in stages]
+                stages[0].Modified()
+                stripper.Update()
+                for timer in timers:
+                    timer.detach()
+            best = times if best is None else {k: min(v, best[k]) for k, v in times.items()}
+        results[threads] = best
+
+    print(format_table(results, counts))
+
+# The algorithms of a linear pipeline, from the reader down to the given one.
+def pipeline_stages(algorithm):
+    stages = []
+    while algorithm is not None:
+        stages.append(algorithm)
+        has_input = algorithm.GetNumberOfInputPorts() and algorithm.GetNumberOfInputConnections(0)
+        algorithm = algorithm.GetInputAlgorithm() if has_input else None
+    return stages[::-1]
+
+def stage_name(algorithm):
+    return algorithm.GetClassName()[3:]
+
+# Adds the execution time of an algorithm to times[stage name].
+class StageTimer:
+    def __init__(self, algorithm, times):
+        self.algorithm = algorithm
+        self.times = times
+        self.start = None
+        self.observers = [algorithm.AddObserver('StartEvent', self.on_start),
+                          algorithm.AddObserver('EndEvent', self.on_end)]
+
+    def on_start(self, caller, ev):
+        self.start = time.perf_counter()
+
+    def on_end(self, caller, ev):
+        name = stage_name(self.algorithm)
+        self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - self.start
+
+    def detach(self):
+        for observer in self.observers:
+            self.algorithm.RemoveObserver(observer)
+
+def format_table(results, counts):
+    base = results[counts[0]]
+    names = list(base)
+    res = ['{:>28s}'.format('Stage') + ''.join('{:>18s}'.format('{:d} threads'.format(c)) for c in counts)]
+    for name in names + ['Total']:
+        row = '{:>28s}'.format(name)
+        for c in counts:
+            t = sum(results[c].values()) if name == 'Total' else results[c].get(name, 0.0)
+            t0 = sum(base.values()) if name == 'Total' else base[name]
+            row += '{:>10.1f} ms {:4.1f}x'.format(t * 1000, t0 / t if t else 0.0)
+        res.append(row)
+    return '\n'.join(res)
+
+# 1, 2, 4, ... threads up to the number of cores.
+def default_counts():
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 < cores:
+        counts.append(counts[-1] * 2)
+    if cores > 1:
+        counts.append(cores)
+    return counts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the tissue pipeline at increasing thread counts.')
+    parser.add_argument('tissues', nargs='*', help='Tissue names, all tissues by default.')
+    parser.add_argument('--root', default=dataset_root(), help='Root folder of the atlas.')
+    parser.add_argument('--counts', type=int, nargs='+', default=default_counts(),
+                        help='Thread counts to run, 1, 2, 4, ... up to the number of cores by default.')
+    parser.add_argument('--smp-backend', choices=SMP_BACKENDS, default=SMP_BACKEND)
+    parser.add_argument('--marching-cubes', action='store_true', help='Use marching cubes instead of flying edges.')
+    parser.add_argument('--decimate', action='store_true')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per thread count, the fastest one is reported.')
+    args = parser.parse_args()
+
+    main(args.tissues or default_tissues('slices'), args.root, args.counts, args.smp_backend,
+         not args.marching_cubes, args.decimate, args.repeat)
@@ -0,0 +1,57 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import vtk
+
+# Thread pool settings shared by all scripts.
+#
+# The SMP filters (vtkFlyingEdges3D, vtkWindowedSincPolyDataFilter, ...) run on
+# the vtkSMPTools backend, the image filters (vtkImageThreshold,
+# vtkImageShrink3D, vtkImageGaussianSmooth, ...) on vtkMultiThreader. Both are
+# limited to the same number of threads. The settings come from the arguments,
+# the MDV_THREADS and MDV_SMP_BACKEND environment variables or the defaults
+# below, so they also reach the worker processes of the batch tools.
+#
+#   MDV_THREADS=4 MDV_SMP_BACKEND=STDThread python 3D_From_Slices.py
+
+# Threads per process, 0 uses all cores.
+THREADS = 0
+
+# vtkSMPTools backend: Sequential, STDThread, TBB or OpenMP, depending on how
+# VTK was built. STDThread runs the SMP filters on all cores with every build.
+SMP_BACKEND = 'STDThread'
+
+SMP_BACKENDS = ('Sequential', 'STDThread', 'TBB', 'OpenMP')
+
+def apply_thread_settings(threads=None, backend=None):
+    if threads is None:
+        threads = int(os.environ.get('MDV_THREADS', THREADS))
+    if backend is None:
+        backend = os.environ.get('MDV_SMP_BACKEND', SMP_BACKEND)
+    # Worker processes started later pick up the same settings.
+    os.environ['MDV_THREADS'] = str(threads)
+    os.environ['MDV_SMP_BACKEND'] = backend
+
+    if backend and not vtk.vtkSMPTools.SetBackend(backend):
+        print('The SMP backend {:s} is not available, using {:s}.'.format(backend, vtk.vtkSMPTools.GetBackend()))
+    vtk.vtkSMPTools.Initialize(threads)
+    vtk.vtkMultiThreader.SetGlobalMaximumNumberOfThreads(threads)
+
+# Process pool of the batch tools, with the thread settings applied in every
+# worker. The workers are spawned, not forked: a process forked after the parent
+# has run an SMP filter inherits the STDThread pool without its threads, and
+# its first SMP filter waits on them forever.
+def process_pool(workers, initializer=apply_thread_settings, initargs=()):
+    return ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs,
+                               mp_context=multiprocessing.get_context('spawn'))
+
+def thread_settings():
+    return '{:s} backend, {:d} threads'.format(vtk.vtkSMPTools.GetBackend(), vtk.vtkSMPTools.GetEstimatedNumberOfThreads())
+
+# Command line options of the batch tools, see apply_thread_settings().
+def add_thread_arguments(parser):
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Threads of the VTK filters per process, 0 for all cores (default: MDV_THREADS or {:d}).'.format(THREADS))
+    parser.add_argument('--smp-backend', choices=SMP_BACKENDS, default=None,
+                        help='vtkSMPTools backend (default: MDV_SMP_BACKEND or {:s}).'.format(SMP_BACKEND))
@@ -0,0 +1,137 @@
+import time
+
+import vtk
+
+# Tissue picking for the 3D viewers.
+#
+# Every tissue mesh gets a vtkStaticCellLocator, built once when the tissue is
+# added, which the cell picker uses instead of testing every triangle of every
+# actor. If no tissue mesh is hit (or the hit actor is not a tissue), the label
+# at the picked point is looked up in the label volume instead: the point is
+# taken from the depth buffer and mapped back into the volume with the inverse
+# of the SliceOrder transform used to build the meshes.
+#
+# Hovering shows the tissue under the mouse in the top right corner, a
+# shift + left click prints it.
+
+class TissuePicker:
+    def __init__(self, render_window, renderer, hover_rate=30.0):
+        self.render_window = render_window
+        self.renderer = renderer
+        self.hover_interval = 1.0 / hover_rate
+        self.last_hover = 0.0
+        self.buttons_down = 0
+        self.tissues = dict()
+
+        self.picker = vtk.vtkCellPicker()
+        self.picker.PickFromListOn()
+        self.world_picker = vtk.vtkWorldPointPicker()
+
+        self.label_image = None
+        self.to_image = None
+        self.names = dict()
+
+        self.text = vtk.vtkTextActor()
+        self.text.GetTextProperty().SetFontSize(16)
+        self.text.GetTextProperty().SetColor(0, 0, 0)
+        self.text.GetTextProperty().SetJustificationToRight()
+        self.text.GetTextProperty().SetVerticalJustificationToTop()
+        self.text.GetPositionCoordinate().SetCoordinateSystemToNormalizedViewport()
+        self.text.SetPosition(0.99, 0.99)
+        renderer.AddViewProp(self.text)
+
+    # Registers a tissue actor and builds the cell locator of its mesh.
+    def add_tissue(self, actor, name, label):
+        mapper = actor.GetMapper()
+        mapper.Update()
+        locator = vtk.vtkStaticCellLocator()
+        locator.SetDataSet(mapper.GetInput())
+        locator.BuildLocator()
+
+        self.picker.AddLocator(locator)
+        self.picker.AddPickList(actor)
+        self.tissues[actor] = (name, label, locator)
+        self.names[label] = name
+
+    # Enables the label volume fallback. The transform maps the image
+    # coordinates of the label volume to the world coordinates of the meshes.
+    def set_label_volume(self, label_image, transform):
+        self.label_image = label_image
+        self.to_image = transform.GetInverse()
+
+    def attach(self, interactor):
+        interactor.AddObserver('MouseMoveEvent', self.on_move)
+        interactor.AddObserver('LeftButtonPressEvent', self.on_click)
+        for event in ('LeftButtonPressEvent', 'MiddleButtonPressEvent', 'RightButtonPressEvent'):
+            interactor.AddObserver(event, self.on_press, -1.0)
+        for event in ('LeftButtonReleaseEvent', 'MiddleButtonReleaseEvent', 'RightButtonReleaseEvent'):
+            interactor.AddObserver(event, self.on_release, -1.0)
+
+    # Returns (name, label, world position) of the tissue at the display
+    # position, or None.
+    def pick(self, x, y):
+        if self.picker.Pick(x, y, 0, self.renderer):
+            tissue = self.tissues.get(self.picker.GetActor())
+            if tissue is not None:
+                return tissue[0], tissue[1], self.picker.GetPickPosition()
+
+        # Nothing was drawn where the depth buffer is still cleared.
+        if self.label_image is not None and self.renderer.GetZ(x, y) < 1.0:
+            self.world_picker.Pick(x, y, 0, self.renderer)
+            position = self.world_picker.GetPickPosition()
+            label = self.label_at(position)
+            if label:
+                return self.names.get(label, 'label {:d}'.format(label)), label, position
+        return None
+
+    # Label of the voxel at a world position. Mesh surfaces lie between voxels,
+    # so the most common non-background label of the 3x3x3 neighbourhood is used.
+    def label_at(self, position):
+        image = self.label_image
+        point = self.to_image.TransformPoint(position)
+        origin = image.GetOrigin()
+        spacing = image.GetSpacing()
+        extent = image.GetExtent()
+        center = [int(round((point[a] - origin[a]) / spacing[a])) for a in range(3)]
+
+        votes = dict()
+        for i in range(center[0] - 1, center[0] + 2):
+            for j in range(center[1] - 1, center[1] + 2):
+                for k in range(center[2] - 1, center[2] + 2):
+                    if extent[0] <= i <= extent[1] and extent[2] <= j <= extent[3] and extent[4] <= k <= extent[5]:
+                        label = int(image.GetScalarComponentAsDouble(i, j, k, 0))
+                        if label:
+                            votes[label] = votes.get(label, 0) + 1
+        return max(votes, key=votes.get) if votes else 0
+
+    def on_press(self, caller, ev):
+        self.buttons_down += 1
+
+    def on_release(self, caller, ev):
+        self.buttons_down = max(self.buttons_down - 1, 0)
+
+    def on_move(self, caller, ev):
+        # No picking while the camera is dragged, and at most hover_rate picks a second.
+        now = time.perf_counter()
+        if self.buttons_down or now - self.last_hover < self.hover_interval:
+            return
+        self.last_hover = now
+
+        x, y = caller.GetEventPosition()
+        if caller.FindPokedRenderer(x, y) is not self.renderer:
+            return
+        res = self.pick(x, y)
+        text = '{:s} (label {:d})'.format(res[0], res[1]) if res else ''
+        if text != self.text.GetInput():
+            self.text.SetInput(text)
+            self.render_window.Render()
+
+    def on_click(self, caller, ev):
+        if not caller.GetShiftKey():
+            return
+        x, y = caller.GetEventPosition()
+        res = self.pick(x, y)
+        if res:
+            print('Picked {:s}, label: {:d}, at ({:.1f}, {:.1f}, {:.1f})'.format(res[0], res[1], *res[2]))
+        else:
+            print('Nothing picked')
@@ -0,0 +1,120 @@
+import importlib
+
+import vtk
+
+from Atlas_Paths import grey_file, label_file, model_file
+from Label_Index import source_signature
+
+# Builds the tissue actors of the two 3D viewers without opening their windows,
+# for the tools that render the same scene offscreen.
+#   slices - meshes built from the label volume like 3D_From_Slices.py
+#   models - atlas models read like 3D_head.py
+
+# Scene builder of each source. Their file names start with a digit, so they
+# have to be loaded through importlib.
+SOURCES = {'slices': '3D_From_Slices', 'models': '3D_head'}
+
+def source_module(source):
+    return importlib.import_module(SOURCES[source])
+
+def default_tissues(source):
+    module = source_module(source)
+    if source == 'slices':
+        return [name for name in module.tissue_parameters() if name != 'head']
+    return list(module.create_tissue_map())
+
+# Returns a dictionary of tissue name to actor, set up like in the viewer.
+def create_tissue_actors(source, tissues, root, flying_edges=True, decimate=0):
+    module = source_module(source)
+    lut = module.create_head_lut(vtk.vtkNamedColors())
+
+    actors = dict()
+    if source == 'slices':
+        head_fn = grey_file(root)
+        head_tissue_fn = label_file(root)
+        available_tissues = module.tissue_parameters()
+        for name in tissues:
+            actors[name] = module.create_head_actor(head_fn, head_tissue_fn, available_tissues[name],
+                                                    flying_edges, decimate, lut)
+    else:
+        tm = module.create_tissue_map()
+        for name in tissues:
+            actor = module.create_head_actor(model_file(root, name), name, tm[name][1])
+            actor.GetProperty().SetOpacity(tm[name][2])
+            actor.GetProperty().SetDiffuseColor(lut.GetTableValue(tm[name][0])[:3])
+            actor.GetProperty().SetSpecular(0.2)
+            actor.GetProperty().SetSpecularPower(10)
+            actors[name] = actor
+    return actors
+
+# Tissue settings that identify the scene, used as key of the frame caches.
+def scene_parameters(source):
+    module = source_module(source)
+    if source == 'slices':
+        return module.tissue_parameters()
+    return module.create_tissue_map()
+
+# Signatures of the atlas files the scene is built from: the grey and label
+# volumes for 3D_From_Slices.py, the tissue models for 3D_head.py. Used in the
+# keys of the caches built from the scene.
+def scene_signatures(source, tissues, root):
+    if source == 'slices':
+        files = [grey_file(root), label_file(root)]
+    else:
+        files = [model_file(root, name) for name in tissues]
+    return [source_signature(file_name) for file_name in files]
+
+# Initial camera of the viewer of each source.
+def reset_camera(source, renderer):
+    renderer.GetActiveCamera().Roll(-90 if source == 'slices' else -180)
+    renderer.ResetCamera()
+
+# Moves the camera to a view on the orbit around the initial camera.
+def orbit_camera(renderer, initial_camera, azimuth, elevation, zoom=1.0):
+    camera = renderer.GetActiveCamera()
+    camera.DeepCopy(initial_camera)
+    camera.Azimuth(azimuth)
+    camera.Elevation(elevation)
+    camera.OrthogonalizeViewUp()
+    camera.Zoom(zoom)
+    renderer.ResetCameraClippingRange()
+
+# Meshes are passed between processes as binary legacy VTK files.
+def polydata_to_bytes(polydata):
+    writer = vtk.vtkPolyDataWriter()
+    writer.SetInputData(polydata)
+    writer.SetFileTypeToBinary()
+    writer.WriteToOutputStringOn()
+    writer.Write()
+    return writer.GetOutputStdString()
+
+def polydata_from_bytes(data):
+    reader = vtk.vtkPolyDataReader()
+    reader.ReadFromInputStringOn()
+    reader.SetBinaryInputString(data, len(data))
+    reader.Update()
+    return reader.GetOutput()
+
+def serialize_actors(actors):
+    scene = []
+    for name, actor in actors.items():
+        mapper = actor.GetMapper()
+        mapper.Update()
+        prop = actor.GetProperty()
+        scene.append((name, polydata_to_bytes(mapper.GetInput()), prop.GetOpacity(), prop.GetDiffuseColor(),
+                      prop.GetSpecular(), prop.GetSpecularPower()))
+    return scene
+
+def deserialize_actors(scene):
+    actors = dict()
+    for name, data, opacity, color, specular, specular_power in scene:
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(polydata_from_bytes(data))
+        actor = vtk.vtkActor()
+        actor.SetMapper(mapper)
+        actor.GetProperty().SetOpacity(opacity)
+        actor.GetProperty().SetDiffuseColor(color)
+        actor.GetProperty().SetSpecular(specular)
+        actor.GetProperty().SetSpecularPower(specular_power)
+        actors[name] = actor
+    return actors
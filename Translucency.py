@@ -0,0 +1,268 @@
+import argparse
+import collections
+import time
+
+import vtk
+
+from Atlas_Paths import dataset_root
+from Performance_HUD import percentiles
+from Thread_Settings import add_thread_arguments, apply_thread_settings
+from Tissue_Scene import SOURCES, create_tissue_actors, default_tissues, reset_camera
+
+# Render passes of the tissue viewers with translucent tissues.
+#
+# Before every render of the window the tissues are sorted into three groups:
+# hidden (opacity 0, e.g. the skull of 3D_head.py, not drawn at all), opaque
+# and translucent. Only when the translucent group is not empty does the
+# renderer pay for a translucency technique; an opaque scene is drawn in a
+# single opaque pass. The techniques are:
+#
+#   peeling - (dual) depth peeling, correct within and between the tissues. The
+#             number of peels is capped, and peeling stops early once fewer
+#             than the occlusion ratio of the pixels change. While the pass is
+#             timed and takes longer than the budget, the cap is lowered one
+#             peel per frame (and raised again when it is well below).
+#   sort    - alpha blending of the translucent tissues from back to front by
+#             the distance of their centres to the camera, one pass per tissue.
+#             Correct between tissues that do not overlap in depth, not within
+#             a tissue.
+#
+# When timing is on, the translucent pass of every frame is timed from the
+# first draw of a translucent tissue to the end of the renderer, both after the
+# GPU has finished. Waiting for the GPU slows every frame down, so the viewers
+# start with timing off: 'g' prints the groups and switches the timing on, the
+# next 'g' prints the cost of the pass and switches it off again. The report is
+# printed again on exit. Run this file to compare the techniques offscreen,
+# always timed.
+
+TECHNIQUES = ('peeling', 'sort')
+
+class TranslucencyManager:
+    def __init__(self, render_window, renderer, actors, technique='peeling', max_peels=4,
+                 occlusion_ratio=0.1, budget=10.0, window=240, key='g', timing=False):
+        if technique not in TECHNIQUES:
+            raise Exception('No such translucency technique "{:s}" exists.'.format(technique))
+        self.render_window = render_window
+        self.renderer = renderer
+        # Tissue name to actor, tissues added to it later are picked up too.
+        self.actors = actors
+        self.technique = technique
+        self.max_peels = max_peels
+        self.peels = max_peels
+        self.budget = budget
+        self.key = key
+        self.timing = timing
+
+        self.hidden = set()
+        self.opaque = []
+        self.translucent = []
+        self.translucent_mappers = set()
+        self.observed = dict()
+        self.order = []
+
+        self.times = collections.deque(maxlen=window)
+        self.passes = collections.deque(maxlen=window)
+        self.frames = 0
+        self.skipped = 0
+        self.pass_start = None
+        self.pass_draws = 0
+
+        renderer.SetUseDepthPeeling(False)
+        renderer.SetMaximumNumberOfPeels(max_peels)
+        renderer.SetOcclusionRatio(occlusion_ratio)
+        render_window.AddObserver('StartEvent', self.on_start)
+        renderer.AddObserver('EndEvent', self.on_end)
+
+    def attach(self, interactor):
+        interactor.AddObserver('KeyPressEvent', self.on_key)
+        interactor.AddObserver('ExitEvent', lambda caller, ev: print(self.report()))
+
+    # Sorts the tissues into their groups and sets up the translucent pass.
+    def on_start(self, caller, ev):
+        self.opaque, self.translucent = [], []
+        for name, actor in self.actors.items():
+            self.observe(actor.GetMapper())
+            if actor.GetProperty().GetOpacity() <= 0.0:
+                if actor.GetVisibility():
+                    actor.VisibilityOff()
+                    self.hidden.add(name)
+                continue
+            if name in self.hidden:
+                actor.VisibilityOn()
+                self.hidden.discard(name)
+            if not actor.GetVisibility():
+                continue
+            if actor.HasTranslucentPolygonalGeometry():
+                self.translucent.append(name)
+            else:
+                self.opaque.append(name)
+
+        peeling = self.technique == 'peeling' and bool(self.translucent)
+        if bool(self.renderer.GetUseDepthPeeling()) != peeling:
+            self.renderer.SetUseDepthPeeling(peeling)
+        if self.technique == 'sort' and self.translucent:
+            self.sort_translucent()
+
+        self.translucent_mappers = {self.actors[name].GetMapper() for name in self.translucent}
+        self.pass_start = None
+        self.pass_draws = 0
+
+    # Every draw of a tissue starts with the StartEvent of its mapper.
+    def observe(self, mapper):
+        if mapper is not None and mapper not in self.observed:
+            self.observed[mapper] = mapper.AddObserver('StartEvent', self.on_draw)
+
+    # Removes the observers from the mappers, so the actors can be drawn
+    # without the manager again.
+    def detach(self):
+        for mapper, tag in self.observed.items():
+            mapper.RemoveObserver(tag)
+        self.observed.clear()
+
+    def on_draw(self, caller, ev):
+        if not self.timing or caller not in self.translucent_mappers:
+            return
+        self.pass_draws += 1
+        if self.pass_start is None:
+            self.render_window.WaitForCompletion()
+            self.pass_start = time.perf_counter()
+
+    def on_end(self, caller, ev):
+        self.frames += 1
+        if not self.translucent:
+            self.skipped += 1
+        if self.pass_start is None:
+            return
+        self.render_window.WaitForCompletion()
+        pass_time = 1000 * (time.perf_counter() - self.pass_start)
+        self.times.append(pass_time)
+        self.passes.append(self.pass_draws / len(self.translucent))
+
+        if self.technique == 'peeling' and self.budget:
+            peels = self.peels
+            if pass_time > self.budget and peels > 1:
+                peels -= 1
+            elif pass_time < self.budget / 2 and peels < self.max_peels:
+                peels += 1
+            if peels != self.peels:
+                self.peels = peels
+                self.renderer.SetMaximumNumberOfPeels(peels)
+
+    # Moves the translucent actors to the end of the renderer, the farthest
+    # first, so that they are blended from back to front.
+    def sort_translucent(self):
+        position = self.renderer.GetActiveCamera().GetPosition()
+
+        def distance(name):
+            bounds = self.actors[name].GetBounds()
+            centre = [(bounds[2 * i] + bounds[2 * i + 1]) / 2 for i in range(3)]
+            return vtk.vtkMath.Distance2BetweenPoints(centre, position)
+
+        order = sorted(self.translucent, key=distance, reverse=True)
+        if order != self.order:
+            for name in order:
+                self.renderer.RemoveActor(self.actors[name])
+                self.renderer.AddActor(self.actors[name])
+            self.order = order
+
+    def on_key(self, caller, ev):
+        if caller.GetKeySym() == self.key:
+            print(self.report())
+            self.timing = not self.timing
+            print('Timing of the translucent pass {:s}'.format('on' if self.timing else 'off'))
+
+    def report(self):
+        if self.technique == 'peeling':
+            technique = 'peeling, at most {:d} peels (now {:d}), occlusion ratio {:.2f}'.format(
+                self.max_peels, self.peels, self.renderer.GetOcclusionRatio())
+            if self.budget:
+                technique += ', budget {:.1f} ms'.format(self.budget)
+        else:
+            technique = 'sort'
+        times = list(self.times)
+        mean = sum(times) / len(times) if times else 0.0
+        p95 = percentiles(times, [95])[0]
+        draws = sum(self.passes) / len(self.passes) if self.passes else 0.0
+        res = ['Translucency: {:s}'.format(technique),
+               '{:>12s} {:s}'.format('Opaque:', ', '.join(self.opaque) or '-'),
+               '{:>12s} {:s}'.format('Translucent:', ', '.join(self.translucent) or '-'),
+               '{:>12s} {:s}'.format('Hidden:', ', '.join(sorted(self.hidden)) or '-'),
+               'Frames: {:d}, {:d} without a translucent pass'.format(self.frames, self.skipped),
+               'Translucent pass: mean {:.2f} ms, p95 {:.2f} ms, {:.1f} draws per tissue and frame'.format(mean, p95, draws)]
+        if not times:
+            res[-1] = 'Translucent pass: not timed, press {:s} to time it'.format(self.key)
+        return '\n'.join(res)
+
+def main(source, tissues, translucent, opacity, root, frames, size):
+    actors = create_tissue_actors(source, tissues, root)
+    for name in translucent:
+        actors[name].GetProperty().SetOpacity(opacity)
+
+    print('{:>24s} {:>10s} {:>10s} {:>10s} {:>8s}'.format('Technique', 'Frame ms', 'Pass ms', 'Pass p95', 'Draws'))
+    frame_time, _ = render_frames(source, actors, frames, size, None)
+    print('{:>24s} {:>10.2f}'.format('unmanaged peeling', frame_time))
+    runs = [('peeling, {:d} peels'.format(peels), dict(technique='peeling', max_peels=peels, budget=None))
+            for peels in (1, 2, 4, 8)]
+    runs += [('peeling, 10 ms budget', dict(technique='peeling', max_peels=8, budget=10.0)),
+             ('sort', dict(technique='sort'))]
+    for label, settings in runs:
+        frame_time, manager = render_frames(source, actors, frames, size, settings)
+        times = list(manager.times)
+        print('{:>24s} {:>10.2f} {:>10.2f} {:>10.2f} {:>8.1f}'.format(
+            label, frame_time, sum(times) / len(times) if times else 0.0, percentiles(times, [95])[0],
+            sum(manager.passes) / len(manager.passes) if manager.passes else 0.0))
+
+# Mean frame time (ms) of a full turn around the scene, with a manager set up
+# with the settings, or with depth peeling at the VTK defaults for all actors.
+def render_frames(source, actors, frames, size, settings):
+    renderer = vtk.vtkRenderer()
+    render_window = vtk.vtkRenderWindow()
+    render_window.SetOffScreenRendering(1)
+    render_window.AddRenderer(renderer)
+    render_window.SetSize(*size)
+    for actor in actors.values():
+        actor.VisibilityOn()
+        renderer.AddActor(actor)
+    reset_camera(source, renderer)
+
+    manager = None
+    if settings is None:
+        renderer.SetUseDepthPeeling(True)
+    else:
+        manager = TranslucencyManager(render_window, renderer, actors, timing=True, **settings)
+    render_window.Render()
+    # The first frame uploads the geometry.
+    if manager:
+        manager.times.clear()
+        manager.passes.clear()
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        renderer.GetActiveCamera().Azimuth(360.0 / frames)
+        render_window.Render()
+    render_window.WaitForCompletion()
+    frame_time = 1000 * (time.perf_counter() - start) / frames
+
+    if manager:
+        manager.detach()
+    for actor in actors.values():
+        renderer.RemoveActor(actor)
+    render_window.Finalize()
+    return frame_time, manager
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the translucency techniques on a tissue scene.')
+    parser.add_argument('tissues', nargs='*', help='Tissue names, all tissues of the source by default.')
+    parser.add_argument('--source', choices=sorted(SOURCES), default='slices',
+                        help='Build the actors like 3D_From_Slices.py (slices) or 3D_head.py (models).')
+    parser.add_argument('--translucent', nargs='*', default=[], help='Tissues to make translucent.')
+    parser.add_argument('--opacity', type=float, default=0.5, help='Opacity of the --translucent tissues.')
+    parser.add_argument('--root', default=dataset_root(), help='Root folder of the atlas.')
+    parser.add_argument('--frames', type=int, default=60, help='Frames rendered per technique.')
+    parser.add_argument('--size', type=int, nargs=2, default=[1024, 720], help='Window size.')
+    add_thread_arguments(parser)
+    args = parser.parse_args()
+    apply_thread_settings(args.threads, args.smp_backend)
+
+    main(args.source, args.tissues or default_tissues(args.source), args.translucent, args.opacity,
+         args.root, args.frames, args.size)
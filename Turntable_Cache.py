@@ -0,0 +1,329 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from Atlas_Paths import dataset_root
+from Thread_Settings import add_thread_arguments, apply_thread_settings, process_pool
+from Tissue_Scene import (SOURCES, create_tissue_actors, default_tissues, deserialize_actors, orbit_camera,
+                          reset_camera, scene_parameters, scene_signatures, serialize_actors)
+
+# Precomputed turntable of the head scene for review playback.
+#
+#   python Turntable_Cache.py build Mandible Hyoid --output review.turntable
+#   python Turntable_Cache.py play review.turntable
+#
+# build renders the scene of 3D_From_Slices.py or 3D_head.py from every view of
+# an azimuth x elevation grid. The meshes are built once and handed to a pool
+# of offscreen renderers. The frames are stored zlib compressed in one file:
+#
+#   MAGIC | header length (uint32) | header (JSON) | (offset, length) per frame (uint64) | frames
+#
+# The header holds a key hashed from the tissue list, tissue_parameters() (or
+# the tissue map of 3D_head.py), the size and modification time of the atlas
+# files the scene is built from and the render settings. A file with the same
+# key is reused, anything else is rendered again.
+#
+# play maps the file and shows one frame at a time, no geometry is loaded.
+# Drag or use the arrow keys to turn the head, space starts and stops the
+# turntable.
+
+MAGIC = b'MDVTURN1'
+
+# Scene and frame layout of every worker process, set by init_worker().
+_render_window = None
+_renderer = None
+_initial_camera = None
+_grabber = None
+_azimuths = None
+_elevations = None
+_compression = None
+
+def cache_key(source, tissues, root, size, azimuths, elevations, flying_edges, decimate):
+    settings = {
+        'source': source,
+        'tissues': list(tissues),
+        'parameters': {name: scene_parameters(source).get(name) for name in tissues},
+        'signatures': scene_signatures(source, tissues, root),
+        'size': list(size),
+        'azimuths': list(azimuths),
+        'elevations': list(elevations),
+        'flying_edges': flying_edges,
+        'decimate': decimate,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+def read_header(file_name):
+    with open(file_name, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise Exception('{:s} is not a turntable cache'.format(file_name))
+        length, = struct.unpack('<I', f.read(4))
+        return json.loads(f.read(length).decode())
+
+def build(source, tissues, root, output, size, azimuth_step, elevations, flying_edges, decimate,
+          workers, compression, force):
+    azimuths = np.arange(0, 360, azimuth_step).tolist()
+    key = cache_key(source, tissues, root, size, azimuths, elevations, flying_edges, decimate)
+    if not force and os.path.exists(output):
+        try:
+            if read_header(output)['key'] == key:
+                print('{:s} is up to date'.format(output))
+                return
+        except Exception as e:
+            print(e)
+        print('{:s} is out of date, rendering it again'.format(output))
+
+    start = time.perf_counter()
+    actors = create_tissue_actors(source, tissues, root, flying_edges, decimate)
+    scene = serialize_actors(actors)
+    print('Built {:d} tissues in {:.2f} s'.format(len(actors), time.perf_counter() - start))
+
+    header = {
+        'key': key,
+        'source': source,
+        'tissues': list(tissues),
+        'root': os.path.abspath(root),
+        'size': list(size),
+        'azimuths': azimuths,
+        'elevations': list(elevations),
+        'flying_edges': flying_edges,
+        'decimate': decimate,
+    }
+    header_data = json.dumps(header).encode()
+    n = len(azimuths) * len(elevations)
+    table = np.zeros((n, 2), dtype='<u8')
+
+    # Frames are appended as they arrive, the table is filled in at the end.
+    start = time.perf_counter()
+    jobs = [list(range(i, min(i + len(azimuths), n))) for i in range(0, n, len(azimuths))]
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    temp_file = output + '.tmp'
+    with open(temp_file, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header_data)) + header_data)
+        table_offset = f.tell()
+        f.write(table.tobytes())
+        data_offset = f.tell()
+
+        with process_pool(workers, init_worker, (source, scene, size, azimuths, elevations, compression)) as executor:
+            for frames in executor.map(render_frames, jobs):
+                for index, data in frames:
+                    table[index] = (f.tell() - data_offset, len(data))
+                    f.write(data)
+
+        size_on_disk = f.tell()
+        f.seek(table_offset)
+        f.write(table.tobytes())
+    os.replace(temp_file, output)
+
+    elapsed = time.perf_counter() - start
+    raw = n * size[0] * size[1] * 3
+    print('Rendered {:d} frames to {:s} in {:.2f} s, {:.1f} frames/s, {:.1f} MiB ({:.1f}x smaller than raw)'.format(
+        n, output, elapsed, n / elapsed if elapsed else 0, size_on_disk / 2 ** 20, raw / size_on_disk))
+
+def init_worker(source, scene, size, azimuths, elevations, compression):
+    global _render_window, _renderer, _initial_camera, _grabber, _azimuths, _elevations, _compression
+    apply_thread_settings()
+    _render_window = vtk.vtkRenderWindow()
+    _render_window.SetOffScreenRendering(1)
+    _render_window.SetSize(*size)
+    _renderer = vtk.vtkRenderer()
+    _render_window.AddRenderer(_renderer)
+
+    colors = vtk.vtkNamedColors()
+    colors.SetColor("BkgColor", [201, 214, 255, 255])
+    _renderer.SetBackground(colors.GetColor3d('BkgColor'))
+
+    for actor in deserialize_actors(scene).values():
+        _renderer.AddActor(actor)
+    reset_camera(source, _renderer)
+    _initial_camera = vtk.vtkCamera()
+    _initial_camera.DeepCopy(_renderer.GetActiveCamera())
+
+    _grabber = vtk.vtkWindowToImageFilter()
+    _grabber.SetInput(_render_window)
+    _grabber.ReadFrontBufferOff()
+    _azimuths = azimuths
+    _elevations = elevations
+    _compression = compression
+
+def render_frames(indices):
+    frames = []
+    for index in indices:
+        elevation, azimuth = divmod(index, len(_azimuths))
+        orbit_camera(_renderer, _initial_camera, _azimuths[azimuth], _elevations[elevation])
+        _render_window.Render()
+        _grabber.Modified()
+        _grabber.Update()
+        rgb = vtk_to_numpy(_grabber.GetOutput().GetPointData().GetScalars())
+        frames.append((index, zlib.compress(rgb.tobytes(), _compression)))
+    return frames
+
+class TurntablePlayer:
+    def __init__(self, file_name, fps=30.0):
+        self.header = read_header(file_name)
+        self.width, self.height = self.header['size']
+        self.azimuths = self.header['azimuths']
+        self.elevations = self.header['elevations']
+        self.fps = fps
+
+        n = len(self.azimuths) * len(self.elevations)
+        self.file = open(file_name, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        table_offset = len(MAGIC) + 4 + struct.unpack('<I', self.data[len(MAGIC):len(MAGIC) + 4])[0]
+        self.table = np.frombuffer(self.data, dtype='<u8', count=2 * n, offset=table_offset).reshape(n, 2)
+        self.data_offset = table_offset + self.table.nbytes
+
+        self.azimuth = 0
+        self.elevation = int(np.argmin(np.abs(self.elevations)))
+        self.playing = False
+        self.timer = None
+        self.drag = None
+        self.decode_times = []
+
+        self.image = vtk.vtkImageData()
+        self.image.SetDimensions(self.width, self.height, 1)
+        self.actor = vtk.vtkImageActor()
+        self.actor.GetMapper().SetInputData(self.image)
+
+    def show(self, azimuth, elevation):
+        self.azimuth = azimuth % len(self.azimuths)
+        self.elevation = max(0, min(elevation, len(self.elevations) - 1))
+        offset, length = self.table[self.elevation * len(self.azimuths) + self.azimuth]
+
+        start = time.perf_counter()
+        start_byte = self.data_offset + int(offset)
+        rgb = np.frombuffer(zlib.decompress(self.data[start_byte:start_byte + int(length)]), dtype=np.uint8)
+        self.image.GetPointData().SetScalars(numpy_to_vtk(rgb.reshape(-1, 3), deep=1))
+        self.image.Modified()
+        self.decode_times.append(time.perf_counter() - start)
+
+    def main(self):
+        renderer = vtk.vtkRenderer()
+        renderer.AddActor(self.actor)
+        render_window = vtk.vtkRenderWindow()
+        render_window.AddRenderer(renderer)
+        render_window.SetSize(self.width, self.height)
+        render_window.SetWindowName('Turntable')
+        self.render_window = render_window
+
+        interactor = vtk.vtkRenderWindowInteractor()
+        interactor.SetRenderWindow(render_window)
+        interactor.SetInteractorStyle(vtk.vtkInteractorStyleUser())
+        interactor.AddObserver('KeyPressEvent', self.on_key)
+        interactor.AddObserver('LeftButtonPressEvent', self.on_press)
+        interactor.AddObserver('LeftButtonReleaseEvent', self.on_release)
+        interactor.AddObserver('MouseMoveEvent', self.on_move)
+        interactor.AddObserver('TimerEvent', self.on_timer)
+        self.interactor = interactor
+
+        # Show the frames pixel for pixel.
+        self.show(self.azimuth, self.elevation)
+        camera = renderer.GetActiveCamera()
+        camera.ParallelProjectionOn()
+        renderer.ResetCamera()
+        camera.SetParallelScale(0.5 * (self.height - 1))
+
+        print('Arrow keys or drag to turn, space to play, q to quit')
+        interactor.Initialize()
+        render_window.Render()
+        interactor.Start()
+
+        if self.decode_times:
+            print('Decoded {:d} frames, {:.2f} ms per frame'.format(
+                len(self.decode_times), 1000 * np.mean(self.decode_times)))
+
+    def step(self, azimuth, elevation):
+        self.show(self.azimuth + azimuth, self.elevation + elevation)
+        self.render_window.Render()
+
+    def on_key(self, caller, ev):
+        key = caller.GetKeySym()
+        if key == 'Left':
+            self.step(-1, 0)
+        elif key == 'Right':
+            self.step(1, 0)
+        elif key == 'Up':
+            self.step(0, 1)
+        elif key == 'Down':
+            self.step(0, -1)
+        elif key == 'space':
+            self.playing = not self.playing
+            if self.playing:
+                self.timer = caller.CreateRepeatingTimer(int(1000 / self.fps))
+            else:
+                caller.DestroyTimer(self.timer)
+        elif key in ('q', 'e', 'Escape'):
+            caller.TerminateApp()
+
+    def on_timer(self, caller, ev):
+        if self.playing:
+            self.step(1, 0)
+
+    def on_press(self, caller, ev):
+        self.drag = caller.GetEventPosition()
+
+    def on_release(self, caller, ev):
+        self.drag = None
+
+    # One frame per 5 pixels of mouse movement.
+    def on_move(self, caller, ev):
+        if self.drag is None:
+            return
+        x, y = caller.GetEventPosition()
+        azimuth = (self.drag[0] - x) // 5
+        elevation = (self.drag[1] - y) // 5
+        if azimuth or elevation:
+            self.drag = (self.drag[0] - 5 * azimuth, self.drag[1] - 5 * elevation)
+            self.step(azimuth, elevation)
+
+def play(file_name, fps):
+    header = read_header(file_name)
+    try:
+        key = cache_key(header['source'], header['tissues'], header['root'], header['size'], header['azimuths'],
+                        header['elevations'], header['flying_edges'], header['decimate'])
+        if key != header['key']:
+            print('The tissues changed since {:s} was rendered, build it again'.format(file_name))
+    except (KeyError, OSError):
+        print('The atlas {:s} was rendered from is not available, it is played unchecked'.format(file_name))
+    TurntablePlayer(file_name, fps).main()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render the head scene as a turntable and play it back.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='Render the turntable frames.')
+    build_parser.add_argument('tissues', nargs='*', help='Tissue names, all tissues of the source by default.')
+    build_parser.add_argument('--source', choices=sorted(SOURCES), default='slices',
+                              help='Build the scene like 3D_From_Slices.py (slices) or 3D_head.py (models).')
+    build_parser.add_argument('--root', default=dataset_root(), help='Root folder of the atlas.')
+    build_parser.add_argument('--output', default='./head.turntable')
+    build_parser.add_argument('--size', type=int, nargs=2, default=[800, 600])
+    build_parser.add_argument('--azimuth-step', type=float, default=5.0, help='Degrees between frames.')
+    build_parser.add_argument('--elevations', type=float, nargs='+', default=[-30, -15, 0, 15, 30])
+    build_parser.add_argument('--marching-cubes', action='store_true', help='Use marching cubes instead of flying edges.')
+    build_parser.add_argument('--decimate', action='store_true')
+    build_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    build_parser.add_argument('--compression', type=int, default=6, help='zlib level of the frames (0-9).')
+    build_parser.add_argument('--force', action='store_true', help='Render even if the file is up to date.')
+    add_thread_arguments(build_parser)
+
+    play_parser = commands.add_parser('play', help='Play a rendered turntable.')
+    play_parser.add_argument('file_name', nargs='?', default='./head.turntable')
+    play_parser.add_argument('--fps', type=float, default=30.0)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        apply_thread_settings(args.threads, args.smp_backend)
+        build(args.source, args.tissues or default_tissues(args.source), args.root, args.output, args.size,
+              args.azimuth_step, args.elevations, not args.marching_cubes, args.decimate, args.workers,
+              args.compression, args.force)
+    else:
+        play(args.file_name, args.fps)
@@ -0,0 +1,133 @@
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+# Helpers shared by the batch tools that work on the volume arrays directly
+# instead of through a VTK pipeline.
+
+# Reads a volume and returns its voxels as a (z, y, x) array together with the
+# spacing and origin in (x, y, z) order.
+def read_volume(file_name):
+    reader = vtk.vtkNrrdReader()
+    reader.SetFileName(str(file_name))
+    reader.Update()
+    image = reader.GetOutput()
+
+    nx, ny, nz = image.GetDimensions()
+    array = vtk_to_numpy(image.GetPointData().GetScalars()).reshape(nz, ny, nx)
+    return array, image.GetSpacing(), image.GetOrigin()
+
+# Reads a label volume like read_volume(), with the labels in the smallest
+# integer type that holds them.
+def read_labels(file_name):
+    labels, spacing, origin = read_volume(file_name)
+    return compact_labels(labels), spacing, origin
+
+# Integer types from the smallest to the largest.
+INTEGER_TYPES = ['uint8', 'int8', 'uint16', 'int16', 'uint32', 'int32', 'int64']
+
+# The smallest integer type that holds every value from lo to hi.
+def compact_dtype(lo, hi):
+    for name in INTEGER_TYPES:
+        info = np.iinfo(name)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(name)
+    return np.dtype('int64')
+
+# Labels in the smallest integer type that holds them. Returns the array as
+# it is if its type is not wider than that, or if it holds fractional values.
+def compact_labels(labels):
+    if not labels.size:
+        return labels
+    lo, hi = labels.min(), labels.max()
+    if not np.issubdtype(labels.dtype, np.integer) and not np.array_equal(labels, np.round(labels)):
+        return labels
+    dtype = compact_dtype(lo, hi)
+    if dtype.itemsize >= labels.dtype.itemsize:
+        return labels
+    return labels.astype(dtype)
+
+# Reads only the header of a volume and returns its VTK extent, spacing and origin.
+def read_geometry(file_name):
+    reader = vtk.vtkNrrdReader()
+    reader.SetFileName(str(file_name))
+    reader.UpdateInformation()
+    info = reader.GetOutputInformation(0)
+    extent = info.Get(vtk.vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT())
+    return tuple(extent), reader.GetDataSpacing(), reader.GetDataOrigin()
+
+# Writes a (z, y, x) array as a raw NRRD that vtkNrrdReader reads back with
+# the same spacing and origin.
+NRRD_TYPES = {'int8': 'signed char', 'uint8': 'uchar', 'int16': 'short', 'uint16': 'ushort',
+              'int32': 'int', 'uint32': 'uint', 'float32': 'float', 'float64': 'double'}
+
+def write_nrrd(file_name, array, spacing, origin):
+    with open(str(file_name), 'wb') as f:
+        f.write(nrrd_header(array.shape, array.dtype, spacing, origin))
+        f.write(np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<')).tobytes())
+
+# Header of a raw NRRD holding a (z, y, x) array, the voxels follow it directly.
+def nrrd_header(shape, dtype, spacing, origin):
+    nz, ny, nx = shape
+    header = [
+        'NRRD0004',
+        'type: {:s}'.format(NRRD_TYPES[np.dtype(dtype).name]),
+        'dimension: 3',
+        'space: left-posterior-superior',
+        'sizes: {:d} {:d} {:d}'.format(nx, ny, nz),
+        'space directions: ({0:.17g},0,0) (0,{1:.17g},0) (0,0,{2:.17g})'.format(*spacing),
+        'kinds: domain domain domain',
+        'endian: little',
+        'encoding: raw',
+        'space origin: ({:.17g},{:.17g},{:.17g})'.format(*origin),
+    ]
+    return ('\n'.join(header) + '\n\n').encode()
+
+# Fields of a NRRD header that say how the voxels are stored. write_nrrd_like()
+# sets them itself instead of carrying them over.
+STORAGE_FIELDS = ('type', 'endian', 'encoding', 'data file', 'datafile', 'byte skip', 'byteskip',
+                  'line skip', 'lineskip')
+
+# Lines of a NRRD header, from the magic line to the blank line that ends it.
+def read_nrrd_header(file_name):
+    lines = []
+    with open(str(file_name), 'rb') as f:
+        for line in f:
+            line = line.decode('latin-1').rstrip('\r\n')
+            if not line:
+                break
+            lines.append(line)
+    return lines
+
+# Writes a (z, y, x) array as a raw NRRD with the header of another NRRD of the
+# same size: the space, directions, origin, kinds, comments and key/value pairs
+# are carried over, only the type and the storage of the voxels change.
+def write_nrrd_like(file_name, array, template):
+    header = []
+    for line in read_nrrd_header(template):
+        field = line.split(':', 1)[0].strip().lower()
+        if line.startswith('#') or ':=' in line or field not in STORAGE_FIELDS:
+            header.append(line)
+        elif field == 'type':
+            header += ['type: {:s}'.format(NRRD_TYPES[array.dtype.name]), 'endian: little', 'encoding: raw']
+    with open(str(file_name), 'wb') as f:
+        f.write(('\n'.join(header) + '\n\n').encode('latin-1'))
+        f.write(np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<')).tobytes())
+
+# Returns the colour table of a VTK lookup table as an (n, 4) uint8 array
+# together with the scalar range it covers.
+def lut_to_numpy(lut):
+    table = vtk_to_numpy(lut.GetTable()).copy()
+    lo, hi = lut.GetTableRange()
+    return table, lo, hi
+
+# Maps scalars through a table from lut_to_numpy() the way vtkLookupTable does:
+# the range is split into equal bins and values outside are clamped.
+def map_scalars(values, table, lo, hi):
+    n = len(table)
+    if hi > lo:
+        idx = ((values.astype(np.float32) - lo) * (n / (hi - lo))).astype(np.int64)
+    else:
+        idx = np.zeros(values.shape, dtype=np.int64)
+    np.clip(idx, 0, n - 1, out=idx)
+    return table[idx]
@@ -0,0 +1,188 @@
+import argparse
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import vtk
+
+from Atlas_Paths import dataset_root, grey_file, label_file
+from Volume_IO import read_labels, read_volume, write_nrrd
+
+# Multi-resolution pyramid of the atlas volumes.
+#
+# Level n halves the resolution of level n - 1 along every axis and is stored
+# next to the volume as <name>.level<n>.nrrd. Grayscale levels average every
+# 2x2x2 block, label levels take its most common label, so no new label values
+# appear. The spacing doubles per level and the origin moves to the centre of
+# the first block, so every level covers the same physical space.
+#
+# ProgressiveLoader lets the slice viewers show the coarsest level right away
+# and swap in the finer levels as they are read in the background.
+
+LEVELS = 2
+
+# Output slices processed at once, to bound the temporary arrays.
+SLAB = 16
+
+def level_file_name(file_name, level):
+    root, _ = os.path.splitext(str(file_name))
+    return '{:s}.level{:d}.nrrd'.format(root, level)
+
+# Levels that exist and are newer than the volume, coarsest first.
+def pyramid_levels(file_name):
+    mtime = os.stat(str(file_name)).st_mtime_ns
+    levels = []
+    level = 1
+    while os.path.exists(level_file_name(file_name, level)) and \
+            os.stat(level_file_name(file_name, level)).st_mtime_ns >= mtime:
+        levels.append(level)
+        level += 1
+    return levels[::-1]
+
+# Halves the resolution of a (z, y, x) array. Odd sizes repeat the last slice.
+def downsample(array, labels):
+    pad = [(0, n % 2) for n in array.shape]
+    if any(p for _, p in pad):
+        array = np.pad(array, pad, mode='edge')
+    nz, ny, nx = (n // 2 for n in array.shape)
+
+    out = np.empty((nz, ny, nx), dtype=array.dtype)
+    for z in range(0, nz, SLAB):
+        slab = array[2 * z:2 * min(z + SLAB, nz)]
+        blocks = slab.reshape(-1, 2, ny, 2, nx, 2).transpose(0, 2, 4, 1, 3, 5).reshape(-1, ny, nx, 8)
+        if labels:
+            # How often each of the 8 values occurs in its block, the first most common one wins.
+            counts = np.empty(blocks.shape, dtype=np.uint8)
+            for k in range(8):
+                counts[..., k] = (blocks == blocks[..., k:k + 1]).sum(axis=-1)
+            out[z:z + len(blocks)] = np.take_along_axis(blocks, counts.argmax(axis=-1)[..., None], axis=-1)[..., 0]
+        else:
+            mean = blocks.mean(axis=-1, dtype=np.float64)
+            if np.issubdtype(array.dtype, np.integer):
+                mean = np.rint(mean)
+            out[z:z + len(blocks)] = mean
+    return out
+
+def build_pyramid(file_name, levels, labels):
+    # The levels of a label volume are stored in the smallest type that holds its labels.
+    array, spacing, origin = (read_labels if labels else read_volume)(file_name)
+    file_names = []
+    for level in range(1, levels + 1):
+        array = downsample(array, labels)
+        # The new voxels sit at the centres of the 2x2x2 blocks.
+        origin = [o + 0.5 * s for o, s in zip(origin, spacing)]
+        spacing = [2 * s for s in spacing]
+        write_nrrd(level_file_name(file_name, level), array, spacing, origin)
+        file_names.append(level_file_name(file_name, level))
+    return file_names
+
+def read_image(file_name):
+    reader = vtk.vtkNrrdReader()
+    reader.SetFileName(str(file_name))
+    reader.Update()
+    return reader.GetOutput()
+
+# Serves one or more volumes of the same size through vtkTrivialProducers,
+# starting with the coarsest pyramid level all of them have. The finer levels
+# are read by a background thread and swapped in from an interactor timer, so
+# every volume always shows the same level.
+#
+# prepare(images) is called in the background thread for every finer level,
+# its result is handed to on_level(factor, result) together with the level.
+class ProgressiveLoader:
+    def __init__(self, file_names, use_pyramid=True, prepare=None):
+        self.file_names = [str(f) for f in file_names]
+        self.prepare = prepare
+        levels = [0]
+        if use_pyramid:
+            common = set.intersection(*[set(pyramid_levels(f)) for f in self.file_names])
+            levels = sorted(common, reverse=True) + levels
+        self.levels = levels
+
+        start = time.perf_counter()
+        self.producers = []
+        for f in self.file_names:
+            producer = vtk.vtkTrivialProducer()
+            producer.SetOutput(read_image(self.file(f, levels[0])))
+            self.producers.append(producer)
+        self.factor = 2 ** levels[0]
+        print('Loaded level {:d} in {:.2f} s'.format(levels[0], time.perf_counter() - start))
+
+        self.results = queue.Queue()
+        self.timer = None
+        self.thread = threading.Thread(target=self.load, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def file(file_name, level):
+        return level_file_name(file_name, level) if level else file_name
+
+    def output_port(self, i=0):
+        return self.producers[i].GetOutputPort()
+
+    def image(self, i=0):
+        return self.producers[i].GetOutputDataObject(0)
+
+    def load(self):
+        for level in self.levels[1:]:
+            start = time.perf_counter()
+            images = [read_image(self.file(f, level)) for f in self.file_names]
+            result = self.prepare(images) if self.prepare else None
+            self.results.put((level, images, result, time.perf_counter() - start))
+
+    def attach(self, interactor, render_window, on_level=None, interval=100):
+        self.render_window = render_window
+        self.on_level = on_level
+        if len(self.levels) > 1:
+            interactor.AddObserver('TimerEvent', self.on_timer)
+            self.timer = interactor.CreateRepeatingTimer(interval)
+
+    def on_timer(self, caller, ev):
+        if self.timer is None:
+            return
+        try:
+            level, images, result, elapsed = self.results.get_nowait()
+        except queue.Empty:
+            return
+
+        for producer, image in zip(self.producers, images):
+            producer.SetOutput(image)
+        self.factor = 2 ** level
+        print('Loaded level {:d} in {:.2f} s'.format(level, elapsed))
+        if self.on_level:
+            self.on_level(self.factor, result)
+        self.render_window.Render()
+
+        if level == 0:
+            caller.DestroyTimer(self.timer)
+            self.timer = None
+
+# Scales a VTK extent of the full resolution volume to a pyramid level,
+# clamped to the extent of the level.
+def level_extent(extent, factor, whole_extent):
+    return tuple(min(max(v // factor, whole_extent[2 * (i // 2)]), whole_extent[2 * (i // 2) + 1])
+                 for i, v in enumerate(extent))
+
+def main(root, levels):
+    volumes = [
+        (grey_file(root), False),
+        (label_file(root), True),
+    ]
+    for file_name, labels in volumes:
+        start = time.perf_counter()
+        file_names = build_pyramid(file_name, levels, labels)
+        print('{:s}: {:d} levels in {:.2f} s'.format(file_name, levels, time.perf_counter() - start))
+        for level, f in enumerate([file_name] + file_names):
+            image = read_image(f)
+            print('  level {:d}: {} voxels, {:.1f} MiB'.format(
+                level, image.GetDimensions(), os.path.getsize(f) / 2 ** 20))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the multi-resolution pyramid of the atlas volumes.')
+    parser.add_argument('--root', default=dataset_root(), help='Root folder of the atlas.')
+    parser.add_argument('--levels', type=int, default=LEVELS, help='Number of downsampled levels.')
+    args = parser.parse_args()
+
+    main(args.root, args.levels)
@@ -0,0 +1,41 @@
+import importlib
+
+import numpy as np
+import pytest
+from vtk.util.numpy_support import vtk_to_numpy
+
+from Volume_IO import write_nrrd
+
+from_slices = importlib.import_module('3D_From_Slices')
+
+# A label volume with a ball of label 9 off the centre, at odd voxels, and a
+# box of label 3 so that the volume is not cropped to the ball only.
+def write_labels(file_name):
+    z, y, x = np.mgrid[0:41, 0:45, 0:47]
+    labels = np.zeros(z.shape, dtype=np.uint8)
+    labels[(x - 27.3) ** 2 + (y - 15.6) ** 2 + (z - 21.6) ** 2 < 6.5 ** 2] = 9
+    labels[3:9, 30:40, 4:12] = 3
+    write_nrrd(file_name, labels, (0.9, 0.9, 1.1), (0.0, 0.0, 0.0))
+
+def iso_surface_points(file_name, tissue):
+    iso_surface = from_slices.create_iso_surface(file_name, file_name, tissue, True)
+    iso_surface.Update()
+    points = vtk_to_numpy(iso_surface.GetOutput().GetPoints().GetData()).copy()
+    return points[np.lexsort(points.T)]
+
+# The low iso-value and the wide kernel put the surface near the end of the
+# cropped volume, where a crop that is not aligned to the shrink factors
+# changes the smoothed volume.
+@pytest.mark.parametrize('sample_rate', [[2, 2, 2], [3, 2, 1]])
+def test_cropped_iso_surface(tmp_path, monkeypatch, sample_rate):
+    file_name = str(tmp_path / 'labels.nrrd')
+    write_labels(file_name)
+    tissue = dict(from_slices.default_parameters(), NAME='Ball', TISSUE=9, SAMPLE_RATE=sample_rate,
+                  VALUE=20, GAUSSIAN_STANDARD_DEVIATION=[2, 2, 2])
+
+    cropped = iso_surface_points(file_name, tissue)
+    monkeypatch.setattr(from_slices, 'crop_extent', lambda index, tissue, whole_extent: None)
+    whole = iso_surface_points(file_name, tissue)
+
+    assert len(cropped) == len(whole)
+    assert np.abs(cropped - whole).max() < 1e-4
@@ -0,0 +1,94 @@
+import importlib
+
+import numpy as np
+import pytest
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+pytest.importorskip('scipy')
+import Sparse_Smoothing
+from Sparse_Smoothing import SparseSmoothingFilter, polygon_arrays, sinc_coefficients, smooth_points, smoothing_operator
+
+# A sphere with a fin glued into it along a line of its vertices, so that the
+# edges of the line are used by three triangles, and the fin has a boundary.
+def sphere_with_fin():
+    sphere = vtk.vtkSphereSource()
+    sphere.SetRadius(10.0)
+    sphere.SetThetaResolution(40)
+    sphere.SetPhiResolution(40)
+    sphere.Update()
+    mesh = vtk.vtkPolyData()
+    mesh.DeepCopy(sphere.GetOutput())
+
+    points = vtk_to_numpy(mesh.GetPoints().GetData()).copy()
+    line = [i for i in np.argsort(points[:, 2]) if abs(points[i, 1]) < 1e-6 and points[i, 0] > 0]
+    polys = mesh.GetPolys()
+    outer = []
+    for i in line:
+        outer.append(mesh.GetPoints().InsertNextPoint(points[i] * 1.3))
+    for k in range(len(line) - 1):
+        polys.InsertNextCell(3, [line[k], line[k + 1], outer[k + 1]])
+        polys.InsertNextCell(3, [line[k], outer[k + 1], outer[k]])
+    mesh.SetPolys(polys)
+    return mesh
+
+@pytest.mark.parametrize('iterations, pass_band', [(10, 0.001), (20, 0.001), (20, 0.1)])
+def test_sparse_matches_sinc(iterations, pass_band):
+    from_slices = importlib.import_module('3D_From_Slices')
+    mesh = sphere_with_fin()
+    tissue = dict(from_slices.default_parameters(), SMOOTH_ITERATIONS=iterations, SMOOTH_FACTOR=pass_band)
+
+    results = []
+    for engine in ('sinc', 'sparse'):
+        smoother = from_slices.create_smoother(dict(tissue, SMOOTH_ENGINE=engine))
+        smoother.SetInputDataObject(mesh)
+        smoother.Update()
+        results.append(vtk_to_numpy(smoother.GetOutputDataObject(0).GetPoints().GetData()).copy())
+
+    moved = np.linalg.norm(results[0] - vtk_to_numpy(mesh.GetPoints().GetData()), axis=1)
+    assert moved.max() > 0.01
+    assert np.abs(results[0] - results[1]).max() < 1e-4
+
+# A closed sphere with noise on its points.
+def noisy_sphere():
+    sphere = vtk.vtkSphereSource()
+    sphere.SetRadius(10.0)
+    sphere.SetThetaResolution(30)
+    sphere.SetPhiResolution(30)
+    sphere.Update()
+    mesh = vtk.vtkPolyData()
+    mesh.DeepCopy(sphere.GetOutput())
+    points = vtk_to_numpy(mesh.GetPoints().GetData())
+    points += np.random.default_rng(0).normal(0, 0.3, points.shape).astype(points.dtype)
+    mesh.GetPoints().Modified()
+    return mesh
+
+# The cut-off measured from the VTK filter reproduces the filter on another mesh.
+@pytest.mark.parametrize('iterations, pass_band', [(5, 0.1), (10, 0.01), (15, 0.001), (30, 0.05), (50, 0.001)])
+def test_sinc_coefficients(iterations, pass_band):
+    c = sinc_coefficients(iterations, pass_band)
+    assert len(c) == iterations + 1
+    assert abs(sum(c) - 1.0) < 1e-3
+
+    mesh = noisy_sphere()
+    smoother = vtk.vtkWindowedSincPolyDataFilter()
+    smoother.SetInputData(mesh)
+    smoother.SetNumberOfIterations(iterations)
+    smoother.SetPassBand(pass_band)
+    smoother.BoundarySmoothingOff()
+    smoother.NonManifoldSmoothingOn()
+    smoother.NormalizeCoordinatesOff()
+    smoother.Update()
+    expected = vtk_to_numpy(smoother.GetOutput().GetPoints().GetData())
+
+    points = vtk_to_numpy(mesh.GetPoints().GetData())
+    operator = smoothing_operator(points, *polygon_arrays(mesh.GetPolys()))
+    assert np.abs(smooth_points(points, operator, iterations, pass_band) - expected).max() < 1e-4
+
+# A filter no windowed sinc matches, like one of a VTK release that changed the
+# filter, is reported instead of smoothed with a wrong cut-off.
+def test_sinc_coefficients_unmatched(monkeypatch):
+    response, basis = Sparse_Smoothing.probe_response(10, 0.01)
+    monkeypatch.setattr(Sparse_Smoothing, 'probe_response', lambda iterations, pass_band: (response * 0.5, basis))
+    with pytest.raises(Exception, match='could not be matched'):
+        sinc_coefficients.__wrapped__(10, 0.01)
@@ -0,0 +1,23 @@
+import vtk
+
+from Thread_Settings import apply_thread_settings, process_pool
+
+# Runs an SMP filter (vtkWindowedSincPolyDataFilter) and returns the number of
+# points it smoothed.
+def smooth_sphere(resolution=200):
+    sphere = vtk.vtkSphereSource()
+    sphere.SetThetaResolution(resolution)
+    sphere.SetPhiResolution(resolution)
+    smoother = vtk.vtkWindowedSincPolyDataFilter()
+    smoother.SetInputConnection(sphere.GetOutputPort())
+    smoother.Update()
+    return smoother.GetOutput().GetNumberOfPoints()
+
+# A pool started after the parent has run an SMP filter on the STDThread
+# backend used to hang in the first SMP filter of its workers.
+def test_pool_after_smp_filter():
+    apply_thread_settings(2, 'STDThread')
+    expected = smooth_sphere()
+    with process_pool(2) as executor:
+        futures = [executor.submit(smooth_sphere) for _ in range(2)]
+        assert [future.result(timeout=60) for future in futures] == [expected, expected]